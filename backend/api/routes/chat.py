@@ -1,11 +1,19 @@
+from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 
 router = APIRouter()
 
+MAX_TOP_K = 50            # chunks returned per query
+MAX_BATCH_QUERIES = 64    # one request may not monopolise the query batcher and encoder
+
 # Request model
 class QueryRequest(BaseModel):
     query: str
+    top_k: int = Field(4, gt=0, le=MAX_TOP_K)
+    # e.g. {"source": "data/raw/wheat.pdf"} or {"crop": "rice", "region": "terai"}
+    filter: Optional[Dict[str, Any]] = None
 
 # Response model
 class QueryResponse(BaseModel):
@@ -13,6 +21,16 @@ class QueryResponse(BaseModel):
     sources: list = []
     used_fallback: bool = False
 
+# Batch retrieval models
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., max_length=MAX_BATCH_QUERIES)
+    top_k: int = Field(4, gt=0, le=MAX_TOP_K)
+    filter: Optional[Dict[str, Any]] = None
+
+class BatchQueryResponse(BaseModel):
+    results: list = []
+    total_queries: int = 0
+
 
 @router.post("/query", response_model=QueryResponse)
 async def query_documents_endpoint(
@@ -25,7 +43,10 @@ async def query_documents_endpoint(
         rag_pipeline = request.app.state.rag_pipeline
         
         # Use the new RAG pipeline to get answer
-        result = rag_pipeline.answer(query_request.query)
+        # Run in the threadpool: searches read a pinned snapshot and never wait on indexing
+        result = await run_in_threadpool(
+            rag_pipeline.answer, query_request.query, top_k=query_request.top_k, filter=query_request.filter
+        )
         
         return {
             "response": result["answer"],
@@ -35,3 +56,47 @@ async def query_documents_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def batch_query_endpoint(
+    batch_request: BatchQueryRequest,
+    request: Request
+):
+    """Retrieve the top matching chunks for many queries in one embedding + search pass."""
+    if not batch_request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    try:
+        rag_pipeline = request.app.state.rag_pipeline
+        
+        all_results = await run_in_threadpool(
+            rag_pipeline.retrieve_many,
+            batch_request.queries,
+            top_k=batch_request.top_k,
+            filter=batch_request.filter
+        )
+        
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "documents": [
+                        {
+                            "text": doc["metadata"]["text"],
+                            "source": doc["metadata"]["source"],
+                            "document_id": doc["metadata"].get("document_id"),
+                            "chunk_id": doc["metadata"].get("chunk_id"),
+                            "tags": doc["metadata"].get("tags", {}),
+                            "distance": doc["distance"]
+                        }
+                        for doc in results
+                    ]
+                }
+                for query, results in zip(batch_request.queries, all_results)
+            ],
+            "total_queries": len(batch_request.queries)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
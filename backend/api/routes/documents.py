@@ -1,12 +1,27 @@
 import os
+import json
+import hashlib
 import tempfile
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from typing import List
-from backend.src.data_loaders import load_all_documents
-from langchain_community.document_loaders import PyPDFLoader
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
+from backend.src.data_loaders import LOADERS, load_all_documents, load_file
 
 router = APIRouter()
 
+
+def parse_tags(tags: Optional[str]) -> Dict[str, Any]:
+    """Parse the optional JSON `tags` form field, e.g. '{"crop": "wheat", "region": "terai"}'."""
+    if not tags:
+        return {}
+    try:
+        parsed = json.loads(tags)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tags JSON: {e}")
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="Tags must be a JSON object")
+    return parsed
+
 @router.get("/documents")
 async def list_documents_endpoint(request: Request):
     """List all documents with their chunk information."""
@@ -26,6 +41,8 @@ async def list_documents_endpoint(request: Request):
             doc_info = vector_db.get_document_info(doc_id)
             if doc_info:
                 documents.append(doc_info)
+        # Chunks waiting for PCA training are searchable too, so list them
+        documents.extend(rag_pipeline.held_documents().values())
         
         return {
             "status": "success",
@@ -66,6 +83,110 @@ async def get_document_chunks_endpoint(request: Request, document_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.delete("/documents/{document_id}")
+async def delete_document_endpoint(request: Request, document_id: str):
+    """Delete a document and all of its chunks from the vector store."""
+    try:
+        if not hasattr(request.app.state, 'rag_pipeline'):
+            raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
+        
+        rag_pipeline = request.app.state.rag_pipeline
+        
+        # Off the event loop: the tombstone write and the segment save touch disk.
+        # The ingest manifest forgets the document too, but keeps its file, so
+        # a re-index or the folder watcher does not bring it back
+        deleted = await run_in_threadpool(rag_pipeline.delete_document, document_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        return {
+            "status": "success",
+            "document_id": document_id,
+            "chunks_deleted": deleted
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.put("/documents/{document_id}")
+async def replace_document_endpoint(
+    request: Request,
+    document_id: str,
+    file: UploadFile = File(...)
+):
+    """Replace a document's content with a new version of its file."""
+    try:
+        if not hasattr(request.app.state, 'rag_pipeline'):
+            raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
+        
+        rag_pipeline = request.app.state.rag_pipeline
+        doc_info = rag_pipeline.get_document_info(document_id)
+        if not doc_info:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        if extension not in LOADERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type {extension or file.filename!r}; supported: {', '.join(sorted(LOADERS))}"
+            )
+        
+        # The document id is derived from the source path, so the new version is
+        # loaded under the original source to keep its id
+        source = doc_info["source"]
+        raw_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'raw'))
+        on_disk = os.path.realpath(source).startswith(raw_dir + os.sep)
+        if on_disk and extension != os.path.splitext(source)[1].lower():
+            raise HTTPException(
+                status_code=400,
+                detail=f"{source} is replaced in place, so the new version must also be a {os.path.splitext(source)[1]} file"
+            )
+        
+        file_content = await file.read()
+        if not file_content:
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Parsed and indexed from a temporary copy; the file under data/raw
+            # is only replaced once that has succeeded
+            file_path = os.path.join(temp_dir, "upload" + extension)
+            with open(file_path, "wb") as buffer:
+                buffer.write(file_content)
+            # Hashed once, for both the parse cache and the ingest manifest
+            stat = os.stat(file_path)
+            signature = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": hashlib.sha256(file_content).hexdigest(),
+            }
+            
+            documents = await run_in_threadpool(load_file, file_path, rag_pipeline.parse_cache, signature)
+            for doc in documents:
+                doc.metadata["source"] = source
+            if not documents:
+                raise HTTPException(status_code=400, detail="No documents were loaded from the file")
+            
+            # Off the event loop, so queries keep being served while this indexes
+            chunks = await run_in_threadpool(rag_pipeline.index_documents, documents, replace_existing=True)
+            if on_disk:
+                await run_in_threadpool(rag_pipeline.install_file, file_path, source, chunks, signature["sha256"])
+        
+        return {
+            "status": "success",
+            "document_id": document_id,
+            "source": source,
+            "chunks_replaced": doc_info["total_chunks"],
+            "pages_loaded": len(documents),
+            "held_chunks": rag_pipeline.held_chunks
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/chunks/{chunk_id}")
 async def get_chunk_endpoint(request: Request, chunk_id: str):
     """Get a specific chunk by its ID."""
@@ -106,6 +227,9 @@ async def check_status_endpoint(request: Request):
         
         # Check vector database status
         vector_db_size = rag_pipeline.vector_db.size if rag_pipeline.vector_db else 0
+        vector_index = rag_pipeline.vector_db.index_info() if rag_pipeline.vector_db else {}
+        embedding_cache = getattr(rag_pipeline.embedder, "cache", None)
+        folder_watcher = getattr(request.app.state, "folder_watcher", None)
         
         # Check data directory
         raw_dir = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'raw')
@@ -123,6 +247,13 @@ async def check_status_endpoint(request: Request):
             "message": "Documents API is working",
             "rag_pipeline_available": True,
             "vector_database_size": vector_db_size,
+            "held_chunks": rag_pipeline.held_chunks,
+            "vector_index": vector_index,
+            "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+            "query_cache": rag_pipeline.query_cache.stats(),
+            "query_batcher": rag_pipeline.query_batcher.stats(),
+            "reduction": rag_pipeline.reducer.describe() if rag_pipeline.reducer is not None else None,
+            "folder_watcher": folder_watcher.stats() if folder_watcher is not None else None,
             "raw_directory": raw_dir,
             "raw_directory_exists": raw_dir_exists,
             "existing_pdfs": existing_pdfs,
@@ -139,9 +270,11 @@ async def check_status_endpoint(request: Request):
 @router.post("/upload")
 async def upload_documents_endpoint(
     request: Request,
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    tags: Optional[str] = Form(None)
 ):
     """User upload - temporary storage and processing."""
+    chunk_tags = parse_tags(tags)
     try:
         # Access RAG pipeline from app state
         rag_pipeline = request.app.state.rag_pipeline
@@ -159,15 +292,16 @@ async def upload_documents_endpoint(
                     content = await file.read()
                     buffer.write(content)
             
-            # Load documents using the new document loader
-            documents = load_all_documents(temp_dir)
+            # Load documents using the new document loader (parsing blocks, so off the event loop)
+            documents = await run_in_threadpool(load_all_documents, temp_dir, cache=rag_pipeline.parse_cache)
             
             # Index documents using the new RAG pipeline
-            rag_pipeline.index_documents(documents)
+            await run_in_threadpool(rag_pipeline.index_documents, documents, tags=chunk_tags)
         
         return {
             "message": f"Successfully processed {len(files)} files",
-            "chunks_added": len(documents)
+            "chunks_added": len(documents),
+            "held_chunks": rag_pipeline.held_chunks
         }
     
     except Exception as e:
@@ -177,9 +311,11 @@ async def upload_documents_endpoint(
 @router.post("/upload/admin")
 async def upload_documents_admin_endpoint(
     request: Request,
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    tags: Optional[str] = Form(None)
 ):
     """For permanent storage with detailed error handling"""
+    chunk_tags = parse_tags(tags)
     try:
         print(f"Starting admin upload process...")
         print(f"Received {len(files)} files")
@@ -195,7 +331,8 @@ async def upload_documents_admin_endpoint(
         print(f"RAG pipeline accessed successfully")
         
         # Create raw directory
-        raw_dir = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'raw')
+        # Resolved, so sources match the paths the folder watcher and re-index record
+        raw_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'raw'))
         print(f"Raw directory: {raw_dir}")
         
         try:
@@ -228,6 +365,7 @@ async def upload_documents_admin_endpoint(
         processed_files = []
         failed_files = []
         skipped_files = []
+        replaced_files = []
         
         for i, file in enumerate(files):
             print(f"Processing file {i+1}/{len(files)}: {file.filename}")
@@ -257,17 +395,20 @@ async def upload_documents_admin_endpoint(
                     failed_files.append({"filename": file.filename, "error": error_msg})
                     continue
                 
-                # Check for duplicates using source path
+                # Check for duplicates using source path; a changed file replaces
+                # the vectors of its previous version
                 file_path = os.path.join(raw_dir, file.filename)
                 if file_path in existing_sources:
-                    print(f"Skipping duplicate: {file.filename} (already processed)")
-                    skipped_files.append(file.filename)
-                    continue
-                
-                # Also check filename duplicates but allow re-processing if content changed
-                if file.filename in existing_files:
-                    print(f"File {file.filename} exists but will check if content changed")
-                    # Don't skip - continue with processing to check content hash
+                    unchanged = False
+                    if os.path.exists(file_path):
+                        with open(file_path, "rb") as existing:
+                            unchanged = existing.read() == file_content
+                    if unchanged:
+                        print(f"Skipping duplicate: {file.filename} (already processed)")
+                        skipped_files.append(file.filename)
+                        continue
+                    print(f"File {file.filename} changed, replacing its indexed version")
+                    replaced_files.append(file.filename)
                 
                 # Save file
                 file_path = os.path.join(raw_dir, file.filename)
@@ -290,52 +431,43 @@ async def upload_documents_admin_endpoint(
                 detail=f"No files were successfully processed. Failed files: {failed_files}"
             )
         
-        print(f"Loading only newly uploaded documents...")
+        print(f" Indexing newly uploaded documents...")
         
-        # Load only the newly uploaded documents, not all documents in directory
+        # Load and index only the newly uploaded files; recording them in the
+        # ingest manifest keeps the folder watcher from indexing them again
         try:
-            documents = []
-            for filename in processed_files:
-                file_path = os.path.join(raw_dir, filename)
-                print(f" Loading: {filename}")
-                
-                # Load individual PDF
-                loader = PyPDFLoader(file_path)
-                file_documents = loader.load()
-                documents.extend(file_documents)
-                print(f" Loaded {len(file_documents)} pages from {filename}")
-            
-            print(f" Total loaded: {len(documents)} documents from {len(processed_files)} files")
+            result = await run_in_threadpool(
+                rag_pipeline.index_files,
+                [os.path.join(raw_dir, filename) for filename in processed_files],
+                tags=chunk_tags,
+                force=True
+            )
+            print(f" Documents indexed successfully")
         except Exception as e:
             raise HTTPException(
                 status_code=500,
-                detail=f"Failed to load documents: {str(e)}"
+                detail=f"Failed to index documents: {str(e)}"
             )
         
-        if not documents:
+        for path, error in result["failed_files"].items():
+            processed_files.remove(os.path.basename(path))
+            failed_files.append({"filename": os.path.basename(path), "error": f"Failed to load documents: {error}"})
+        
+        if not result["chunks"]:
             raise HTTPException(
                 status_code=400,
                 detail="No documents were loaded from the files"
             )
         
-        print(f" Indexing documents...")
-        
-        # Index documents with error handling
-        try:
-            rag_pipeline.index_documents(documents)
-            print(f" Documents indexed successfully")
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to index documents: {str(e)}"
-            )
-        
         return {
             "message": f"Successfully processed {len(processed_files)} files",
             "processed_files": processed_files,
             "skipped_files": skipped_files,
+            "replaced_files": replaced_files,
             "failed_files": failed_files,
-            "chunks_added": len(documents),
+            "chunks_added": result["chunks"],
+            # Chunks waiting for PCA training; searched exactly until it trains
+            "held_chunks": result["held_chunks"],
             "total_files_received": len(files)
         }
         
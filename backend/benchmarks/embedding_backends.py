@@ -0,0 +1,64 @@
+"""Query latency, ingestion throughput and fp32 parity of each embedding backend.
+
+    python -m backend.benchmarks.embedding_backends [--backends torch torch_int8 onnx] [--chunks 500]
+
+Ingestion uses the synthetic chunk mix of embedding_throughput (or --data-dir);
+queries are short farmer-style questions. The onnx backend exports the model
+to --onnx-dir on first run.
+"""
+import argparse
+import time
+import numpy as np
+from backend.src.embeddings import DocumentEmbedder
+from backend.src.embedding_backends import EMBEDDING_BACKENDS
+from backend.benchmarks.embedding_throughput import corpus_chunks, synthetic_chunks
+
+QUERIES = [
+    "best fertilizer for wheat", "rice blast treatment", "when to sow maize",
+    "how to control aphids on mustard", "potato late blight symptoms", "drip irrigation for tomato",
+    "urea dose per hectare", "organic manure for vegetables",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--model", default="thenlper/gte-large")
+    parser.add_argument("--data-dir", help="directory of documents to chunk")
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--query-repeats", type=int, default=5)
+    parser.add_argument("--onnx-dir", default="models")
+    args = parser.parse_args()
+
+    texts = corpus_chunks(args.data_dir, args.chunks) if args.data_dir else synthetic_chunks(args.chunks)
+    print(f"{len(texts)} chunks, {len(QUERIES)} queries x {args.query_repeats}")
+
+    rows = []
+    for backend in args.backends:
+        # min_parity=0 so a diverging backend is still measured (and shows up in the table)
+        embedder = DocumentEmbedder(args.model, backend=backend, onnx_dir=args.onnx_dir, min_parity=0.0)
+        embedder.encode_query(QUERIES[0])  # warm-up
+
+        latencies = []
+        for _ in range(args.query_repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                embedder.encode_query(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        embedder.encode_texts(texts)
+        throughput = len(texts) / (time.perf_counter() - start)
+
+        parity = embedder.parity or {"min_cosine": 1.0, "mean_cosine": 1.0}
+        rows.append((backend, np.percentile(latencies, 50), np.percentile(latencies, 95), throughput,
+                     parity["min_cosine"], parity["mean_cosine"]))
+        embedder.close()
+
+    print(f"{'backend':<11} {'p50 ms':>8} {'p95 ms':>8} {'chunks/s':>9} {'min cos':>8} {'mean cos':>9}")
+    for backend, p50, p95, throughput, min_cos, mean_cos in rows:
+        print(f"{backend:<11} {p50:>8.1f} {p95:>8.1f} {throughput:>9.1f} {min_cos:>8.4f} {mean_cos:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
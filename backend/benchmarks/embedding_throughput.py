@@ -0,0 +1,73 @@
+"""Embedding throughput (chunks/sec): fixed 32-row batches vs. token-budget batches.
+
+    python -m backend.benchmarks.embedding_throughput [--data-dir data/raw] [--chunks 2000]
+
+With --data-dir the documents are loaded and chunked like ingestion does;
+otherwise a synthetic corpus mixes short table fragments with full-size
+1500-character chunks, the length spread TextChunker produces on the PDFs.
+"""
+import argparse
+import time
+import numpy as np
+from backend.src.embeddings import DocumentEmbedder
+
+WORDS = ("wheat rice maize urea potash nitrogen yield irrigation blast rust sowing "
+         "harvest seed fertilizer soil moisture pest fungicide hectare terai").split()
+
+
+def synthetic_chunks(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for _ in range(n):
+        # ~40% fragments (table cells, headings), the rest up to chunk_size
+        chars = rng.integers(5, 120) if rng.random() < 0.4 else rng.integers(600, 1500)
+        text = ""
+        while len(text) < chars:
+            text += WORDS[rng.integers(len(WORDS))] + " "
+        chunks.append(text[:chars].strip())
+    return chunks
+
+
+def corpus_chunks(data_dir: str, n: int) -> list:
+    from backend.src.data_loaders import load_all_documents
+    from backend.src.text_chunker import TextChunker
+    chunks = TextChunker(chunk_size=1500, chunk_overlap=300).chunk(load_all_documents(data_dir))
+    return [chunk.page_content for chunk in chunks if chunk.page_content.strip()][:n]
+
+
+def throughput(fn, texts: list, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", help="directory of documents to chunk")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--model", default="thenlper/gte-large")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-batch-tokens", type=int, help="default: batch_size x max_seq_length")
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    texts = corpus_chunks(args.data_dir, args.chunks) if args.data_dir else synthetic_chunks(args.chunks)
+    embedder = DocumentEmbedder(args.model, batch_size=args.batch_size, max_batch_tokens=args.max_batch_tokens)
+    lengths = embedder._token_lengths(texts)
+    print(f"{len(texts)} chunks, tokens min/median/max = "
+          f"{min(lengths)}/{int(np.median(lengths))}/{max(lengths)}, budget={embedder.max_batch_tokens}")
+
+    embedder._encode(texts[:64])  # warm-up
+    fixed = throughput(
+        lambda t: embedder.model.encode(t, batch_size=args.batch_size, convert_to_numpy=True), texts, args.repeats
+    )
+    bucketed = throughput(embedder._encode, texts, args.repeats)
+    print(f"{'fixed ' + str(args.batch_size) + '-row batches':<24} {fixed:>8.1f} chunks/s")
+    print(f"{'token-budget batches':<24} {bucketed:>8.1f} chunks/s  ({bucketed / fixed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Memory saved and recall@k lost by the quantized index types vs. the flat baseline.
+
+    python -m backend.benchmarks.quantization [--embeddings vectors.npy] [--n 50000]
+
+Without --embeddings, clustered synthetic vectors shaped like gte-large
+output (1024-dim) are used; real embeddings give more meaningful numbers.
+"""
+import argparse
+import time
+import faiss
+import numpy as np
+from backend.src import index_factory
+
+
+def synthetic_embeddings(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, n_clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return len(index_factory.serialize_index(index))
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    return sum(len(set(f) & set(t)) for f, t in zip(found, truth)) / float(truth.size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help=".npy file of float32 embeddings")
+    parser.add_argument("--n", type=int, default=50_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=1024, help="synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--rerank", type=int, default=4, help="candidates per result re-ranked exactly")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.ascontiguousarray(np.load(args.embeddings), dtype="float32")
+    else:
+        vectors = synthetic_embeddings(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    sample = rng.choice(n, min(args.queries, n), replace=False)
+    queries = vectors[sample] + rng.normal(0, 0.01, (len(sample), dim)).astype("float32")
+    _, truth = faiss.knn(queries, vectors, args.k)
+    nlist = index_factory.default_nlist(n)
+
+    print(f"{n} vectors x {dim} dims, {len(queries)} queries, recall@{args.k}, nlist={nlist}")
+    print(f"{'index':<10} {'rerank':>6} {'MB':>9} {'saved':>7} {'recall':>7} {'lost':>7} {'ms/query':>9}")
+    flat_bytes = None
+    for index_type in ("flat", "sq_fp16", "sq_int8", "pq", "ivf_pq", "binary"):
+        if n < index_factory.min_train_size(index_type, nlist):
+            print(f"{index_type:<10} skipped: needs {index_factory.min_train_size(index_type, nlist)} vectors")
+            continue
+        index = index_factory.build_index(index_type, dim, nlist=nlist, pq_m=args.pq_m)
+        index_factory.train_and_fill(index, vectors)
+        index_factory.set_default_search_params(index, args.nprobe, 64)
+        size = index_bytes(index)
+        flat_bytes = flat_bytes or size
+
+        reranks = (0, args.rerank) if index_factory.is_lossy(index) else (0,)
+        if index_factory.is_binary(index):
+            # served with a fixed candidate pool, see VectorDatabase.binary_candidates
+            reranks = (0, max(args.rerank, index_factory.BINARY_CANDIDATES // args.k))
+        for rerank in reranks:
+            start = time.perf_counter()
+            if rerank:
+                _, candidates = index.search(queries, args.k * rerank)
+                _, found = index_factory.exact_rerank(queries, candidates, lambda rows: vectors[rows], args.k)
+            else:
+                _, found = index.search(queries, args.k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = recall_at_k(found, truth)
+            print(f"{index_type:<10} {rerank:>6} {size / 2**20:>9.1f} {1 - size / flat_bytes:>7.1%} "
+                  f"{recall:>7.3f} {1 - recall:>7.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Recall@k and search latency of PCA / truncation-reduced embeddings vs. full dimension.
+
+    python -m backend.benchmarks.reduction [--embeddings vectors.npy] [--dims 512 256]
+
+Ground truth is exact search at full dimension. Truncation is only meaningful
+for Matryoshka-trained models; on gte-large (or synthetic data) expect PCA to
+win. Real embeddings give more meaningful numbers than the synthetic default.
+"""
+import argparse
+import time
+import faiss
+import numpy as np
+from backend.src.reduction import EmbeddingReducer
+from backend.benchmarks.quantization import recall_at_k
+
+
+def synthetic_embeddings(n: int, dim: int, decay: float = 1.0, seed: int = 0) -> np.ndarray:
+    """Unit vectors whose variance decays over a random basis like real sentence embeddings.
+
+    Isotropic noise (as in the quantization benchmark) has no low-dimensional
+    structure and would make any reduction look hopeless.
+    """
+    rng = np.random.default_rng(seed)
+    scales = np.arange(1, dim + 1, dtype="float32") ** -decay
+    basis, _ = np.linalg.qr(rng.normal(size=(dim, dim)))
+    vectors = (rng.normal(size=(n, dim)).astype("float32") * scales) @ basis.astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help=".npy file of float32 embeddings")
+    parser.add_argument("--n", type=int, default=50_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=1024, help="synthetic vector dimension")
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 256])
+    parser.add_argument("--train", type=int, default=10_000, help="vectors used to train PCA")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.ascontiguousarray(np.load(args.embeddings), dtype="float32")
+    else:
+        vectors = synthetic_embeddings(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    sample = rng.choice(n, min(args.queries, n), replace=False)
+    queries = vectors[sample] + rng.normal(0, 0.01, (len(sample), dim)).astype("float32")
+    _, truth = faiss.knn(queries, vectors, args.k)
+
+    print(f"{n} vectors x {dim} dims, {len(queries)} queries, recall@{args.k} vs exact full-dim search")
+    print(f"{'reduction':<14} {'dims':>5} {'MB':>8} {'recall':>7} {'ms/query':>9}")
+    configs = [("none", dim)] + [(kind, d) for d in args.dims for kind in ("pca", "truncate") if d < dim]
+    for kind, d in configs:
+        if kind == "none":
+            reduced, reduced_queries = vectors, queries
+        else:
+            reducer = EmbeddingReducer(kind, dim, d, "benchmark")
+            reducer.train(vectors[rng.choice(n, min(args.train, n), replace=False)])
+            reduced, reduced_queries = reducer.apply(vectors), reducer.apply(queries)
+        index = faiss.IndexFlatL2(d)
+        index.add(reduced)
+        index.search(reduced_queries[:10], args.k)  # warm-up
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            _, found = index.search(reduced_queries, args.k)
+            best = min(best, time.perf_counter() - start)
+        ms = best * 1000 / len(queries)
+        print(f"{kind:<14} {d:>5} {reduced.nbytes / 2**20:>8.1f} {recall_at_k(found, truth):>7.3f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
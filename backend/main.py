@@ -26,6 +26,25 @@ async def startup_event():
     # Store the pipeline in app state for API routes(saves time and resources)
     app.state.rag_pipeline = rag_pipeline
     print("RAG pipeline initialized successfully")
+    
+    # Optional: index files copied into WATCH_DATA_DIR (e.g. data/raw) without an upload
+    watch_dir = os.getenv("WATCH_DATA_DIR")
+    if watch_dir:
+        from backend.src.folder_watcher import FolderWatcher
+        app.state.folder_watcher = FolderWatcher(rag_pipeline, watch_dir)
+        app.state.folder_watcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Let a running background compaction publish its manifest, then hand the
+    # store's writer lock back before exiting
+    if hasattr(app.state, "folder_watcher"):
+        app.state.folder_watcher.close()
+    if hasattr(app.state, "rag_pipeline"):
+        app.state.rag_pipeline.vector_db.close()
+        app.state.rag_pipeline.query_batcher.close()
+        app.state.rag_pipeline.embedder.close()
 
 
 app.include_router(chat.router, prefix="/api", tags=["chat"])
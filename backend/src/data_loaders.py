@@ -1,71 +1,285 @@
+import os
+import json
+import gzip
+import time
+import signal
+import threading
+import multiprocessing
+from collections import deque
 from pathlib import Path
-from typing import List, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib import metadata as package_metadata
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from langchain.schema import Document
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
 from langchain_community.document_loaders import Docx2txtLoader
 from langchain_community.document_loaders.excel import UnstructuredExcelLoader
 from langchain_community.document_loaders import JSONLoader
 
 
-def load_all_documents(data_dir: str) -> List[Any]:
+# extension -> (label, loader factory); looked up inside the worker process
+LOADERS = {
+    ".pdf": ("PDF", lambda path: PyPDFLoader(path)),
+    ".txt": ("TXT", lambda path: TextLoader(path)),
+    ".csv": ("CSV", lambda path: CSVLoader(path)),
+    ".xlsx": ("Excel", lambda path: UnstructuredExcelLoader(path)),
+    ".docx": ("Word", lambda path: Docx2txtLoader(path)),
+    ".json": ("JSON", lambda path: JSONLoader(path, jq_schema='.', text_content=False)),
+}
 
-    
-    data_path = Path(data_dir).resolve()
-    print(f"Loading documents from: {data_path}")
-    documents = []
+# extension -> the package whose parser produces its text
+PARSER_PACKAGES = {".pdf": "pypdf", ".docx": "docx2txt", ".xlsx": "unstructured"}
 
-    # PDF files
-    for pdf_file in data_path.glob('**/*.pdf'):
-        try:
-            loader = PyPDFLoader(str(pdf_file))
-            documents.extend(loader.load())
-            print(f"Loaded PDF: {pdf_file.name}")
-        except Exception as e:
-            print(f"Failed to load PDF {pdf_file}: {e}")
-
-    # TXT files
-    for txt_file in data_path.glob('**/*.txt'):
-        try:
-            loader = TextLoader(str(txt_file))
-            documents.extend(loader.load())
-            print(f"Loaded TXT: {txt_file.name}")
-        except Exception as e:
-            print(f"Failed to load TXT {txt_file}: {e}")
-
-    # CSV files
-    for csv_file in data_path.glob('**/*.csv'):
-        try:
-            loader = CSVLoader(str(csv_file))
-            documents.extend(loader.load())
-            print(f"Loaded CSV: {csv_file.name}")
-        except Exception as e:
-            print(f"Failed to load CSV {csv_file}: {e}")
-
-    # Excel files
-    for xlsx_file in data_path.glob('**/*.xlsx'):
+FILE_TIMEOUT = 300         # seconds one file may take to parse in a worker
+MIN_PARALLEL_FILES = 4     # fewer files load in-process; a pool costs more to start
+PARSE_CACHE_VERSION = 1
+
+
+def scan_files(data_dir: str) -> List[str]:
+    """Supported files under data_dir in one os.scandir walk, sorted by path."""
+    files = []
+    pending = [str(Path(data_dir).resolve())]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in LOADERS and entry.is_file():
+                    files.append(entry.path)
+    return sorted(files)
+
+
+def _parse_file(path: str) -> List[Any]:
+    _, make_loader = LOADERS[os.path.splitext(path)[1].lower()]
+    return make_loader(path).load()
+
+
+def _parser_signature(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    package = PARSER_PACKAGES.get(extension, "langchain-community")
+    try:
+        version = package_metadata.version(package)
+    except package_metadata.PackageNotFoundError:
+        version = "unknown"
+    return f"{LOADERS[extension][0]}:{package}=={version}"
+
+
+class ParsedTextCache:
+    """Documents extracted from files, as gzip-compressed JSON keyed by content hash.
+
+    Parsing (scanned or table-heavy PDFs especially) can take longer than
+    embedding, and a rebuild or a new chunk size would otherwise parse every
+    unchanged file again. Entries record the loader and its package version,
+    so upgrading a parser re-parses instead of serving its old output. The
+    cache is plain files, so pool workers share it; it is never pruned.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def _entry_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}.json.gz")
+
+    def load(self, path: str, signature: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """The documents of path, parsed only on a cache miss.
+
+        `signature` ({"size", "mtime_ns", "sha256"}, as the ingest manifest
+        records it) saves hashing the file again; it is used only while the
+        file's size and mtime still match.
+        """
+        from .ingest import file_sha256
+        
+        sha256 = None
+        if signature is not None:
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) == (signature["size"], signature["mtime_ns"]):
+                sha256 = signature["sha256"]
+        entry_path = self._entry_path(sha256 or file_sha256(path))
+        parser = _parser_signature(path)
         try:
-            loader = UnstructuredExcelLoader(str(xlsx_file))
-            documents.extend(loader.load())
-            print(f"Loaded Excel: {xlsx_file.name}")
-        except Exception as e:
-            print(f"Failed to load Excel {xlsx_file}: {e}")
-
-    # Word files
-    for docx_file in data_path.glob('**/*.docx'):
+            with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == PARSE_CACHE_VERSION and saved.get("parser") == parser:
+                documents = []
+                for doc in saved["documents"]:
+                    if "source" in doc["metadata"]:
+                        # The same content may have been parsed under another path
+                        doc["metadata"]["source"] = path
+                    documents.append(Document(page_content=doc["page_content"], metadata=doc["metadata"]))
+                return documents
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable parse cache entry {entry_path}: {e}")
+        
+        documents = _parse_file(path)
+        self._store(entry_path, parser, documents)
+        return documents
+
+    def _store(self, entry_path: str, parser: str, documents: List[Any]):
         try:
-            loader = Docx2txtLoader(str(docx_file))
-            documents.extend(loader.load())
-            print(f"Loaded Word: {docx_file.name}")
-        except Exception as e:
-            print(f"Failed to load Word {docx_file}: {e}")
-
-    # JSON files
-    for json_file in data_path.glob('**/*.json'):
+            payload = json.dumps({
+                "version": PARSE_CACHE_VERSION,
+                "parser": parser,
+                "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents],
+            })
+        except TypeError as e:
+            print(f"Not caching parsed text with non-JSON metadata: {e}")
+            return
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Per-process temp name: pool workers may parse identical files at once
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(payload)
+        os.replace(tmp_path, entry_path)
+
+
+def load_file(
+    path: str,
+    cache: Optional[ParsedTextCache] = None,
+    signature: Optional[Dict[str, Any]] = None
+) -> List[Any]:
+    """Parse one file with the loader for its extension (through cache, if given)."""
+    if cache is not None:
+        return cache.load(path, signature)
+    return _parse_file(path)
+
+
+def _alarm(signum, frame):
+    raise TimeoutError("timed out")
+
+
+def _load_isolated(
+    path: str,
+    timeout: Optional[float],
+    cache: Optional[ParsedTextCache] = None,
+    signature: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Any], Optional[str], float]:
+    """(documents, error, seconds); never raises, so one bad file can't fail the batch.
+
+    The timeout uses SIGALRM, which only the main thread of a process can
+    set: always true in a pool worker, not for in-process loads from the
+    API threadpool (those run without a timeout).
+    """
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    start = time.perf_counter()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return load_file(path, cache, signature), None, time.perf_counter() - start
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}", time.perf_counter() - start
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def _load_in_own_process(
+    path: str,
+    timeout: Optional[float],
+    context,
+    cache: Optional[ParsedTextCache] = None,
+    signature: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Any], Optional[str], float]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
         try:
-            loader = JSONLoader(str(json_file), jq_schema='.', text_content=False)
-            documents.extend(loader.load())
-            print(f"Loaded JSON: {json_file.name}")
-        except Exception as e:
-            print(f"Failed to load JSON {json_file}: {e}")
+            return pool.submit(_load_isolated, path, timeout, cache, signature).result()
+        except BrokenProcessPool:
+            return [], "parser process died", 0.0
+
+
+def iter_loaded_files(
+    paths: List[str],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = FILE_TIMEOUT,
+    max_pending: Optional[int] = None,
+    cache: Optional[ParsedTextCache] = None,
+    signatures: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Iterator[Tuple[str, List[Any], Optional[str]]]:
+    """(path, documents, error) for each path, in input order.
+
+    Files are parsed in a process pool (spawned, so no locks or FAISS threads
+    are inherited from the server) unless there are too few to pay for it.
+    At most max_pending files (default 2 per worker) are parsed ahead of the
+    consumer, so a slow consumer bounds memory instead of queueing the corpus.
+    With a ParsedTextCache, files parsed before (by content) skip the parser;
+    `signatures` (path -> ingest manifest signature) spares hashing them twice.
+    """
+    signatures = signatures or {}
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1 or len(paths) < MIN_PARALLEL_FILES:
+        for path in paths:
+            documents, error, _ = _load_isolated(path, timeout, cache, signatures.get(path))
+            yield path, documents, error
+        return
+
+    context = multiprocessing.get_context("spawn")
+    max_pending = max_pending or 2 * workers
+    next_path = 0
+    pending = deque()
+    while next_path < len(paths) or pending:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            try:
+                while next_path < len(paths) or pending:
+                    while next_path < len(paths) and len(pending) < max_pending:
+                        path = paths[next_path]
+                        pending.append((path, pool.submit(_load_isolated, path, timeout, cache, signatures.get(path))))
+                        next_path += 1
+                    documents, error, _ = pending[0][1].result()
+                    yield pending.popleft()[0], documents, error
+                return
+            except BrokenProcessPool:
+                pass
+
+        # A parser crashed the process (e.g. a native library on a corrupt file),
+        # which fails every in-flight future; keep what finished, give each of
+        # the others its own process so only the culprit is lost, then carry on
+        # with a fresh pool
+        def result_or_retry(item):
+            path, future = item
+            if future is not None and future.done() and future.exception() is None:
+                return future.result()
+            return _load_in_own_process(path, timeout, context, cache, signatures.get(path))
+
+        print(f"A parser process died; retrying {len(pending)} files in isolated processes")
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            for (path, _), (documents, error, _) in zip(list(pending), threads.map(result_or_retry, list(pending))):
+                yield path, documents, error
+        pending.clear()
+
+
+def load_all_documents(
+    data_dir: str,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = FILE_TIMEOUT,
+    cache: Optional[ParsedTextCache] = None
+) -> List[Any]:
+    # workers: parser processes (default: one per core); timeout: seconds per file;
+    # cache: reuse text parsed earlier from files with the same content
+
+    data_path = Path(data_dir).resolve()
+    print(f"Loading documents from: {data_path}")
+    start = time.perf_counter()
+    files = scan_files(data_dir)
+    documents = []
+    pages = 0
+    failed = 0
+
+    for path, loaded, error in iter_loaded_files(files, workers, timeout, cache=cache):
+        label, _ = LOADERS[os.path.splitext(path)[1].lower()]
+        if error is not None:
+            failed += 1
+            print(f"Failed to load {label} {path}: {error}")
+            continue
+        documents.extend(loaded)
+        pages += len(loaded)  # one Document per PDF page, one per row/file otherwise
+        print(f"Loaded {label}: {os.path.basename(path)}")
 
+    elapsed = max(time.perf_counter() - start, 1e-9)
     print(f"Total loaded documents: {len(documents)}")
+    print(f"Parsed {len(files) - failed}/{len(files)} files in {elapsed:.1f}s "
+          f"({len(files) / elapsed:.1f} files/s, {pages / elapsed:.1f} pages/s)")
     return documents
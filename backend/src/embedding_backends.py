@@ -0,0 +1,157 @@
+import os
+import json
+import numpy as np
+from typing import Dict, Any, Optional
+
+
+# torch: the fp32 SentenceTransformer as loaded
+# torch_int8: Linear layers dynamically quantized to int8 (weights int8, activations quantized per batch)
+# onnx: the transformer exported once to ONNX and run with onnxruntime on CPU
+EMBEDDING_BACKENDS = ("torch", "torch_int8", "onnx")
+
+# Compared against fp32 output whenever another backend is loaded
+PARITY_TEXTS = [
+    "best fertilizer for wheat",
+    "rice blast treatment",
+    "How much urea should be applied per hectare of maize in the terai?",
+    "Late blight of potato spreads quickly in cool, humid weather; spray a fungicide at first symptoms.",
+    "Table 3: Recommended NPK doses (kg/ha) for irrigated and rainfed crops",
+    "पानी कम होने पर धान की सिंचाई कब करें",
+]
+
+
+def quantize_int8(model):
+    """A copy of a SentenceTransformer with its Linear layers dynamically quantized to int8."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine similarity between two embedding matrices of the same texts."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+
+def _pooling_config(model) -> Dict[str, Any]:
+    """Pooling and normalization of a SentenceTransformer, to repeat them outside torch."""
+    modules = {type(module).__name__: module for module in model}
+    pooling = modules.get("Pooling")
+    if pooling is None or pooling.pooling_mode_max_tokens or pooling.pooling_mode_mean_sqrt_len_tokens:
+        raise ValueError("ONNX backend supports CLS or mean pooling only")
+    return {
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+        "normalize": "Normalize" in modules,
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+
+
+def export_onnx(model, path: str):
+    """Export the transformer of a SentenceTransformer to `path` (+ a .json pooling sidecar)."""
+    import torch
+
+    transformer = model[0]
+    features = transformer.tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(features.keys())
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer.auto_model).eval(),
+            tuple(features[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    with open(path + ".json", "w") as f:
+        json.dump(dict(_pooling_config(model), input_names=input_names), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class OnnxEncoder:
+    """onnxruntime stand-in for the parts of SentenceTransformer that DocumentEmbedder uses."""
+
+    def __init__(self, path: str, tokenizer, threads: Optional[int] = None):
+        import onnxruntime
+
+        with open(path + ".json") as f:
+            self.config = json.load(f)
+        self.tokenizer = tokenizer
+        self.max_seq_length = self.config["max_seq_length"]
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False, convert_to_numpy: bool = True) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        result = np.empty((len(texts), self.config["dimension"]), dtype="float32")
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            features = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+            )
+            feeds = {name: features[name].astype("int64") for name in self.config["input_names"]}
+            token_embeddings = self.session.run(None, feeds)[0]
+            if self.config["pooling"] == "cls":
+                pooled = token_embeddings[:, 0]
+            else:
+                mask = feeds["attention_mask"][:, :, None].astype("float32")
+                pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.config["normalize"]:
+                pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            result[start:start + len(batch)] = pooled
+        return result
+
+
+def require_onnx():
+    """Fail before exporting anything if the optional ONNX packages are missing."""
+    missing = []
+    for package in ("onnx", "onnxruntime"):
+        try:
+            __import__(package)
+        except ImportError:
+            missing.append(package)
+    if missing:
+        raise ImportError(
+            f"The 'onnx' embedding backend needs {' and '.join(missing)}: "
+            f"pip install {' '.join(missing)} (pinned in requirements.txt), or use backend 'torch'"
+        )
+
+
+def default_onnx_path(model_name: str, directory: str = "models") -> str:
+    return os.path.join(directory, model_name.replace("/", "__") + ".onnx")
+
+
+def load_backend(model, backend: str, model_name: str, onnx_path: Optional[str] = None):
+    """The encoder for `backend`, built from the loaded fp32 SentenceTransformer."""
+    if backend == "torch":
+        return model
+    if backend == "torch_int8":
+        return quantize_int8(model)
+    if backend == "onnx":
+        require_onnx()
+        onnx_path = onnx_path or default_onnx_path(model_name)
+        if not os.path.exists(onnx_path):
+            print(f"Exporting {model_name} to ONNX: {onnx_path}")
+            export_onnx(model, onnx_path)
+        return OnnxEncoder(onnx_path, model.tokenizer)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBEDDING_BACKENDS}")
@@ -0,0 +1,117 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache in SQLite: sha256(model + text) -> float32 row.
+
+    Re-uploads, re-index runs and repeated chunks hit the cache instead of the
+    model. The cache holds at most `max_entries` rows; when a write goes over,
+    the least recently used rows are evicted. One connection is shared by all
+    threads behind a lock (the API embeds from its threadpool).
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Row count kept up to date by put_many, so writes don't scan the table
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        # The separator keeps ("ab", "c") and ("a", "bc") apart
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached embeddings for `texts`, None where missing; hits are marked as recently used."""
+        keys = [self.key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ))
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [
+            np.frombuffer(found[key], dtype="float32") if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        """Store one float32 row per text, then evict down to max_entries."""
+        embeddings = np.asarray(embeddings, dtype="float32")
+        now = time.time()
+        rows = [
+            (self.key(model_name, text), embedding.tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            # Keys are content-addressed, so a key already present holds the same
+            # vector (and was marked used by the get_many that missed it racing us);
+            # rowcount is then the number of new rows
+            self._rows += self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows).rowcount
+            excess = self._rows - self.max_entries
+            if excess > 0:
+                self._rows -= self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                ).rowcount
+                self.evictions += excess
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            # Also resyncs the running count (another process may share the file)
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self._rows
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,42 +1,223 @@
 
-from typing import List
+import os
+import threading
+import numpy as np
+from typing import List, Optional
 from sentence_transformers import SentenceTransformer
+from .embedding_cache import EmbeddingCache
+from .embedding_backends import EMBEDDING_BACKENDS, PARITY_TEXTS, cosine_parity, default_onnx_path, load_backend, require_onnx
+
+
+def token_budget_batches(lengths: List[int], max_batch_tokens: int) -> List[np.ndarray]:
+    """Group text positions into length-sorted batches of at most max_batch_tokens padded tokens.
+
+    A batch is padded to its longest member, so sorting first keeps short
+    table fragments out of batches padded to 1500-character chunks, and the
+    budget lets batches of short texts grow wider than a fixed row count.
+    """
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        # Longest first, so the first row sets the padded width of the batch
+        width = max(1, lengths[order[start]])
+        rows = max(1, max_batch_tokens // width)
+        batches.append(order[start:start + rows])
+        start += rows
+    return batches
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale the rows of a float32 matrix to unit length in place (zero rows stay zero)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, np.finfo("float32").tiny, out=norms)
+    vectors /= norms
+    return vectors
 
 
 class DocumentEmbedder:
     
-    def __init__(self, model_name: str = "thenlper/gte-large", batch_size: int = 32):
+    def __init__(
+        self,
+        model_name: str = "thenlper/gte-large",
+        batch_size: int = 32,
+        cache: Optional[EmbeddingCache] = None,
+        workers: int = 0,
+        pool_min_texts: int = 256,
+        max_batch_tokens: Optional[int] = None,
+        normalize_embeddings: bool = False,
+        backend: str = "torch",
+        onnx_dir: str = "models",
+        min_parity: float = 0.99
+    ):
+        # backend: "torch" (fp32), "torch_int8" or "onnx" (exported to onnx_dir on
+        # first use), see embedding_backends; anything but fp32 must reach
+        # min_parity cosine similarity on PARITY_TEXTS
+        # normalize_embeddings: unit-length vectors from every encode call; index
+        # and queries must agree, so it is a property of the embedder
+        # max_batch_tokens: padded-token budget per forward pass; defaults to
+        # batch_size full-length sequences, so peak memory stays the same
+        # workers > 1: bulk batches of at least pool_min_texts are split across a
+        # pool of CPU worker processes (started on first use, reused afterwards)
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+        if backend == "onnx" and workers > 1:
+            raise ValueError("The onnx backend runs its own thread pool; use workers=0")
+        if backend == "onnx":
+            # Before the model download, not after
+            require_onnx()
         self.model_name = model_name
+        self.backend = backend
+        # Backends differ in the last digits, so each caches its own vectors
+        self.cache_model_name = model_name if backend == "torch" else f"{model_name}#{backend}"
         self.batch_size = batch_size
+        self.cache = cache  # optional; skips the model for texts embedded before
+        self.workers = workers
+        self.pool_min_texts = pool_min_texts
+        self._pool = None
+        self._pool_lock = threading.Lock()
         print(f"Loading embedding model: {model_name}...")
         self.model = SentenceTransformer(model_name,
                                          
                                          
                                          )
-        print(f"Model loaded successfully (batch_size={batch_size})")
+        self.parity = None
+        if backend != "torch":
+            reference = self.model.encode(PARITY_TEXTS, convert_to_numpy=True)
+            self.model = load_backend(self.model, backend, model_name, default_onnx_path(model_name, onnx_dir))
+            self.parity = cosine_parity(reference, self.model.encode(PARITY_TEXTS, convert_to_numpy=True))
+            print(f"{backend} backend parity vs fp32: min cosine {self.parity['min_cosine']:.4f}, "
+                  f"mean {self.parity['mean_cosine']:.4f}")
+            if self.parity["min_cosine"] < min_parity:
+                raise ValueError(
+                    f"{backend} embeddings diverge from fp32 (min cosine {self.parity['min_cosine']:.4f} "
+                    f"< {min_parity}); use backend='torch'"
+                )
+        self.max_batch_tokens = max_batch_tokens or batch_size * self.model.max_seq_length
+        self.normalize_embeddings = normalize_embeddings
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        print(f"Model loaded successfully (backend={backend}, batch_size={batch_size})")
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def encode_texts(self, texts: List[str], normalize: Optional[bool] = None) -> np.ndarray:
+        """(len(texts), dim) C-contiguous float32 matrix, ready for VectorDatabase.add/search as is.
+
+        normalize: L2-normalize rows in place (defaults to normalize_embeddings).
+        """
         texts = [t.strip() for t in texts if t and t.strip()]
         if not texts:
             raise ValueError("No valid texts to embed")
         
-        print(f"Embedding {len(texts)} texts...")
-        embeddings = self.model.encode(
-            texts,
-            batch_size=self.batch_size,
-            show_progress_bar=True,
-            convert_to_numpy=False
-        )
-        
-        result = [emb.tolist() for emb in embeddings]
-        print(f"Successfully embedded {len(result)} texts")
+        result = np.empty((len(texts), self.dimension), dtype="float32")
+        cached = self.cache.get_many(self.cache_model_name, texts) if self.cache is not None else [None] * len(texts)
+        # Identical texts (repeated chunks, boilerplate pages) are encoded once
+        positions = {}
+        for i, (text, emb) in enumerate(zip(texts, cached)):
+            if emb is None:
+                positions.setdefault(text, []).append(i)
+            else:
+                result[i] = emb
+        if self.cache is not None:
+            print(f"Embedding cache: {sum(emb is not None for emb in cached)}/{len(texts)} hits")
+
+        if positions:
+            missing = list(positions)
+            print(f"Embedding {len(missing)} texts...")
+            if len(missing) == len(texts):
+                # Nothing cached or repeated: the encoder writes straight into the result
+                self._encode(missing, out=result)
+                encoded = result
+            else:
+                encoded = self._encode(missing)
+                for text, row in zip(missing, encoded):
+                    result[positions[text]] = row
+            if self.cache is not None:
+                self.cache.put_many(self.cache_model_name, missing, encoded)
+
+        if self.normalize_embeddings if normalize is None else normalize:
+            l2_normalize(result)
+        print(f"Successfully embedded {len(texts)} texts")
         return result
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        # List form for callers that serialize embeddings; the pipeline uses encode_texts
+        return self.encode_texts(texts).tolist()
     
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.model.tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _encode(self, texts: List[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """One float32 row per text, in input order, written into `out` if given.
+
+        Texts are sorted by token length and encoded in batches under the
+        token budget, then scattered back; big batches go to the worker pool.
+        """
+        lengths = self._token_lengths(texts)
+        result = out if out is not None else np.empty((len(texts), self.dimension), dtype="float32")
+        if self.workers > 1 and len(texts) >= self.pool_min_texts:
+            print(f"Splitting {len(texts)} texts across {self.workers} embedding workers")
+            # Length-sorted input gives each worker chunk similar lengths; small
+            # chunks keep every worker busy until the end of the batch
+            order = np.argsort(-np.asarray(lengths), kind="stable")
+            chunk_size = max(self.batch_size, len(texts) // (self.workers * 4))
+            result[order] = self.model.encode_multi_process(
+                [texts[i] for i in order], self._get_pool(), batch_size=self.batch_size, chunk_size=chunk_size
+            )
+            return result
+
+        for batch in token_budget_batches(lengths, self.max_batch_tokens):
+            result[batch] = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+        return result
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                print(f"Starting {self.workers} embedding worker processes...")
+                # Workers share the cores instead of each starting a full-size
+                # torch thread pool; children read this when torch is imported
+                previous = os.environ.get("OMP_NUM_THREADS")
+                os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // self.workers))
+                try:
+                    self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+                finally:
+                    if previous is None:
+                        del os.environ["OMP_NUM_THREADS"]
+                    else:
+                        os.environ["OMP_NUM_THREADS"] = previous
+            return self._pool
+
+    def close(self):
+        """Stop the worker pool, if one was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                SentenceTransformer.stop_multi_process_pool(self._pool)
+                self._pool = None
+
     #for incomeing query 
-    def embed_text(self, text: str) -> List[float]:
+    def encode_query(self, text: str, normalize: Optional[bool] = None) -> np.ndarray:
+        """A (dim,) float32 query vector."""
         text = text.strip()
         if not text:
             raise ValueError("Text cannot be empty")
-        
-        embedding = self.model.encode(text, convert_to_numpy=False)
-        return embedding.tolist()
+        return self.encode_queries([text], normalize)[0]
+
+    def encode_queries(self, texts: List[str], normalize: Optional[bool] = None) -> np.ndarray:
+        """(len(texts), dim) float32 query vectors from one forward pass.
+
+        Queries are short, so this skips length bucketing and the chunk
+        embedding cache (the pipeline has its own query cache).
+        """
+        embeddings = np.ascontiguousarray(
+            self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype="float32"
+        )
+        if self.normalize_embeddings if normalize is None else normalize:
+            l2_normalize(embeddings)
+        return embeddings
+
+    def embed_text(self, text: str) -> List[float]:
+        return self.encode_query(text).tolist()
@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+from typing import Dict, Any
+from .data_loaders import scan_files
+
+
+class FolderWatcher:
+    """Indexes files dropped into (or removed from) a folder, in the background.
+
+    A polling thread snapshots the size and mtime of every supported file.
+    Once the folder has been quiet for `debounce` seconds (a copy in progress
+    or a burst of uploads keeps changing the snapshot), files that differ from
+    the ingest manifest go through RAGPipeline.index_files in batches of
+    `batch_files`, and files that disappeared are dropped from the store.
+
+    The thread runs at a lowered OS priority and waits while queries are
+    queued for embedding before each batch, so ingestion yields to search.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline,
+        watch_dir: str,
+        poll_interval: float = 5.0,
+        debounce: float = 10.0,
+        batch_files: int = 8,
+        niceness: int = 10,
+    ):
+        if batch_files < 1:
+            raise ValueError("batch_files must be at least 1")
+        self.rag_pipeline = rag_pipeline
+        self.watch_dir = os.path.realpath(watch_dir)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.batch_files = batch_files
+        self.niceness = niceness
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._seen = None           # last snapshot and when it last changed
+        self._changed_at = 0.0
+        self._synced = None         # snapshot the store was last brought in line with
+        self.state = "stopped"
+        self.pending_files = 0
+        self.files_indexed = 0
+        self.files_removed = 0
+        self.files_failed = 0
+        self.chunks_indexed = 0
+        self.last_sync = None
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._set(state="starting")
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+        print(f"Watching {self.watch_dir} for new documents (every {self.poll_interval}s)")
+
+    def close(self):
+        """Stop polling; a batch being indexed is finished first."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._set(state="stopped")
+
+    def _run(self):
+        try:
+            # Linux nice values are per thread; torch's own worker threads keep theirs
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.niceness)
+        except (AttributeError, OSError) as e:
+            print(f"Folder watcher runs at normal priority: {e}")
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Folder watcher error: {e}")
+                self._set(state="error", last_error=f"{type(e).__name__}: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _snapshot(self) -> Dict[str, tuple]:
+        snapshot = {}
+        if not os.path.isdir(self.watch_dir):
+            return snapshot
+        for path in scan_files(self.watch_dir):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self):
+        """One polling step: note changes, and sync once they have settled."""
+        snapshot = self._snapshot()
+        now = time.monotonic()
+        if snapshot != self._seen:
+            self._seen = snapshot
+            self._changed_at = now
+        if snapshot == self._synced:
+            self._set(state="idle", pending_files=0)
+            return
+
+        manifest = self.rag_pipeline.ingest_manifest
+        changed = [
+            path for path, (size, mtime_ns) in snapshot.items()
+            # Files that failed to load are in the manifest too, until they change
+            if not manifest.matches(path, size, mtime_ns)
+        ]
+        deleted = manifest.missing(list(snapshot), self.watch_dir)
+        if not changed and not deleted:
+            self._synced = snapshot
+            self._set(state="idle", pending_files=0)
+            return
+        if now - self._changed_at < self.debounce:
+            self._set(state="waiting", pending_files=len(changed) + len(deleted))
+            return
+        self._sync(snapshot, changed, deleted)
+
+    def _sync(self, snapshot: Dict[str, tuple], changed: list, deleted: list):
+        self._set(state="indexing", pending_files=len(changed) + len(deleted))
+        if deleted:
+            self.rag_pipeline.forget_files(deleted)
+            self._add(files_removed=len(deleted), pending_files=-len(deleted))
+
+        for start in range(0, len(changed), self.batch_files):
+            if self._stop.is_set():
+                return
+            self._wait_for_queries()
+            batch = changed[start:start + self.batch_files]
+            result = self.rag_pipeline.index_files(batch)
+            for path, error in result["failed_files"].items():
+                self._set(last_error=f"{os.path.basename(path)}: {error}")
+            self._add(
+                files_indexed=len(result["indexed_files"]),
+                files_failed=len(result["failed_files"]),
+                chunks_indexed=result["chunks"],
+                pending_files=-len(batch),
+            )
+
+        # Changes made while indexing show up as a new snapshot on the next poll
+        self._synced = snapshot
+        self._set(state="idle", pending_files=0, last_sync=time.time())
+
+    def _wait_for_queries(self, max_wait: float = 5.0):
+        # Queries already waiting for the embedder go first
+        batcher = getattr(self.rag_pipeline, "query_batcher", None)
+        deadline = time.monotonic() + max_wait
+        while batcher is not None and batcher.stats()["queue_depth"] and time.monotonic() < deadline:
+            if self._stop.wait(0.05):
+                return
+
+    def _set(self, **values):
+        with self._stats_lock:
+            for name, value in values.items():
+                setattr(self, name, value)
+
+    def _add(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "watch_dir": self.watch_dir,
+                "state": self.state,   # starting, waiting (debouncing), indexing, idle, error, stopped
+                "pending_files": self.pending_files,
+                "files_indexed": self.files_indexed,
+                "files_removed": self.files_removed,
+                "files_failed": self.files_failed,
+                "chunks_indexed": self.chunks_indexed,
+                "last_sync": self.last_sync,   # unix time of the last completed sync
+                "last_error": self.last_error,
+                "poll_interval": self.poll_interval,
+                "debounce": self.debounce,
+            }
@@ -0,0 +1,413 @@
+import math
+import time
+import faiss
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8", "pq", "binary", "binary_ivf")
+
+# Types that store compressed codes instead of the float vectors; their
+# distances are approximate, so candidates can be re-ranked exactly
+LOSSY_INDEX_TYPES = ("ivf_pq", "sq_fp16", "sq_int8", "pq", "binary", "binary_ivf")
+
+# Sign-bit codes ranked by Hamming distance; always rescored against floats
+BINARY_INDEX_TYPES = ("binary", "binary_ivf")
+BINARY_CANDIDATES = 256
+
+# faiss warns when an IVF quantizer sees fewer than ~39 points per centroid
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+
+# int8 scalar quantization learns per-dimension ranges from a sample
+SQ_MIN_TRAIN = 1000
+
+# Upper bound for efSearch when an HNSW search is widened for a filter
+MAX_FILTERED_EF_SEARCH = 4096
+
+
+class BinarySignIndex:
+    """Sign-bit code per float vector (1 bit per dimension) in a faiss binary index.
+
+    Exposes the subset of the faiss.Index interface the database relies on and
+    takes float vectors, binarizing them on the way in. Distances are Hamming
+    distances, so results are only candidates for exact rescoring. Binary
+    indexes take no per-query parameters (IDSelector, nprobe) except
+    IndexBinaryFlat's selector, which is not relied upon.
+    """
+
+    def __init__(self, binary: faiss.IndexBinary):
+        self.binary = binary
+
+    @staticmethod
+    def binarize(vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    @property
+    def d(self) -> int:
+        return self.binary.d
+
+    @property
+    def ntotal(self) -> int:
+        return self.binary.ntotal
+
+    @property
+    def is_trained(self) -> bool:
+        return self.binary.is_trained
+
+    @property
+    def nlist(self) -> int:
+        return self.binary.nlist if isinstance(self.binary, faiss.IndexBinaryIVF) else 1
+
+    def train(self, vectors: np.ndarray):
+        self.binary.train(self.binarize(vectors))
+
+    def add(self, vectors: np.ndarray):
+        self.binary.add(self.binarize(vectors))
+
+    def reset(self):
+        self.binary.reset()
+
+    def search(self, vectors: np.ndarray, k: int, params=None) -> tuple:
+        distances, ids = self.binary.search(self.binarize(vectors), k)
+        return distances.astype("float32"), ids
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Rule of thumb: ~4*sqrt(n) inverted lists."""
+    return int(min(65536, max(16, 4 * math.sqrt(max(n_vectors, 1)))))
+
+
+def min_train_size(index_type: str, nlist: int) -> int:
+    """Number of vectors needed before an index of this type can be trained."""
+    if index_type == "ivf_flat":
+        return MIN_POINTS_PER_CENTROID * nlist
+    if index_type == "ivf_pq":
+        # the 8-bit PQ codebooks have 256 centroids per sub-quantizer
+        return MIN_POINTS_PER_CENTROID * max(nlist, 256)
+    if index_type == "pq":
+        return MIN_POINTS_PER_CENTROID * 256
+    if index_type == "sq_int8":
+        return SQ_MIN_TRAIN
+    if index_type == "binary_ivf":
+        return MIN_POINTS_PER_CENTROID * nlist
+    return 0
+
+
+def build_index(
+    index_type: str,
+    dim: int,
+    nlist: int = 1024,
+    pq_m: int = 64,
+    hnsw_m: int = 32,
+) -> faiss.Index:
+    """Create an empty (untrained) FAISS index for the given spec."""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+    if index_type == "ivf_pq":
+        if dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dim}")
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8)
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dim, hnsw_m)
+    if index_type == "sq_fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    if index_type == "sq_int8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    if index_type == "pq":
+        if dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the vector dimension {dim}")
+        # Exhaustive PQ scan as a single-list IVF: unlike IndexPQ it honours
+        # IDSelectors (tombstones, filters) at the cost of 8 id bytes per vector
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFPQ(quantizer, dim, 1, pq_m, 8)
+    if index_type in BINARY_INDEX_TYPES:
+        if dim % 8 != 0:
+            raise ValueError(f"binary codes need a vector dimension divisible by 8, got {dim}")
+        if index_type == "binary":
+            return BinarySignIndex(faiss.IndexBinaryFlat(dim))
+        return BinarySignIndex(faiss.IndexBinaryIVF(faiss.IndexBinaryFlat(dim), dim, nlist))
+    raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Map a (possibly loaded) FAISS index back to its spec name."""
+    if isinstance(index, BinarySignIndex):
+        return "binary_ivf" if isinstance(index.binary, faiss.IndexBinaryIVF) else "binary"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq" if index.nlist == 1 else "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    return "flat"
+
+
+def is_lossy(index: faiss.Index) -> bool:
+    return index_type_of(index) in LOSSY_INDEX_TYPES
+
+
+def is_binary(index: faiss.Index) -> bool:
+    return isinstance(index, BinarySignIndex)
+
+
+def max_train_size(index: faiss.Index) -> int:
+    """Training vectors beyond which k-means stops improving (it subsamples anyway)."""
+    centroids = index.nlist if isinstance(index, (faiss.IndexIVF, BinarySignIndex)) else 256
+    if isinstance(index, faiss.IndexIVFPQ):
+        # the PQ codebooks need their own 256 centroids' worth of samples
+        centroids = max(centroids, 256)
+    return MAX_POINTS_PER_CENTROID * centroids
+
+
+def train_and_fill(index: faiss.Index, vectors: np.ndarray, seed: int = 1234) -> faiss.Index:
+    """Train the index on a sample of `vectors` (if needed) and add all of them."""
+    if not index.is_trained:
+        max_train = max_train_size(index)
+        train = vectors
+        if vectors.shape[0] > max_train:
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(vectors.shape[0], max_train, replace=False))
+            train = vectors[rows]
+        index.train(train)
+    index.add(vectors)
+    return index
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """Recover the stored vectors (approximate for PQ-compressed indexes)."""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """Load an index; with `mmap` its vectors/codes stay in the (shared) page cache.
+
+    A memory-mapped index is read-only: use copy_index() before adding to it.
+    """
+    flags = faiss.IO_FLAG_MMAP_IFC if mmap and hasattr(faiss, "IO_FLAG_MMAP_IFC") else 0
+    with open(path, "rb") as f:
+        # Binary index files carry an "IB.." fourcc
+        binary = f.read(2) == b"IB"
+    if binary:
+        return BinarySignIndex(faiss.read_index_binary(path, flags))
+    return faiss.read_index(path, flags)
+
+
+def serialize_index(index: faiss.Index) -> np.ndarray:
+    if isinstance(index, BinarySignIndex):
+        return faiss.serialize_index_binary(index.binary)
+    return faiss.serialize_index(index)
+
+
+def copy_index(index: faiss.Index) -> faiss.Index:
+    """Deep, writable copy of an index.
+
+    faiss.clone_index would keep viewing the pages of a memory-mapped index,
+    and adding to such a view aborts the process.
+    """
+    if isinstance(index, BinarySignIndex):
+        return BinarySignIndex(faiss.deserialize_index_binary(serialize_index(index)))
+    return faiss.deserialize_index(serialize_index(index))
+
+
+def add_batches(index: faiss.Index, vectors: np.ndarray, batch_size: int = 65536) -> faiss.Index:
+    """Add a (possibly memory-mapped) matrix in bounded float32 batches."""
+    for start in range(0, vectors.shape[0], batch_size):
+        index.add(np.ascontiguousarray(vectors[start:start + batch_size], dtype="float32"))
+    return index
+
+
+def set_default_search_params(index: faiss.Index, nprobe: int, ef_search: int):
+    """Store default query-time knobs on the index itself."""
+    if isinstance(index, BinarySignIndex) and isinstance(index.binary, faiss.IndexBinaryIVF):
+        index.binary.nprobe = nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    selector: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Per-query overrides for nprobe/efSearch and an optional IDSelector.
+
+    Returns None when nothing differs from the index defaults. The caller must
+    keep `selector` alive for as long as the returned params are used.
+    """
+    if nprobe is None and ef_search is None and selector is None:
+        return None
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search if ef_search is not None else index.hnsw.efSearch)
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(nprobe if nprobe is not None else index.nprobe)
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def filtered_search_params(
+    index: faiss.Index,
+    nprobe: Optional[int],
+    ef_search: Optional[int],
+    selectivity: float,
+) -> tuple:
+    """(nprobe, ef_search) widened for a filter admitting `selectivity` of the rows.
+
+    An ANN index applies the IDSelector only inside the lists/graph nodes it
+    visits, so a selective filter otherwise returns fewer than k results.
+    """
+    widen = 1.0 / max(selectivity, 1e-9)
+    if isinstance(index, faiss.IndexIVF):
+        nprobe = min(index.nlist, math.ceil((nprobe or index.nprobe) * widen))
+    elif isinstance(index, faiss.IndexHNSW):
+        ef_search = min(MAX_FILTERED_EF_SEARCH, math.ceil((ef_search or index.hnsw.efSearch) * widen))
+    return nprobe, ef_search
+
+
+def exact_search(queries: np.ndarray, rows: np.ndarray, vectors, k: int) -> tuple:
+    """Exact top-k among a sorted array of `rows`, scored from their float vectors.
+
+    `vectors(rows)` must return the float vectors of those rows.
+    """
+    distances, positions = faiss.knn(queries, np.ascontiguousarray(vectors(rows)), min(k, len(rows)))
+    return distances, np.where(positions >= 0, rows[np.maximum(positions, 0)], -1)
+
+
+def rows_selector(rows: np.ndarray, ntotal: int) -> faiss.IDSelector:
+    """Cheapest IDSelector admitting exactly `rows` (sorted, unique) out of `ntotal`."""
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return faiss.IDSelectorRange(int(rows[0]), int(rows[-1]) + 1)
+    if len(rows) * 64 < ntotal:
+        # A hash set of a few ids is smaller than a bitmap over the whole index
+        return faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(np.ascontiguousarray(rows, dtype="int64")))
+    bitmap = np.zeros(ntotal, dtype=bool)
+    bitmap[rows] = True
+    packed = np.packbits(bitmap, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(packed), faiss.swig_ptr(packed))
+    selector.referenced_objects = [packed]
+    return selector
+
+
+def current_search_params(index: faiss.Index) -> Dict[str, Any]:
+    if isinstance(index, BinarySignIndex):
+        if isinstance(index.binary, faiss.IndexBinaryIVF):
+            return {"nprobe": index.binary.nprobe, "nlist": index.binary.nlist}
+        return {}
+    if isinstance(index, faiss.IndexHNSW):
+        return {"ef_search": index.hnsw.efSearch, "hnsw_m": index.hnsw.nb_neighbors(1)}
+    if isinstance(index, faiss.IndexIVF):
+        return {"nprobe": index.nprobe, "nlist": index.nlist}
+    return {}
+
+
+def merge_results(parts: List[tuple], k: int) -> tuple:
+    """Merge per-index (distances, ids) results into the overall top-k per query.
+
+    Ids must already be global; missing results (id -1) sort last.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    distances = np.hstack([d for d, _ in parts])
+    ids = np.hstack([i for _, i in parts])
+    distances = np.where(ids < 0, np.inf, distances)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, 1), np.take_along_axis(ids, order, 1)
+
+
+def exact_rerank(queries: np.ndarray, ids: np.ndarray, vectors, k: int) -> tuple:
+    """Re-score candidate `ids` (-1 = none) with exact L2 distances and keep the top k.
+
+    `vectors(rows)` must return the float vectors of a sorted array of unique rows.
+    """
+    valid = ids >= 0
+    rows, inverse = np.unique(ids[valid], return_inverse=True)
+    distances = np.full(ids.shape, np.inf, dtype="float32")
+    if len(rows):
+        candidates = vectors(rows)[inverse]
+        distances[valid] = ((candidates - queries[np.nonzero(valid)[0]]) ** 2).sum(axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    distances = np.take_along_axis(distances, order, 1)
+    ids = np.take_along_axis(ids, order, 1)
+    return distances, np.where(np.isinf(distances), -1, ids)
+
+
+def measure_tradeoff(
+    index: faiss.Index,
+    vectors,
+    queries: np.ndarray,
+    k: int = 10,
+) -> List[Dict[str, Any]]:
+    """Recall@k and latency of `index` against brute force over `vectors` for a sweep of nprobe/efSearch.
+
+    `vectors` is a matrix or a list of (possibly memory-mapped) matrices in row
+    order, scanned one at a time. Binary indexes are measured as they are
+    served: BINARY_CANDIDATES Hamming candidates rescored exactly.
+    """
+    chunks = vectors if isinstance(vectors, list) else [vectors]
+    offsets = np.cumsum([0] + [len(chunk) for chunk in chunks])
+    k = min(k, int(offsets[-1]))
+    start = time.perf_counter()
+    parts = []
+    for chunk, offset in zip(chunks, offsets):
+        distances, ids = faiss.knn(queries, np.ascontiguousarray(chunk, dtype="float32"), min(k, len(chunk)))
+        parts.append((distances, np.where(ids >= 0, ids + offset, -1)))
+    _, truth = merge_results(parts, k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    def gather(rows):
+        chunk_ids = np.searchsorted(offsets, rows, side="right") - 1
+        return np.concatenate([
+            chunks[c][rows[chunk_ids == c] - offsets[c]] for c in np.unique(chunk_ids)
+        ]).astype("float32", copy=False)
+
+    if isinstance(index, faiss.IndexHNSW):
+        knob, values = "ef_search", [16, 32, 64, 128, 256]
+    elif isinstance(index, (faiss.IndexIVF, BinarySignIndex)) and index.nlist > 1:
+        knob, values = "nprobe", [v for v in (1, 4, 16, 64, 256) if v <= index.nlist]
+    else:
+        knob, values = None, [None]
+
+    tradeoff = []
+    saved_nprobe = index.binary.nprobe if isinstance(index, BinarySignIndex) and knob else None
+    try:
+        for value in values:
+            start = time.perf_counter()
+            if isinstance(index, BinarySignIndex):
+                # Binary indexes take no search parameters, so nprobe is set (and restored below)
+                if knob:
+                    index.binary.nprobe = value
+                _, candidates = index.search(queries, min(BINARY_CANDIDATES, index.ntotal))
+                _, found = exact_rerank(queries, candidates, gather, k)
+            else:
+                params = search_params(index, **{knob: value}) if knob else None
+                _, found = index.search(queries, k, params=params)
+            ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+            entry = {
+                f"recall_at_{k}": round(hits / float(truth.size), 4),
+                "latency_ms": round(ann_ms, 3),
+                "flat_latency_ms": round(flat_ms, 3),
+            }
+            if knob:
+                entry[knob] = value
+            tradeoff.append(entry)
+    finally:
+        if saved_nprobe is not None:
+            index.binary.nprobe = saved_nprobe
+    return tradeoff
@@ -0,0 +1,310 @@
+import os
+import json
+import hashlib
+import queue
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+# Changes since ingest_manifest.json was last rewritten, one JSON object per line
+JOURNAL_SUFFIX = ".log"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """What every ingested file looked like and what it produced.
+
+    storage_path/ingest_manifest.json maps a file path to its size, mtime,
+    content hash and the document/chunk ids indexed from it. Entries are
+    written as soon as the store save covering a file's last chunk returns,
+    so the manifest doubles as the resume checkpoint of an interrupted run.
+
+    Each change is appended (and fsynced) to ingest_manifest.json.log. The
+    full JSON is only rewritten once the log holds as many entries as the
+    manifest, so a window costs its own entries, not the whole manifest.
+    Replaying an entry twice is harmless, so a crash between rewriting the
+    JSON and truncating the log loses nothing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.files = {}
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported ingest manifest version: {saved.get('version')}")
+            self.files = saved["files"]
+        if os.path.exists(self.journal_path):
+            good = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        break
+                    self._apply(change)
+                    self._journal_entries += len(change.get("set", ())) + len(change.get("forget", ()))
+                    good += len(line)
+            # Cut off the torn line of a crashed append, or later appends would join it
+            if good < os.path.getsize(self.journal_path):
+                os.truncate(self.journal_path, good)
+
+    def plan(self, paths: List[str], root: Optional[str] = None) -> Dict[str, Any]:
+        """Sort `paths` into unchanged, changed (with their new signatures) and deleted.
+
+        Size and mtime decide for most files; only when they differ is the
+        content hashed, so a touched-but-identical file is not re-ingested.
+        Entries under `root` whose file is gone are reported as deleted.
+        """
+        unchanged, changed, touched = [], {}, {}
+        for path in paths:
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            if self.matches(path, stat.st_size, stat.st_mtime_ns):
+                unchanged.append(path)
+                continue
+            sha256 = file_sha256(path)
+            if entry and entry["sha256"] == sha256:
+                touched[path] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                unchanged.append(path)
+            else:
+                changed[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+        deleted = self.missing(paths, root) if root is not None else []
+        if touched:
+            self.update(touched)
+        return {"unchanged": unchanged, "changed": changed, "deleted": deleted}
+
+    def matches(self, path: str, size: int, mtime_ns: int) -> bool:
+        """Whether path is recorded with this size and mtime (no hashing)."""
+        entry = self.files.get(path)
+        return bool(entry) and (entry["size"], entry["mtime_ns"]) == (size, mtime_ns)
+
+    def missing(self, paths: List[str], root: str) -> List[str]:
+        """Recorded files under root that are not among paths."""
+        prefix = os.path.join(os.path.realpath(root), "")
+        present = set(paths)
+        return [path for path in list(self.files) if path.startswith(prefix) and path not in present]
+
+    def document_ids(self, path: str) -> List[str]:
+        return list((self.files.get(path) or {}).get("document_ids", []))
+
+    def update(self, entries: Dict[str, Dict[str, Any]]):
+        self._record({"set": entries})
+
+    def forget(self, paths: List[str]):
+        self._record({"forget": list(paths)})
+
+    def _apply(self, change: Dict[str, Any]):
+        self.files.update(change.get("set", {}))
+        for path in change.get("forget", []):
+            self.files.pop(path, None)
+
+    def _record(self, change: Dict[str, Any]):
+        with self._lock:
+            self._apply(change)
+            new_journal = not os.path.exists(self.journal_path)
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(change) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if new_journal:
+                _fsync_dir(self.journal_path)
+            self._journal_entries += len(change.get("set", ())) + len(change.get("forget", ()))
+            if self._journal_entries >= max(len(self.files), 1024):
+                self._rewrite()
+
+    def _rewrite(self):
+        """Fold the journal into a fresh ingest_manifest.json (lock held)."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        os.truncate(self.journal_path, 0)
+        self._journal_entries = 0
+
+
+def _fsync_dir(path: str):
+    """Make a rename or creation in path's directory durable."""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class IngestStats:
+    """Counters of one ingest run, filled in by its stages and summarized at the end.
+
+    Each counter has a single writer (the stage that owns it), so no lock is
+    needed; read them once the stages have finished.
+    """
+
+    def __init__(self, skipped: int = 0, deleted: int = 0):
+        self.start = time.perf_counter()
+        self.skipped = skipped      # unchanged files, not loaded
+        self.deleted = deleted      # files gone from disk, their vectors dropped
+        self.loaded = 0
+        self.failed = 0
+        self.pages = 0              # one Document per PDF page, one per row/file otherwise
+        self.chunks = 0
+
+    def count_loaded(self, loaded: Iterable) -> Iterator:
+        """Pass (path, documents, error) results through, counting files and pages."""
+        for path, documents, error in loaded:
+            if error is not None:
+                self.failed += 1
+            else:
+                self.loaded += 1
+                self.pages += len(documents)
+            yield path, documents, error
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (
+            f"Indexed {self.chunks} chunks from {self.loaded} files in {elapsed:.1f}s "
+            f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s); "
+            f"{self.skipped} unchanged, {self.failed} failed, {self.deleted} deleted"
+        )
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+def bounded_stage(items: Iterable, maxsize: int = 2, name: str = "ingest-stage") -> Iterator:
+    """Run the generator `items` in its own thread, handing results over a bounded queue.
+
+    At most `maxsize` results wait for the consumer, so chained stages overlap
+    without any of them running ahead of memory. An exception in the stage is
+    re-raised in the consumer; a consumer that stops early stops the stage.
+    """
+    handoff = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            # Let upstream stages see the stop too
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ChunkWindow:
+    """A bounded batch of chunks on its way to the embedder and the store."""
+
+    def __init__(
+        self,
+        chunks: List[Any],
+        new_document_ids: List[str],
+        completed_files: List[tuple],
+        failed_files: Optional[List[tuple]] = None,
+    ):
+        self.chunks = chunks
+        self.new_document_ids = new_document_ids      # documents whose first chunk is in this window
+        self.completed_files = completed_files        # (path, document_ids, chunk_ids) of files ending here
+        self.failed_files = failed_files or []        # (path, error) of files that failed to load since the last window
+
+
+def chunk_windows(chunker, loaded: Iterable, window_chunks: int) -> Iterator[ChunkWindow]:
+    """Chunk (path, documents, error) results into windows of at most window_chunks chunks.
+
+    A large file spans several windows; it is only complete in the window
+    holding its last chunk. Files that failed to load are reported with the
+    next window and skipped.
+    """
+    buffer = []
+    failed = []
+    file_ends = deque()   # (path, chunk count at the end of the file, document ids, chunk ids), in order
+    total = emitted = 0
+    seen_documents = set()
+
+    def take(n: int) -> ChunkWindow:
+        nonlocal emitted
+        chunks = buffer[:n]
+        del buffer[:n]
+        emitted += n
+        completed = []
+        while file_ends and file_ends[0][1] <= emitted:
+            path, _, document_ids, chunk_ids = file_ends.popleft()
+            completed.append((path, document_ids, chunk_ids))
+        new_document_ids = []
+        for chunk in chunks:
+            document_id = chunk.metadata.get("document_id", "unknown")
+            if document_id not in seen_documents:
+                seen_documents.add(document_id)
+                new_document_ids.append(document_id)
+        window = ChunkWindow(chunks, new_document_ids, completed, list(failed))
+        failed.clear()
+        return window
+
+    for path, documents, error in loaded:
+        if error is not None:
+            print(f"Failed to load {path}: {error}")
+            failed.append((path, error))
+            continue
+        chunks = chunker.chunk(documents) if documents else []
+        buffer.extend(chunks)
+        total += len(chunks)
+        file_ends.append((
+            path,
+            total,
+            list(dict.fromkeys(chunk.metadata.get("document_id", "unknown") for chunk in chunks)),
+            [chunk.metadata.get("chunk_id", "unknown") for chunk in chunks],
+        ))
+        while len(buffer) >= window_chunks:
+            yield take(window_chunks)
+    if buffer or file_ends or failed:
+        yield take(len(buffer))
@@ -0,0 +1,247 @@
+import numpy as np
+from typing import List, Dict, Any, Iterable, Optional
+
+
+_REMOVED = object()
+
+
+class LayeredDict:
+    """A copy-on-write dict: frozen layers shared between copies, plus its own top.
+
+    copy() freezes the top into the shared layers instead of copying entries,
+    so a writer deriving the next snapshot's lookups pays for the keys it
+    touches, not for the corpus. Layers of similar size are merged as they
+    pile up (like a binary counter), so there are O(log n) of them and each
+    entry is re-copied O(log n) times overall. A dict that has been copied
+    must not be modified again, which is how published lookups are treated.
+    """
+
+    __slots__ = ("_layers", "_top", "_len")
+
+    def __init__(self, layers: tuple = (), length: int = 0):
+        self._layers = layers   # oldest first; never modified once shared
+        self._top = {}
+        self._len = length
+
+    def copy(self) -> "LayeredDict":
+        layers = self._layers + (self._top,) if self._top else self._layers
+        while len(layers) > 1 and len(layers[-2]) <= 2 * len(layers[-1]):
+            merged = dict(layers[-2])
+            merged.update(layers[-1])
+            if len(layers) == 2:
+                # Nothing older left to shadow
+                merged = {key: value for key, value in merged.items() if value is not _REMOVED}
+            layers = layers[:-2] + (merged,)
+        return LayeredDict(layers, self._len)
+
+    def get(self, key, default=None):
+        value = _REMOVED
+        for layer in (self._top,) + self._layers[::-1]:
+            if key in layer:
+                value = layer[key]
+                break
+        return default if value is _REMOVED else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _REMOVED) is not _REMOVED
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._top[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._top[key] = _REMOVED
+        self._len -= 1
+
+    def pop(self, key, default=None):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            return default
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            self[key] = value = default
+        return value
+
+    def items(self):
+        merged = {}
+        for layer in self._layers + (self._top,):
+            merged.update(layer)
+        return [(key, value) for key, value in merged.items() if value is not _REMOVED]
+
+    def __iter__(self):
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self) -> int:
+        return self._len
+
+
+def _layered(mapping) -> LayeredDict:
+    """Copy-on-write copy of a LayeredDict or a plain dict (which becomes a shared base)."""
+    return mapping.copy() if isinstance(mapping, LayeredDict) else LayeredDict((mapping,), len(mapping))
+
+
+class MetadataLookups:
+    """Secondary indexes over chunk metadata: chunk id, document, source and tags -> rows.
+
+    Only live rows are indexed. Instances that belong to a published snapshot
+    are never mutated; writers work on a copy() and publish that instead, so
+    every row list is replaced rather than appended to in place.
+    """
+
+    def __init__(
+        self,
+        chunk_rows: Optional[Dict[str, int]] = None,
+        document_rows: Optional[Dict[str, List[int]]] = None,
+        source_documents: Optional[Dict[str, str]] = None,
+        tag_rows: Optional[Dict[str, Dict[str, List[int]]]] = None,
+    ):
+        self.chunk_rows = chunk_rows if chunk_rows is not None else {}              # chunk_id -> row
+        self.document_rows = document_rows if document_rows is not None else {}     # document_id -> rows
+        self.source_documents = source_documents if source_documents is not None else {}  # source -> document_id
+        self.tag_rows = tag_rows if tag_rows is not None else {}                    # tag -> value -> rows
+
+    def copy(self) -> "MetadataLookups":
+        """Copy-on-write copy (see LayeredDict); row lists are shared until replaced."""
+        return MetadataLookups(
+            _layered(self.chunk_rows),
+            _layered(self.document_rows),
+            _layered(self.source_documents),
+            {tag: _layered(values) for tag, values in self.tag_rows.items()},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dictionaries, for pickling."""
+        return {
+            "chunk_rows": dict(self.chunk_rows.items()),
+            "document_rows": dict(self.document_rows.items()),
+            "source_documents": dict(self.source_documents.items()),
+            "tag_rows": {tag: dict(values.items()) for tag, values in self.tag_rows.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, lookups: Dict[str, Any]) -> "MetadataLookups":
+        return cls(
+            lookups.get("chunk_rows", {}),
+            lookups.get("document_rows", {}),
+            lookups.get("source_documents", {}),
+            lookups.get("tag_rows", {}),
+        )
+
+    def add_rows(self, start_row: int, metadata: Iterable[Dict[str, Any]], deleted: np.ndarray):
+        """Fold new metadata rows (numbered from `start_row`) into the lookups."""
+        new_document_rows = {}
+        new_tag_rows = {}
+        for row, meta in enumerate(metadata, start=start_row):
+            if deleted[row]:
+                continue
+            # Duplicate chunk ids keep pointing at their first (live) row
+            self.chunk_rows.setdefault(meta.get("chunk_id"), row)
+            if "document_id" in meta:
+                new_document_rows.setdefault(meta["document_id"], []).append(row)
+                if "source" in meta:
+                    self.source_documents.setdefault(meta["source"], meta["document_id"])
+            for tag_value in tag_items(meta.get("tags")):
+                new_tag_rows.setdefault(tag_value, []).append(row)
+
+        for document_id, rows in new_document_rows.items():
+            self.document_rows[document_id] = self.document_rows.get(document_id, []) + rows
+        for (tag, value), rows in new_tag_rows.items():
+            values = self.tag_rows.setdefault(tag, {})
+            values[value] = values.get(value, []) + rows
+
+    def forget_rows(self, rows: Iterable[int], metadata):
+        """Remove tombstoned rows; `metadata` resolves a row to its metadata dict."""
+        dead_by_document = {}
+        dead_by_tag = {}
+        for row in rows:
+            meta = metadata.get(row, include_text=False)
+            if self.chunk_rows.get(meta["chunk_id"]) == row:
+                del self.chunk_rows[meta["chunk_id"]]
+            dead_by_document.setdefault(meta["document_id"], (meta["source"], set()))[1].add(row)
+            for tag_value in tag_items(meta.get("tags")):
+                dead_by_tag.setdefault(tag_value, set()).add(row)
+
+        for (tag, value), dead in dead_by_tag.items():
+            values = self.tag_rows.get(tag, {})
+            live = [row for row in values.get(value, []) if row not in dead]
+            if live:
+                values[value] = live
+            else:
+                values.pop(value, None)
+
+        for document_id, (source, dead) in dead_by_document.items():
+            live = [row for row in self.document_rows.get(document_id, []) if row not in dead]
+            if live:
+                self.document_rows[document_id] = live
+                # Surviving duplicates of a forgotten chunk take over its id
+                for row in live:
+                    chunk_id = metadata.get(row, include_text=False)["chunk_id"]
+                    self.chunk_rows.setdefault(chunk_id, row)
+            else:
+                self.document_rows.pop(document_id, None)
+                if self.source_documents.get(source) == document_id:
+                    del self.source_documents[source]
+
+    def filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Live rows matching every key of `filter`, sorted.
+
+        Keys are "document_id", "source" or a tag name; a value may be a single
+        value or a list of alternatives.
+        """
+        matched = None
+        for key, wanted in filter.items():
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            rows = set()
+            for value in values:
+                if key == "document_id":
+                    rows.update(self.document_rows.get(value, []))
+                elif key == "source":
+                    rows.update(self.document_rows.get(self.source_documents.get(value), []))
+                else:
+                    rows.update(self.tag_rows.get(key, {}).get(str(value), []))
+            matched = rows if matched is None else matched & rows
+            if not matched:
+                break
+        return np.array(sorted(matched or ()), dtype="int64")
+
+    def distinct_chunk_rows(self, document_id: str, metadata) -> List[int]:
+        """A document's rows, skipping repeats of an already-seen chunk id."""
+        return [
+            i for i in self.document_rows.get(document_id, [])
+            if self.chunk_rows.get(metadata.get(i, include_text=False)["chunk_id"]) == i
+        ]
+
+
+def tag_items(tags: Optional[Dict[str, Any]]) -> List[tuple]:
+    """(tag, value) pairs of a chunk's tags; list values contribute one pair each."""
+    items = []
+    for tag, value in (tags or {}).items():
+        for item in (value if isinstance(value, (list, tuple)) else [value]):
+            items.append((tag, str(item)))
+    return items
+
+
+def matches_filter(meta: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Whether one chunk's metadata passes `filter` (the keys and values of filter_rows)."""
+    tags = set(tag_items(meta.get("tags")))
+    for key, wanted in filter.items():
+        values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        if key in ("document_id", "source"):
+            if meta.get(key) not in values:
+                return False
+        elif not any((key, str(value)) in tags for value in values):
+            return False
+    return True
@@ -0,0 +1,334 @@
+import os
+import json
+import bisect
+import numpy as np
+from typing import List, Dict, Any, Iterator, Optional
+
+
+# Fixed-width row layout; strings that repeat per document live in string tables
+# and chunk text lives in one append-only UTF-8 blob addressed by offset/length.
+ROW_DTYPE = np.dtype([
+    ("chunk_id", "S64"),
+    ("document_id", "<i4"),
+    ("source", "<i4"),
+    ("chunk_index", "<i4"),
+    ("total_chunks", "<i4"),
+    ("text_offset", "<i8"),
+    ("text_length", "<i4"),
+    ("tags", "<i4"),
+])
+
+# Tags are stored as canonical JSON, so chunks sharing a tag set share one entry
+STRING_COLUMNS = ("document_id", "source", "tags")
+
+ROWS_FILE = "rows.npy"
+TEXT_FILE = "text.bin"
+STRINGS_FILE = "strings.json"
+
+
+class MetadataStore:
+    """Columnar chunk metadata with a memory-mapped text blob.
+
+    Rows read back as plain dicts (the shape the pipeline always used), but
+    chunk text is only decoded for the rows that are actually accessed.
+    """
+
+    def __init__(self):
+        self._rows = np.empty(0, ROW_DTYPE)      # persisted rows, memory-mapped after open()
+        self._text = b""                        # persisted text blob, memory-mapped after open()
+        self._tail = np.empty(0, ROW_DTYPE)     # rows added since the last save
+        self._tail_len = 0
+        self._tail_text = bytearray()
+        self._strings = {name: [] for name in STRING_COLUMNS}
+        self._string_ids = {name: {} for name in STRING_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self._rows) + self._tail_len
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.get(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_rows()
+
+    def _intern(self, column: str, value: str) -> int:
+        ids = self._string_ids[column]
+        if value not in ids:
+            ids[value] = len(self._strings[column])
+            self._strings[column].append(value)
+        return ids[value]
+
+    def _record(self, row: int):
+        if row < 0:
+            row += len(self)
+        if row < len(self._rows):
+            return self._rows[row]
+        if row < len(self):
+            return self._tail[row - len(self._rows)]
+        raise IndexError(f"metadata row {row} out of range")
+
+    def _read_text(self, offset: int, length: int) -> str:
+        persisted = len(self._text)
+        if offset < persisted:
+            return bytes(self._text[offset:offset + length]).decode("utf-8")
+        start = offset - persisted
+        return bytes(self._tail_text[start:start + length]).decode("utf-8")
+
+    def get(self, row: int, include_text: bool = True) -> Dict[str, Any]:
+        record = self._record(row)
+        meta = {
+            "source": self._strings["source"][record["source"]],
+            "document_id": self._strings["document_id"][record["document_id"]],
+            "chunk_id": record["chunk_id"].decode("utf-8"),
+            "chunk_index": int(record["chunk_index"]),
+            "total_chunks": int(record["total_chunks"]),
+            "tags": json.loads(self._strings["tags"][record["tags"]]),
+        }
+        if include_text:
+            meta["text"] = self._read_text(int(record["text_offset"]), int(record["text_length"]))
+        return meta
+
+    def iter_rows(self, include_text: bool = True) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self.get(row, include_text=include_text)
+
+    def extend(self, metadata: List[Dict[str, Any]]):
+        needed = self._tail_len + len(metadata)
+        if needed > len(self._tail):
+            grown = np.empty(max(needed, 2 * len(self._tail), 1024), ROW_DTYPE)
+            grown[:self._tail_len] = self._tail[:self._tail_len]
+            self._tail = grown
+
+        for meta in metadata:
+            chunk_id = str(meta.get("chunk_id", "unknown")).encode("utf-8")
+            if len(chunk_id) > ROW_DTYPE["chunk_id"].itemsize:
+                raise ValueError(f"chunk_id too long for metadata store: {chunk_id!r}")
+            text = str(meta.get("text", "")).encode("utf-8")
+            self._tail[self._tail_len] = (
+                chunk_id,
+                self._intern("document_id", str(meta.get("document_id", "unknown"))),
+                self._intern("source", str(meta.get("source", "unknown"))),
+                int(meta.get("chunk_index", 0)),
+                int(meta.get("total_chunks", 1)),
+                len(self._text) + len(self._tail_text),
+                len(text),
+                self._intern("tags", json.dumps(meta.get("tags") or {}, sort_keys=True)),
+            )
+            self._tail_text.extend(text)
+            self._tail_len += 1
+
+    def write(self, path: str):
+        """Append new text to the blob and atomically replace the row and string files."""
+        os.makedirs(path, exist_ok=True)
+
+        # Text first: rows written below only ever point at bytes already on disk
+        text_path = os.path.join(path, TEXT_FILE)
+        with open(text_path, "ab") as f:
+            # Drop bytes past what our rows know about (a fresh store, or a crashed save)
+            f.truncate(len(self._text))
+            f.write(self._tail_text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # String tables only grow, so writing them before the rows keeps every
+        # persisted row resolvable even if we crash in between
+        _atomic_write(
+            os.path.join(path, STRINGS_FILE),
+            lambda f: f.write(json.dumps(self._strings).encode("utf-8")),
+        )
+        rows = np.concatenate([self._rows, self._tail[:self._tail_len]])
+        _atomic_write(os.path.join(path, ROWS_FILE), lambda f: np.save(f, rows))
+
+    def open(self, path: str):
+        """Memory-map a saved store; nothing but the string tables is read eagerly."""
+        rows_path = os.path.join(path, ROWS_FILE)
+        text_path = os.path.join(path, TEXT_FILE)
+        rows = np.load(rows_path, mmap_mode="r")
+        if os.path.getsize(text_path):
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self._text = b""
+        with open(os.path.join(path, STRINGS_FILE)) as f:
+            self._strings = json.load(f)
+        for name in STRING_COLUMNS:
+            self._strings.setdefault(name, [])
+        self._string_ids = {
+            name: {value: i for i, value in enumerate(values)}
+            for name, values in self._strings.items()
+        }
+        if rows.dtype != ROW_DTYPE:
+            # Stores written before a column existed are upgraded in memory
+            upgraded = np.zeros(len(rows), ROW_DTYPE)
+            for name in rows.dtype.names:
+                upgraded[name] = rows[name]
+            if "tags" not in rows.dtype.names:
+                upgraded["tags"] = self._intern("tags", "{}")
+            rows = upgraded
+        self._rows = rows
+        self._tail = np.empty(0, ROW_DTYPE)
+        self._tail_len = 0
+        self._tail_text = bytearray()
+
+    @staticmethod
+    def merge(
+        stores: List["MetadataStore"],
+        path: str,
+        keep: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> "MetadataStore":
+        """Concatenate saved stores into a new store at `path` without decoding any text.
+
+        `keep` optionally gives one boolean row mask per store; rows masked out
+        (deleted chunks) are dropped together with their text.
+        """
+        os.makedirs(path, exist_ok=True)
+        merged = MetadataStore()
+        parts = []
+        text_size = 0
+        with open(os.path.join(path, TEXT_FILE), "wb") as text_out:
+            for i, store in enumerate(stores):
+                rows = np.array(store._rows)
+                mask = keep[i] if keep is not None else None
+                if mask is not None and not mask.all():
+                    rows = rows[mask]
+                    # Copy only the surviving rows' text, packing it contiguously
+                    for row in rows:
+                        start = int(row["text_offset"])
+                        text_out.write(store._text[start:start + int(row["text_length"])])
+                    lengths = rows["text_length"].astype(np.int64)
+                    rows["text_offset"] = text_size + np.cumsum(lengths) - lengths
+                    text_size += int(lengths.sum())
+                else:
+                    text_out.write(store._text)
+                    rows["text_offset"] += text_size
+                    text_size += len(store._text)
+
+                # Re-intern only the strings surviving rows still reference
+                for name in STRING_COLUMNS:
+                    remap = np.zeros(len(store._strings[name]), dtype=np.int32)
+                    for old_id in np.unique(rows[name]):
+                        remap[old_id] = merged._intern(name, store._strings[name][old_id])
+                    if len(rows):
+                        rows[name] = remap[rows[name]]
+                parts.append(rows)
+            text_out.flush()
+            os.fsync(text_out.fileno())
+
+        _atomic_write(
+            os.path.join(path, STRINGS_FILE),
+            lambda f: f.write(json.dumps(merged._strings).encode("utf-8")),
+        )
+        rows = np.concatenate(parts) if parts else np.empty(0, ROW_DTYPE)
+        _atomic_write(os.path.join(path, ROWS_FILE), lambda f: np.save(f, rows))
+        merged.open(path)
+        return merged
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(
+            os.path.exists(os.path.join(path, name))
+            for name in (ROWS_FILE, TEXT_FILE, STRINGS_FILE)
+        )
+
+
+class MetadataView:
+    """Read-only, fixed-length view over sealed stores plus a prefix of a tail.
+
+    The parts are only ever appended to (or replaced wholesale by their owner),
+    so a view stays valid and unchanged while writers keep extending the store.
+    """
+
+    def __init__(
+        self,
+        segments: Optional[List[MetadataStore]] = None,
+        offsets: Optional[List[int]] = None,
+        tail: Optional[MetadataStore] = None,
+        length: int = 0,
+    ):
+        self._segments = segments or []
+        self._offsets = offsets or [0]
+        self._tail = tail
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.get(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_rows()
+
+    def get(self, row: int, include_text: bool = True) -> Dict[str, Any]:
+        if row < 0:
+            row += self._length
+        if not 0 <= row < self._length:
+            raise IndexError(f"metadata row {row} out of range")
+        offsets = self._offsets
+        if row >= offsets[-1]:
+            return self._tail.get(row - offsets[-1], include_text=include_text)
+        part = bisect.bisect_right(offsets, row) - 1
+        return self._segments[part].get(row - offsets[part], include_text=include_text)
+
+    def iter_rows(self, start: int = 0, include_text: bool = True) -> Iterator[Dict[str, Any]]:
+        for row in range(start, self._length):
+            yield self.get(row, include_text=include_text)
+
+
+class SegmentedMetadataStore:
+    """Row-wise concatenation of sealed per-segment stores plus one writable tail.
+
+    Global row numbers match the order vectors were added to the FAISS index.
+    Readers should go through view(), which is not affected by later writes.
+    """
+
+    def __init__(self, segments: Optional[List[MetadataStore]] = None):
+        self.tail = MetadataStore()
+        self.set_segments(segments or [])
+
+    def set_segments(self, segments: List[MetadataStore]):
+        offsets = [0]
+        for store in segments:
+            offsets.append(offsets[-1] + len(store))
+        self._parts = (list(segments), offsets)
+
+    @property
+    def segments(self) -> List[MetadataStore]:
+        return self._parts[0]
+
+    def seal(self, store: MetadataStore):
+        """Replace the tail with `store` (its saved copy) and start a new, empty tail."""
+        segments, _ = self._parts
+        self.set_segments(segments + [store])
+        self.tail = MetadataStore()
+
+    def view(self) -> MetadataView:
+        """Freeze the current rows; the tail is shared, since it is append-only."""
+        segments, offsets = self._parts
+        return MetadataView(segments, offsets, self.tail, offsets[-1] + len(self.tail))
+
+    def __len__(self) -> int:
+        return self._parts[1][-1] + len(self.tail)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.get(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_rows()
+
+    def get(self, row: int, include_text: bool = True) -> Dict[str, Any]:
+        return self.view().get(row, include_text=include_text)
+
+    def iter_rows(self, start: int = 0, include_text: bool = True) -> Iterator[Dict[str, Any]]:
+        return self.view().iter_rows(start, include_text=include_text)
+
+    def extend(self, metadata: List[Dict[str, Any]]):
+        self.tail.extend(metadata)
+
+
+def _atomic_write(path: str, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
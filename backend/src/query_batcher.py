@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Any
+
+
+def _bucket(value: int) -> str:
+    """Power-of-two histogram bucket: 1, 2, 3-4, 5-8, ..."""
+    upper = 1
+    while upper < value:
+        upper *= 2
+    return str(upper) if upper <= 2 else f"{upper // 2 + 1}-{upper}"
+
+
+def _sorted_buckets(histogram: Dict[str, int]) -> Dict[str, int]:
+    return dict(sorted(histogram.items(), key=lambda item: int(item[0].split("-")[-1])))
+
+
+class QueryBatcher:
+    """Cross-request micro-batching of query embeddings.
+
+    Request threads call embed() and block on a future; one worker thread
+    drains the queue into a single encode_fn call of up to max_batch_size
+    queries. A lone query is dispatched as soon as nothing else is queued
+    within max_wait_ms, so an idle server answers almost as fast as a direct
+    forward pass, while queries that pile up behind a busy encoder share the
+    next one.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.max_queue_depth = 0
+        self.batch_size_histogram = {}
+        self.queue_depth_histogram = {}
+
+    def _ensure_worker(self):
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._worker.start()
+
+    def embed(self, text: str) -> np.ndarray:
+        """The (dim,) float32 embedding of one query, computed in a shared batch."""
+        if not text or not text.strip():
+            raise ValueError("Text cannot be empty")
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take whatever is already queued, then wait out the window
+                timeout = max(0.0, deadline - time.monotonic())
+                item = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._record(len(batch), self._queue.qsize() + len(batch))
+                texts = [text for text, _ in batch]
+                try:
+                    vectors = self.encode_fn(texts)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                else:
+                    for (_, future), vector in zip(batch, vectors):
+                        future.set_result(vector)
+            if stop:
+                return
+
+    def _record(self, batch_size: int, queue_depth: int):
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += batch_size
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+            size_bucket = _bucket(batch_size)
+            depth_bucket = _bucket(queue_depth)
+            self.batch_size_histogram[size_bucket] = self.batch_size_histogram.get(size_bucket, 0) + 1
+            self.queue_depth_histogram[depth_bucket] = self.queue_depth_histogram.get(depth_bucket, 0) + 1
+
+    def close(self):
+        """Finish queued queries and stop the worker thread."""
+        with self._start_lock:
+            if self._worker is not None and self._worker.is_alive():
+                self._queue.put(None)
+                self._worker.join()
+            self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "queries": self.queries,
+                "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                # bucket -> count; queue depth is sampled when a batch is taken
+                "batch_size_histogram": _sorted_buckets(self.batch_size_histogram),
+                "queue_depth_histogram": _sorted_buckets(self.queue_depth_histogram),
+            }
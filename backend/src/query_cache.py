@@ -0,0 +1,115 @@
+import re
+import time
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Optional
+
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key of a query, without trailing ?!.
+
+    "Best fertilizer for wheat?" and "best  fertilizer for WHEAT" share one key.
+    Only case (casefold), Unicode composition (NFC), whitespace and trailing
+    ?!. are normalized: combining marks (Devanagari vowel signs) and inner
+    punctuation ("pH 5.5") change meaning. Queries that are nothing but
+    punctuation keep their casefolded text.
+    """
+    folded = _WHITESPACE.sub(" ", unicodedata.normalize("NFC", query).casefold()).strip()
+    return _TRAILING_PUNCTUATION.sub("", folded) or folded
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query vectors with an optional time-to-live.
+
+    Keys are normalized query text (see normalize_query); the original text of
+    the first phrasing that misses is what gets embedded, so the model never
+    sees a mangled query. Safe to share between request threads; a miss is computed outside the lock
+    so a slow forward pass never blocks hits.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 3600):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()   # normalized query -> (expires_at, vector)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        """Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _put(self, key: str, vector: np.ndarray):
+        """Caller holds the lock."""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self._entries[key] = (expires_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(
+        self,
+        queries: List[str],
+        embed_fn: Callable[[List[str]], np.ndarray],
+    ) -> np.ndarray:
+        """(len(queries), dim) float32 vectors; misses are embedded with one embed_fn call."""
+        keys = [normalize_query(query) for query in queries]
+        with self._lock:
+            vectors = {key: self._get(key) for key in keys}
+            missing = {}   # key -> the first original phrasing of it in this call
+            for key, query in zip(keys, queries):
+                if vectors[key] is None:
+                    missing.setdefault(key, query)
+            hits = sum(vectors[key] is not None for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        if missing:
+            embedded = np.asarray(embed_fn(list(missing.values())), dtype="float32")  # no copy for float32 input
+            embedded.setflags(write=False)  # rows are handed out to every caller
+            with self._lock:
+                for key, vector in zip(missing, embedded):
+                    self._put(key, vector)
+                    vectors[key] = vector
+        return np.stack([vectors[key] for key in keys])
+
+    def get(self, query: str, embed_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        return self.get_many([query], embed_fn)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,10 +1,21 @@
 
-from typing import List, Dict, Any
+import os
+import shutil
+import threading
+from typing import List, Dict, Any, Optional
 from langchain.schema import Document
+import faiss
 import numpy as np
 from .text_chunker import TextChunker
 from .embeddings import DocumentEmbedder
+from .embedding_cache import EmbeddingCache
+from .query_cache import QueryEmbeddingCache
+from .query_batcher import QueryBatcher
+from .reduction import EmbeddingReducer, open_reducer
+from .ingest import MANIFEST_FILE, IngestManifest, IngestStats, bounded_stage, chunk_windows, file_sha256
 from .vector_db import VectorDatabase
+from .lookups import matches_filter
+from .sharded_vector_db import ShardedVectorDatabase
 from .llm.groq_model import get_groq_client
 from langchain.schema import Document
 
@@ -18,41 +29,346 @@ class RAGPipeline:
         chunker,     
         embedder,    
         vector_db,   
-        llm          
+        llm,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        query_batcher: Optional[QueryBatcher] = None,
+        reducer: Optional[EmbeddingReducer] = None,
+        parse_cache=None
     ):
      
         self.chunker = chunker
         self.embedder = embedder
         self.vector_db = vector_db
         self.llm = llm
+        # Shared by answer(), retrieve_many() and every get_retriever() instance
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        # Concurrent single-query requests share one forward pass
+        self.query_batcher = query_batcher if query_batcher is not None else QueryBatcher(embedder.encode_queries)
+        # Optional PCA/truncation applied to documents and queries alike (see open_reducer)
+        self.reducer = reducer
+        self._reducer_lock = threading.RLock()
+        # Optional data_loaders.ParsedTextCache: re-indexing skips parsing files seen before
+        self.parse_cache = parse_cache
+        # Which files produced which documents; shared by every file-based ingest path
+        self.ingest_manifest = IngestManifest(os.path.join(vector_db.storage_path, MANIFEST_FILE))
+        self._ingest_lock = threading.RLock()
+        # source -> realpath, resolved once per source rather than per index_files call
+        self._resolved_sources = {}
         print("RAGPipeline initialized (Chunker → Embedder → VectorDB → LLM)")
     
-    def load_and_index_documents(self, data_dir: str):
-       
-        from .data_loaders import load_all_documents
+    def load_and_index_documents(
+        self,
+        data_dir: str,
+        window_chunks: int = 512,
+        workers: Optional[int] = None,
+        force: bool = False
+    ) -> int:
+        # Incremental: the ingest manifest (size, mtime, content hash and ids per
+        # file) lets a re-index skip unchanged files, re-ingest modified ones and
+        # drop the vectors of deleted ones; force=True re-ingests everything.
+        # Changed files stream load -> chunk -> embed -> add through bounded
+        # queues, so only a few windows of window_chunks chunks are in memory at
+        # a time. Returns the number of chunks indexed.
+        from .data_loaders import scan_files, iter_loaded_files
         
-        print(f"Loading documents from: {data_dir}")
-        documents = load_all_documents(data_dir)
-        self.index_documents(documents)
-        return len(documents)
-    
-    def index_documents(self, documents: List[Document]):
-      
-        if not documents:
-            print("No documents to index")
-            return
+        with self._ingest_lock:
+            manifest = self.ingest_manifest
+            files = scan_files(data_dir)
+            plan = manifest.plan(files, root=data_dir)
+            changed = self._with_unchanged(plan) if force else plan["changed"]
+            print(f"Re-indexing {data_dir}: {len(changed)} new or modified, "
+                  f"{len(files) - len(changed)} unchanged, {len(plan['deleted'])} deleted")
+            
+            self.forget_files(plan["deleted"])
+            
+            todo = [path for path in files if path in changed]
+            stats = IngestStats(skipped=len(files) - len(todo), deleted=len(plan["deleted"]))
+            loaded = bounded_stage(
+                stats.count_loaded(iter_loaded_files(todo, workers, cache=self.parse_cache, signatures=changed)), name="ingest-load"
+            )
+            windows = bounded_stage(chunk_windows(self.chunker, loaded, window_chunks), name="ingest-chunk")
+            embedded = bounded_stage(
+                ((window, self._embed_chunks(window.chunks) if window.chunks else None) for window in windows),
+                name="ingest-embed"
+            )
+            
+            for window, embeddings in embedded:
+                # Documents a modified file no longer produces (e.g. it now parses empty)
+                dropped = [
+                    document_id
+                    for path, document_ids, _ in window.completed_files
+                    for document_id in set(manifest.document_ids(path)) - set(document_ids)
+                ]
+                if window.chunks:
+                    # A document's first window replaces its previous version
+                    self._store_chunks(window.new_document_ids + dropped, embeddings, self._chunk_metadata(window.chunks))
+                elif dropped:
+                    self._delete_documents(dropped)
+                if window.chunks or dropped:
+                    self.vector_db.save()
+                    stats.chunks += len(window.chunks)
+                    print(f" Indexed {stats.chunks} chunks so far")
+                # Recorded only once saved, so an interrupted run resumes from here
+                entries = {
+                    path: _manifest_entry(changed[path], document_ids, chunk_ids)
+                    for path, document_ids, chunk_ids in window.completed_files
+                }
+                entries.update({
+                    path: _failure_entry(changed[path], manifest.files.get(path), error)
+                    for path, error in window.failed_files
+                })
+                if entries:
+                    manifest.update(entries)
+            # The whole run is in: a PCA still short of train_rows trains on what it holds
+            self.release_held_chunks(final=True)
         
-        print(f"Indexing {len(documents)} documents...")
+        print(f" {stats.summary()}")
+        return stats.chunks
+    
+    def index_files(
+        self,
+        paths: List[str],
+        tags: Optional[Dict[str, Any]] = None,
+        force: bool = False
+    ) -> Dict[str, Any]:
+        # Loads and indexes individual files through index_documents and records
+        # them in the ingest manifest, so a directory re-index (or the folder
+        # watcher) does not ingest them again. Unchanged files, including ones that
+        # failed to load as they are now, are skipped unless force=True. Returns
+        # the indexed, skipped and failed files and the chunk count.
+        from .data_loaders import iter_loaded_files
         
-        chunks = self.chunker.chunk(documents)
-        print(f" Chunked into {len(chunks)} pieces")
+        paths = [os.path.realpath(path) for path in paths]
+        with self._ingest_lock:
+            plan = self.ingest_manifest.plan(paths)
+            changed = self._with_unchanged(plan) if force else plan["changed"]
+            
+            documents, failed = [], {}
+            for path, loaded, error in iter_loaded_files(
+                [path for path in paths if path in changed], workers=1, cache=self.parse_cache, signatures=changed
+            ):
+                if error is not None:
+                    print(f"Failed to load {path}: {error}")
+                    failed[path] = error
+                    continue
+                documents.extend(loaded)
+            indexed = [path for path in paths if path in changed and path not in failed]
+            
+            chunks = self.index_documents(documents, replace_existing=True, tags=tags)
+            produced = {path: ([], []) for path in indexed}
+            for chunk in chunks:
+                document_ids, chunk_ids = produced.get(os.path.realpath(chunk.metadata.get("source", "")), ([], []))
+                if chunk.metadata.get("document_id", "unknown") not in document_ids:
+                    document_ids.append(chunk.metadata.get("document_id", "unknown"))
+                chunk_ids.append(chunk.metadata.get("chunk_id", "unknown"))
+            
+            # Documents the files no longer produce, including ones indexed under
+            # another spelling of the same path before the manifest existed
+            by_path = {}
+            for source in self.vector_db.get_existing_sources():
+                by_path.setdefault(self._resolve_source(source), []).append(self.vector_db.get_document_id_for_source(source))
+            dropped = [
+                document_id
+                for path in indexed
+                for document_id in set(self.ingest_manifest.document_ids(path) + by_path.get(path, [])) - set(produced[path][0])
+            ]
+            if dropped:
+                self._delete_documents(dropped)
+                self.vector_db.save()
+            
+            entries = {path: _manifest_entry(changed[path], *produced[path]) for path in indexed}
+            # A file that fails to load is retried once its size or mtime changes
+            entries.update({
+                path: _failure_entry(changed[path], self.ingest_manifest.files.get(path), error)
+                for path, error in failed.items()
+            })
+            self.ingest_manifest.update(entries)
         
-        texts = [chunk.page_content for chunk in chunks]
-        embeddings = self.embedder.embed_texts(texts)
-        embeddings_array = np.array(embeddings).astype('float32')
+        return {
+            "indexed_files": indexed,
+            "skipped_files": [path for path in paths if path not in changed],
+            "failed_files": failed,
+            "chunks": len(chunks),
+            "held_chunks": self.held_chunks,
+        }
+    
+    def install_file(self, new_path: str, path: str, chunks: List[Document], sha256: Optional[str] = None):
+        # Moves a new version of `path`, already indexed as `chunks`, into place
+        # and records it in the ingest manifest, so neither a re-index nor the
+        # folder watcher ingests it again. Until this runs, `path` keeps the old
+        # version, so a failed load or index leaves file and store consistent.
+        # sha256: of new_path's content, if the caller already has it
+        path = os.path.realpath(path)
+        staged = path + ".upload"   # not a loadable extension, so never scanned
+        with self._ingest_lock:
+            shutil.copyfile(new_path, staged)
+            with open(staged, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(staged, path)
+            stat = os.stat(path)
+            signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256 or file_sha256(path)}
+            document_ids = list(dict.fromkeys(chunk.metadata.get("document_id", "unknown") for chunk in chunks))
+            chunk_ids = [chunk.metadata.get("chunk_id", "unknown") for chunk in chunks]
+            self.ingest_manifest.update({path: _manifest_entry(signature, document_ids, chunk_ids)})
+    
+    def delete_document(self, document_id: str) -> int:
+        # Deletes a document's chunks (also ones held for PCA training) and drops
+        # it from its file's ingest manifest entry. The file itself stays, and
+        # is only ingested again once it changes. Returns the chunks deleted.
+        with self._ingest_lock:
+            info = self.vector_db.get_document_info(document_id)
+            deleted = self._delete_documents([document_id])
+            if not deleted:
+                return 0
+            self.vector_db.save()
+            
+            files = self.ingest_manifest.files
+            if info is not None:
+                paths = [self._resolve_source(info["source"])]
+            else:
+                # Only held for PCA training, so the store knows no source
+                paths = [path for path, entry in files.items() if document_id in entry.get("document_ids", [])]
+            gone = set(info["chunk_ids"]) if info is not None else set()
+            updates = {
+                path: dict(
+                    files[path],
+                    document_ids=[d for d in files[path]["document_ids"] if d != document_id],
+                    chunk_ids=[c for c in files[path]["chunk_ids"] if c not in gone],
+                )
+                for path in paths if document_id in files.get(path, {}).get("document_ids", [])
+            }
+            if updates:
+                self.ingest_manifest.update(updates)
+        print(f" Deleted {deleted} chunks of document {document_id}")
+        return deleted
+    
+    def _resolve_source(self, source: str) -> str:
+        # realpath of a chunk source, resolved once per source
+        resolved = self._resolved_sources.get(source)
+        if resolved is None:
+            resolved = self._resolved_sources[source] = os.path.realpath(source)
+        return resolved
+    
+    def forget_files(self, paths: List[str]) -> int:
+        # Drops the vectors of files recorded in the ingest manifest (e.g. deleted
+        # from disk) and their entries; returns the number of rows deleted
+        if not paths:
+            return 0
+        with self._ingest_lock:
+            stale_ids = [document_id for path in paths for document_id in self.ingest_manifest.document_ids(path)]
+            deleted = self._delete_documents(stale_ids)
+            self.vector_db.save()
+            self.ingest_manifest.forget(paths)
+        print(f" Removed {deleted} chunks of {len(paths)} deleted files")
+        return deleted
+    
+    def _with_unchanged(self, plan: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        # force: unchanged files are re-ingested under their recorded signature
+        return {**{path: self.ingest_manifest.files[path] for path in plan["unchanged"]}, **plan["changed"]}
+    
+    def _embed_chunks(self, chunks: List[Document]) -> np.ndarray:
+        embeddings_array = self.embedder.encode_texts([chunk.page_content for chunk in chunks])
         print(f"Created {embeddings_array.shape[0]} embeddings")
-        
-
+        return embeddings_array
+    
+    def _store_chunks(self, replace_ids: List[str], embeddings: np.ndarray, metadata: List[Dict[str, Any]]):
+        # Replaces replace_ids with the new rows in one generation (the caller
+        # saves); embeddings are full-size and reduced here. While a PCA waits for
+        # training data the rows are held by the reducer instead (see EmbeddingReducer)
+        if self.reducer is not None:
+            with self._reducer_lock:
+                if not self.reducer.is_trained:
+                    self.reducer.hold(self.vector_db.storage_path, replace_ids, embeddings, metadata)
+                    self.release_held_chunks()
+                    return
+                if not self.reducer.persisted:
+                    self.reducer.save(self.vector_db.storage_path)
+            embeddings = self.reducer.apply(embeddings)
+        self.vector_db.replace_documents(replace_ids, embeddings, metadata)
+    
+    def _delete_documents(self, document_ids: List[str]) -> int:
+        # From the store and from rows held for PCA training; the caller saves
+        held = 0
+        if self.reducer is not None:
+            with self._reducer_lock:
+                held = self.reducer.drop_pending(self.vector_db.storage_path, document_ids)
+        return held + self.vector_db.replace_documents(document_ids)
+    
+    def release_held_chunks(self, final: bool = False) -> int:
+        # Trains a PCA that has gathered enough held chunks and moves them into
+        # the store; final=True settles for min_train_size (nothing else is
+        # coming soon). Also finishes a release a restart interrupted. Returns
+        # the number of chunks released.
+        if self.reducer is None:
+            return 0
+        with self._reducer_lock:
+            if not self.reducer.pending_rows or not (self.reducer.is_trained or self.reducer.ready(final)):
+                return 0
+            embeddings, metadata = self.reducer.take_pending(self.vector_db.storage_path)
+            document_ids = list(dict.fromkeys(meta["document_id"] for meta in metadata))
+            self.vector_db.replace_documents(document_ids, embeddings, metadata)
+            self.vector_db.save()
+            self.reducer.release_pending(self.vector_db.storage_path)
+        print(f" Released {len(metadata)} held chunks into the store")
+        return len(metadata)
+    
+    @property
+    def held_chunks(self) -> int:
+        # Chunks waiting for PCA training; searched exactly by _search_held meanwhile
+        return self.reducer.pending_rows if self.reducer is not None else 0
+    
+    def _held(self) -> Optional[tuple]:
+        # (full-size embeddings, metadata) of the held chunks, or None; the arrays
+        # are replaced rather than modified, so the pair stays consistent
+        if self.reducer is None:
+            return None
+        with self._reducer_lock:
+            if self.reducer.is_trained or not self.reducer.pending_rows:
+                return None
+            return self.reducer.pending_embeddings, list(self.reducer.pending_metadata)
+    
+    def _search_held(self, query_embeddings: np.ndarray, top_k: int, filter: Optional[Dict[str, Any]]):
+        # Until the PCA is trained the store is empty and the held chunks are the
+        # whole corpus, so they are searched exactly at full dimension instead
+        held = self._held()
+        if held is None:
+            return None
+        embeddings, metadata = held
+        rows = [i for i, meta in enumerate(metadata) if not filter or matches_filter(meta, filter)]
+        if not rows:
+            return [[] for _ in range(len(query_embeddings))]
+        distances, ids = faiss.knn(
+            np.ascontiguousarray(query_embeddings, dtype="float32"),
+            np.ascontiguousarray(embeddings[rows]),
+            min(top_k, len(rows))
+        )
+        return [
+            [{"distance": float(d), "metadata": metadata[rows[i]]} for d, i in zip(row_distances, row_ids) if i >= 0]
+            for row_distances, row_ids in zip(distances, ids)
+        ]
+    
+    def held_documents(self) -> Dict[str, Dict[str, Any]]:
+        # document_id -> info (as VectorDatabase.get_document_info) of held documents
+        held = self._held()
+        documents = {}
+        for meta in (held[1] if held is not None else []):
+            info = documents.setdefault(meta["document_id"], {
+                "document_id": meta["document_id"],
+                "source": meta.get("source", "unknown"),
+                "total_chunks": 0,
+                "chunk_ids": [],
+                "held": True,
+            })
+            info["total_chunks"] += 1
+            info["chunk_ids"].append(meta.get("chunk_id"))
+        return documents
+    
+    def get_document_info(self, document_id: str) -> Optional[Dict[str, Any]]:
+        # From the store, or from the chunks held for PCA training
+        info = self.vector_db.get_document_info(document_id)
+        return info if info is not None else self.held_documents().get(document_id)
+    
+    def _chunk_metadata(self, chunks: List[Document], tags: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         # Enhanced metadata with document and chunk IDs
         metadata = []
         for chunk in chunks:
@@ -62,29 +378,98 @@ class RAGPipeline:
                 "document_id": chunk.metadata.get("document_id", "unknown"),
                 "chunk_id": chunk.metadata.get("chunk_id", "unknown"),
                 "chunk_index": chunk.metadata.get("chunk_index", 0),
-                "total_chunks": chunk.metadata.get("total_chunks", 1)
+                "total_chunks": chunk.metadata.get("total_chunks", 1),
+                "tags": {**(tags or {}), **chunk.metadata.get("tags", {})}
             })
+        return metadata
+    
+    def index_documents(
+        self,
+        documents: List[Document],
+        replace_existing: bool = False,
+        tags: Optional[Dict[str, Any]] = None
+    ):
+        # replace_existing: drop vectors from earlier versions of the same documents first
+        # tags: e.g. {"crop": "wheat", "region": "terai"}, stored on every chunk for filtering
+        # Returns the chunks that were indexed
+        if not documents:
+            print("No documents to index")
+            return []
+        
+        print(f"Indexing {len(documents)} documents...")
+        
+        chunks = self.chunker.chunk(documents)
+        print(f" Chunked into {len(chunks)} pieces")
+        
+        embeddings_array = self._embed_chunks(chunks)
+        metadata = self._chunk_metadata(chunks, tags)
         
-        self.vector_db.add(embeddings_array, metadata)
+        # replace: one generation, so concurrent searches never see the documents missing
+        document_ids = list(dict.fromkeys(meta["document_id"] for meta in metadata)) if replace_existing else []
+        self._store_chunks(document_ids, embeddings_array, metadata)
         self.vector_db.save()
+        # Nothing else belongs to this call: a PCA with min_train_size rows trains
+        # now rather than keeping an upload out of the store indefinitely
+        self.release_held_chunks(final=True)
         
-        print(f" Successfully indexed {len(chunks)} chunks")
+        if self.held_chunks:
+            print(f" Indexed {len(chunks)} chunks; {self.held_chunks} held until PCA can train (searched exactly meanwhile)")
+        else:
+            print(f" Successfully indexed {len(chunks)} chunks")
+        return chunks
+    
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        # A lone query joins whatever other requests are embedding right now
+        if len(queries) == 1:
+            return self.query_batcher.embed(queries[0]).reshape(1, -1)
+        return self.embedder.encode_queries(queries)
+    
+    def _reduce_queries(self, query_embeddings: np.ndarray) -> np.ndarray:
+        # Cached query vectors stay full-size; an untrained PCA means the store is still empty
+        if self.reducer is None or not self.reducer.is_trained:
+            return query_embeddings
+        return self.reducer.apply(query_embeddings)
     
     
-    def retrieve(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    # filter: restrict retrieval by document_id, source or chunk tags (see VectorDatabase.search)
+    def retrieve(self, query: str, top_k: int = 10, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         print(f"Retrieving documents for: '{query}'")
         
-        query_embedding = np.array([self.embedder.embed_text(query)]).astype('float32')
-        
-        results = self.vector_db.search(query_embedding, top_k=top_k)
+        query_embedding = self.query_cache.get_many([query], self._embed_queries)
+        held = self._search_held(query_embedding, top_k, filter)
+        if held is not None:
+            results = held[0]
+        else:
+            results = self.vector_db.search(self._reduce_queries(query_embedding), top_k=top_k, filter=filter)
         
         print(f"Retrieved {len(results)} documents")
         return results
     
-    def answer(self, query: str, top_k: int = 4) -> Dict[str, Any]:
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Embed all queries in one encode call and run a single FAISS search over them."""
+        if any(not query or not query.strip() for query in queries):
+            raise ValueError("Queries cannot be empty")
+        if not queries:
+            return []
+        print(f"Retrieving documents for {len(queries)} queries")
+        
+        query_embeddings = self.query_cache.get_many(queries, self._embed_queries)
+        results = self._search_held(query_embeddings, top_k, filter)
+        if results is None:
+            results = self.vector_db.search_many(self._reduce_queries(query_embeddings), top_k=top_k, filter=filter)
+        
+        print(f"Retrieved {sum(len(r) for r in results)} documents")
+        return results
+    
+    def answer(self, query: str, top_k: int = 4, filter: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         print(f"Answering query: '{query}'--------------------------")
        
-        retrieved_docs = self.retrieve(query, top_k=top_k)
+        retrieved_docs = self.retrieve(query, top_k=top_k, filter=filter)
         
         # Check if we have relevant results (distance threshold)
         relevant_docs = [doc for doc in retrieved_docs if doc["distance"] < 0.7]
@@ -169,9 +554,9 @@ Answer naturally:"""
             def __init__(self, rag_pipeline):
                 self.rag_pipeline = rag_pipeline
             
-            def get_relevant_documents(self, query, k=4):
+            def get_relevant_documents(self, query, k=4, filter=None):
                 """Get relevant documents for a query"""
-                results = self.rag_pipeline.retrieve(query, top_k=k)
+                results = self.rag_pipeline.retrieve(query, top_k=k, filter=filter)
                 
                 docs = []
                 for result in results:
@@ -189,14 +574,54 @@ Answer naturally:"""
 
 
 
-def initialize_rag_pipeline(storage_path: str = "faiss_store", data_dir: str = None, model_name: str = "llama-3.3-70b-versatile"):
+def _manifest_entry(signature: Dict[str, Any], document_ids: List[str], chunk_ids: List[str]) -> Dict[str, Any]:
+    return {
+        "size": signature["size"],
+        "mtime_ns": signature["mtime_ns"],
+        "sha256": signature["sha256"],
+        "document_ids": document_ids,
+        "chunk_ids": chunk_ids,
+    }
+
+
+def _failure_entry(signature: Dict[str, Any], previous: Optional[Dict[str, Any]], error: str) -> Dict[str, Any]:
+    # Keeps the ids of whatever the file produced before, which are still indexed
+    previous = previous or {}
+    entry = _manifest_entry(signature, previous.get("document_ids", []), previous.get("chunk_ids", []))
+    entry["error"] = error
+    return entry
+
+
+def initialize_rag_pipeline(storage_path: str = "faiss_store", data_dir: str = None, model_name: str = "llama-3.3-70b-versatile", index_type: str = "auto", shards: int = 1, embedding_cache_size: int = 500_000, embedding_workers: int = 0, embedding_backend: str = "torch", reduction: Optional[str] = None, parse_cache_dir: Optional[str] = "data/processed/parsed"):
  
+    # index_type: see VectorDatabase; "binary"/"binary_ivf" select the sign-bit
+    # prefilter tier (1 bit per dimension in RAM, rescored from the float segments)
     print("Initializing RAG Pipeline...")
     
     chunker = TextChunker(chunk_size=1500, chunk_overlap=300)
-    embedder = DocumentEmbedder()
-    vector_db = VectorDatabase(storage_path)
+    # Content-addressed, so re-indexing unchanged documents skips the model
+    embedding_cache = EmbeddingCache(os.path.join(storage_path, "embedding_cache.sqlite"), max_entries=embedding_cache_size)
+    # embedding_workers > 1 spreads bulk ingestion over that many CPU processes;
+    # embedding_backend "torch_int8"/"onnx" trade a parity-checked sliver of accuracy for CPU speed
+    embedder = DocumentEmbedder(
+        cache=embedding_cache,
+        workers=embedding_workers,
+        backend=embedding_backend,
+        onnx_dir=os.path.join(storage_path, "models")
+    )
+    if shards > 1:
+        # One index per shard, searched in parallel; the shard count is fixed per store
+        vector_db = ShardedVectorDatabase(storage_path, shards=shards, index_type=index_type)
+    else:
+        vector_db = VectorDatabase(storage_path, index_type=index_type)
     vector_db.load()  # Load existing data if available
+    # reduction: "pca:256" or "truncate:512" (Matryoshka models); fixed once the store has data
+    reducer = open_reducer(storage_path, reduction, embedder.model_name, embedder.dimension, vector_db.dim)
+    # Extracted page text by file hash, so a rebuild or new chunk size skips parsing
+    parse_cache = None
+    if parse_cache_dir:
+        from .data_loaders import ParsedTextCache
+        parse_cache = ParsedTextCache(parse_cache_dir)
     
     print("Connecting to AI model...")
     llm_client = get_groq_client()
@@ -219,8 +644,12 @@ def initialize_rag_pipeline(storage_path: str = "faiss_store", data_dir: str = N
         chunker=chunker,    
         embedder=embedder, 
         vector_db=vector_db,
-        llm=llm_call      
+        llm=llm_call,
+        reducer=reducer,
+        parse_cache=parse_cache
     )
+    # Chunks a restart caught between PCA training and the store
+    rag.release_held_chunks()
     
     if data_dir:
         print(f"Loading documents from: {data_dir}")
@@ -0,0 +1,276 @@
+import os
+import json
+import hashlib
+import faiss
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+
+REDUCTION_FILE = "reduction.json"
+PCA_FILE = "reduction.pca"
+PENDING_FILE = "reduction_pending.npz"
+REDUCTION_VERSION = 1
+REDUCTION_KINDS = ("pca", "truncate")
+
+
+def parse_reduction(spec: Optional[str]) -> Optional[tuple]:
+    """"pca:256" / "truncate:512" -> (kind, dims); None or "" -> None."""
+    if not spec:
+        return None
+    kind, _, dims = spec.partition(":")
+    if kind not in REDUCTION_KINDS or not dims.isdigit() or int(dims) < 1:
+        raise ValueError(f"Invalid reduction {spec!r}; expected 'pca:<dims>' or 'truncate:<dims>'")
+    return kind, int(dims)
+
+
+class EmbeddingReducer:
+    """Maps embeddings to fewer dimensions before they reach the vector store.
+
+    pca:       a faiss.PCAMatrix trained on the first ingested batch; it centers
+               the data, so L2 distances shrink only by the variance dropped.
+    truncate:  keeps the first dims of Matryoshka-trained models and rescales
+               each row back to its original norm, so distance thresholds hold.
+
+    The same reducer must map documents and queries, so it is saved in the
+    store directory with a fingerprint; the store manifest is not touched.
+
+    PCA is not trained on whatever the first batch happens to be: chunks are
+    held back as raw embeddings (saved next to the store, so an interrupted
+    ingest loses nothing) until train_rows have arrived, or min_train_size at
+    the end of a directory ingest, then the PCA is trained on all of them and
+    they are projected and released to the store together.
+    """
+
+    def __init__(self, kind: str, input_dim: int, output_dim: int, model_name: str):
+        if kind not in REDUCTION_KINDS:
+            raise ValueError(f"Unknown reduction {kind!r}; expected one of {REDUCTION_KINDS}")
+        if output_dim >= input_dim:
+            raise ValueError(f"Cannot reduce {input_dim} dims to {output_dim}")
+        self.kind = kind
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.model_name = model_name
+        self.pca = faiss.PCAMatrix(input_dim, output_dim) if kind == "pca" else None
+        self.persisted = False  # saved next to the store; set by save() and load()
+        self.pending_embeddings = np.zeros((0, input_dim), dtype="float32")   # raw rows awaiting training
+        self.pending_metadata = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.pca is None or self.pca.is_trained
+
+    @property
+    def min_train_size(self) -> int:
+        # Enough rows for a stable covariance of the kept components
+        return 2 * self.output_dim if self.kind == "pca" else 0
+
+    @property
+    def train_rows(self) -> int:
+        # Rows gathered (across windows and uploads) before training on its own
+        return 8 * self.min_train_size
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self.pending_metadata)
+
+    def hold(
+        self,
+        storage_path: str,
+        replace_ids: List[str],
+        embeddings: np.ndarray,
+        metadata: List[Dict[str, Any]],
+    ):
+        """Keep raw rows until training; held rows of replace_ids are dropped first."""
+        self.drop_pending(storage_path, replace_ids, save=False)
+        self.pending_embeddings = np.concatenate([self.pending_embeddings, np.asarray(embeddings, dtype="float32")])
+        self.pending_metadata.extend(metadata)
+        self._save_pending(storage_path)
+        print(f"Holding {self.pending_rows} chunks until PCA has {self.train_rows} to train on")
+
+    def drop_pending(self, storage_path: str, document_ids: List[str], save: bool = True) -> int:
+        document_ids = set(document_ids)
+        keep = [i for i, meta in enumerate(self.pending_metadata) if meta.get("document_id") not in document_ids]
+        dropped = self.pending_rows - len(keep)
+        if dropped:
+            self.pending_embeddings = self.pending_embeddings[keep]
+            self.pending_metadata = [self.pending_metadata[i] for i in keep]
+            if save:
+                self._save_pending(storage_path)
+        return dropped
+
+    def ready(self, final: bool = False) -> bool:
+        """Whether the held rows should train the PCA now; final: no more rows are coming soon."""
+        return not self.is_trained and self.pending_rows >= (self.min_train_size if final else self.train_rows)
+
+    def take_pending(self, storage_path: str) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """The held rows projected (training first if needed) with their metadata; stops holding them.
+
+        The saved copy stays until release_pending(), i.e. until the store has them.
+        """
+        if not self.is_trained:
+            self.train(self.pending_embeddings)
+            self.save(storage_path)
+        reduced, metadata = self.apply(self.pending_embeddings), self.pending_metadata
+        self.pending_embeddings = np.zeros((0, self.input_dim), dtype="float32")
+        self.pending_metadata = []
+        return reduced, metadata
+
+    def release_pending(self, storage_path: str):
+        """Forget the saved held rows once the store holds their projections."""
+        path = os.path.join(storage_path, PENDING_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _save_pending(self, storage_path: str):
+        path = os.path.join(storage_path, PENDING_FILE)
+        # Config first: a restart must know what the held rows are waiting for
+        if not os.path.exists(os.path.join(storage_path, REDUCTION_FILE)):
+            self.save(storage_path)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, embeddings=self.pending_embeddings, metadata=np.array(json.dumps(self.pending_metadata)))
+        os.replace(path + ".tmp", path)
+
+    def _load_pending(self, storage_path: str):
+        path = os.path.join(storage_path, PENDING_FILE)
+        if not os.path.exists(path):
+            return
+        with np.load(path) as saved:
+            embeddings = saved["embeddings"]
+            metadata = json.loads(str(saved["metadata"]))
+        if embeddings.shape[1:] != (self.input_dim,) or embeddings.shape[0] != len(metadata):
+            raise ValueError(f"{path} does not match {os.path.join(storage_path, REDUCTION_FILE)}")
+        self.pending_embeddings, self.pending_metadata = embeddings, metadata
+
+    def train(self, embeddings: np.ndarray):
+        if self.pca is None:
+            return
+        if embeddings.shape[0] < self.min_train_size:
+            raise ValueError(
+                f"PCA to {self.output_dim} dims needs at least {self.min_train_size} chunks in the first "
+                f"ingest, got {embeddings.shape[0]}; index a larger batch first or use truncation"
+            )
+        self.pca.train(np.ascontiguousarray(embeddings, dtype="float32"))
+        print(f"Trained PCA reduction {self.input_dim} -> {self.output_dim} dims on {embeddings.shape[0]} vectors")
+
+    def apply(self, embeddings: np.ndarray) -> np.ndarray:
+        """(n, input_dim) -> (n, output_dim) contiguous float32."""
+        if embeddings.shape[1] != self.input_dim:
+            raise ValueError(f"Reducer expects {self.input_dim}-dim embeddings, got {embeddings.shape[1]}")
+        if not self.is_trained:
+            raise ValueError("PCA reduction has not been trained")
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if self.pca is not None:
+            return self.pca.apply(embeddings)
+        reduced = np.ascontiguousarray(embeddings[:, :self.output_dim])
+        scale = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        scale /= np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), np.finfo("float32").tiny)
+        reduced *= scale
+        return reduced
+
+    def fingerprint(self) -> str:
+        """Identifies the exact mapping; a different PCA training gives a different value."""
+        digest = hashlib.sha256(f"{self.kind}:{self.model_name}:{self.input_dim}:{self.output_dim}".encode())
+        if self.pca is not None:
+            digest.update(faiss.vector_to_array(self.pca.A).tobytes())
+            digest.update(faiss.vector_to_array(self.pca.b).tobytes())
+        return digest.hexdigest()[:16]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": REDUCTION_VERSION,
+            "kind": self.kind,
+            "model_name": self.model_name,
+            "input_dim": self.input_dim,
+            "output_dim": self.output_dim,
+            "fingerprint": self.fingerprint() if self.is_trained else None,
+            "pending_rows": self.pending_rows,
+        }
+
+    def save(self, storage_path: str):
+        """Write the reducer next to the store; the json is replaced last, atomically."""
+        if self.pca is not None and self.is_trained:
+            faiss.write_VectorTransform(self.pca, os.path.join(storage_path, PCA_FILE))
+        path = os.path.join(storage_path, REDUCTION_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.describe(), f, indent=2)
+        os.replace(path + ".tmp", path)
+        # An untrained PCA is saved only to remember held rows; it is not final yet
+        self.persisted = self.is_trained
+
+    @classmethod
+    def load(cls, storage_path: str) -> Optional["EmbeddingReducer"]:
+        path = os.path.join(storage_path, REDUCTION_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get("version") != REDUCTION_VERSION:
+            raise ValueError(f"Unsupported reduction version {saved.get('version')} in {path}")
+        reducer = cls(saved["kind"], saved["input_dim"], saved["output_dim"], saved["model_name"])
+        if reducer.pca is not None and saved["fingerprint"] is not None:
+            # Already a PCAMatrix; downcasting again would drop the owning reference
+            reducer.pca = faiss.read_VectorTransform(os.path.join(storage_path, PCA_FILE))
+        if reducer.is_trained and reducer.fingerprint() != saved["fingerprint"]:
+            raise ValueError(f"{os.path.join(storage_path, PCA_FILE)} does not match {path}")
+        reducer.persisted = reducer.is_trained
+        reducer._load_pending(storage_path)
+        return reducer
+
+
+def open_reducer(
+    storage_path: str,
+    spec: Optional[str],
+    model_name: str,
+    input_dim: int,
+    store_dim: Optional[int],
+) -> Optional[EmbeddingReducer]:
+    """The reducer for a store, checked against the configured one; fails fast on any mismatch.
+
+    store_dim is the dimension of vectors already in the store (None if empty).
+    """
+    wanted = parse_reduction(spec)
+    if wanted is not None and wanted[1] >= input_dim:
+        raise ValueError(f"Reduction {spec!r} must keep fewer than the embedder's {input_dim} dims")
+    saved = EmbeddingReducer.load(storage_path)
+    if saved is not None and store_dim is None:
+        # Nothing was reduced with it yet, so the configuration may still change
+        if wanted != (saved.kind, saved.output_dim) or saved.model_name != model_name:
+            held = saved.pending_rows
+            if held and (wanted is None or (saved.model_name, saved.input_dim) != (model_name, input_dim)):
+                raise ValueError(
+                    f"{held} indexed chunks are held for '{saved.kind}:{saved.output_dim}' training; "
+                    f"configure that reduction again or re-index from scratch"
+                )
+            for name in (REDUCTION_FILE, PCA_FILE, PENDING_FILE):
+                if os.path.exists(os.path.join(storage_path, name)):
+                    os.remove(os.path.join(storage_path, name))
+            if held:
+                # Same raw embeddings, now waiting for the new reduction
+                reducer = EmbeddingReducer(wanted[0], input_dim, wanted[1], model_name)
+                reducer.hold(storage_path, [], saved.pending_embeddings, saved.pending_metadata)
+                return reducer
+            saved = None
+
+    if saved is None:
+        if wanted is None:
+            if store_dim is not None and store_dim != input_dim:
+                raise ValueError(
+                    f"Store holds {store_dim}-dim vectors but embeddings have {input_dim} and no reduction is configured"
+                )
+            return None
+        if store_dim is not None:
+            raise ValueError(f"Store already holds unreduced {store_dim}-dim vectors; re-index to add reduction {spec!r}")
+        return EmbeddingReducer(wanted[0], input_dim, wanted[1], model_name)
+
+    if wanted is None or (saved.kind, saved.output_dim) != wanted:
+        raise ValueError(
+            f"Store was built with reduction '{saved.kind}:{saved.output_dim}', configured {spec!r}"
+        )
+    if (saved.model_name, saved.input_dim) != (model_name, input_dim):
+        raise ValueError(
+            f"Store reduction was trained for {saved.model_name} ({saved.input_dim} dims), "
+            f"embedder is {model_name} ({input_dim} dims)"
+        )
+    if store_dim is not None and store_dim != saved.output_dim:
+        raise ValueError(f"Store holds {store_dim}-dim vectors but the reduction outputs {saved.output_dim}")
+    return saved
@@ -0,0 +1,256 @@
+import os
+import json
+import shutil
+import time
+import faiss
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single writer is on the caller
+    fcntl = None
+from typing import List, Dict, Any, Optional
+from . import index_factory
+from .metadata_store import MetadataStore
+
+
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+VECTORS_FILE = "vectors.npy"
+METADATA_DIR = "metadata"
+LOCK_FILE = "writer.lock"
+MANIFEST_VERSION = 1
+# Files a compaction replaced stay on disk this long, so processes reading the
+# previous manifest can still open them
+RETIRE_GRACE_SECONDS = 300
+
+
+class Segment:
+    """An immutable batch of raw vectors and their metadata, memory-mapped from disk."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.metadata = MetadataStore()
+        self.metadata.open(os.path.join(path, METADATA_DIR))
+
+    @property
+    def rows(self) -> int:
+        return self.vectors.shape[0]
+
+
+class SegmentStore:
+    """Append-only on-disk layout for a VectorDatabase.
+
+    storage_path/
+        manifest.json          segments in row order + the latest index checkpoint
+        segments/seg_000001/   vectors.npy (raw float32) and a columnar metadata store
+        index_seg_000003.faiss FAISS index covering the first `checkpoint.rows` rows
+        lookups_seg_000003.pkl chunk/document/source lookups for the same rows
+
+    Files are only ever created, never modified; a change becomes visible when
+    manifest.json is atomically replaced, so a crash mid-write leaves the
+    previous manifest (and everything it references) intact.
+
+    A store has a single writer: the first write takes an exclusive flock on
+    writer.lock, held until close() (or process exit), and a second process
+    trying to write fails instead of reusing segment names and clobbering
+    files. Writers do not hand over: another process can only write after
+    close(), and only if nothing changed since it read the manifest (on
+    Windows, without flock, single-writer is up to the caller). Any number of
+    processes may open the store to read.
+
+    Segments and checkpoints a compaction replaces are not deleted at once:
+    commit() records them under "retired" and deletes them RETIRE_GRACE_SECONDS
+    later, so a reader that loaded the previous manifest can still open them.
+    """
+
+    def __init__(self, root: str, retire_grace_seconds: float = RETIRE_GRACE_SECONDS):
+        self.root = root
+        self.segments_dir = os.path.join(root, SEGMENTS_DIR)
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self.manifest = self.read_manifest()
+        self.retire_grace_seconds = retire_grace_seconds
+        self._lock_file = None
+
+    def _acquire_writer(self):
+        """Become the store's only writer, or fail if another process is."""
+        if self._lock_file is not None or fcntl is None:
+            return
+        lock_file = open(os.path.join(self.root, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"Vector store {self.root} is being written by another process")
+        on_disk = self.read_manifest()
+        if on_disk is not None and (self.manifest is None or on_disk["generation"] != self.manifest["generation"]):
+            # Another writer committed since we read the manifest; our view is stale
+            lock_file.close()
+            raise RuntimeError(f"Vector store {self.root} changed on disk since it was loaded; reload it")
+        self._lock_file = lock_file
+
+    def close(self):
+        """Give up the writer lock, so another process may write the store."""
+        if self._lock_file is not None:
+            self._lock_file.close()   # closing the descriptor releases the flock
+            self._lock_file = None
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported vector store manifest version: {manifest.get('version')}")
+        return manifest
+
+    def new_manifest(self, dim: int) -> Dict[str, Any]:
+        return {
+            "version": MANIFEST_VERSION,
+            "dim": dim,
+            "generation": 0,
+            "next_segment": 1,
+            "segments": [],
+            "checkpoint": None,
+            "index_stats": {},
+            "retired": [],
+        }
+
+    def commit(
+        self,
+        manifest: Dict[str, Any],
+        retired_segments: Optional[List[str]] = None,
+        retired_checkpoint: Optional[Dict[str, Any]] = None,
+    ):
+        """Atomically publish a new manifest.
+
+        `retired_segments` / `retired_checkpoint` are files the new manifest no
+        longer references; they are deleted by a commit at least
+        retire_grace_seconds later.
+        """
+        self._acquire_writer()
+        now = time.time()
+        retired = list(manifest.get("retired", []))
+        if retired_segments or retired_checkpoint:
+            retired.append({"segments": retired_segments or [], "checkpoint": retired_checkpoint, "time": now})
+        expired = [entry for entry in retired if now - entry["time"] >= self.retire_grace_seconds]
+        manifest = dict(
+            manifest,
+            generation=manifest["generation"] + 1,
+            retired=[entry for entry in retired if entry not in expired],
+        )
+        path = os.path.join(self.root, MANIFEST_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.manifest = manifest
+        # Only once no manifest references them (a crash before this leaks them)
+        for entry in expired:
+            self.remove_segments(entry["segments"])
+            self.remove_checkpoint(entry["checkpoint"])
+        return manifest
+
+    def allocate_name(self, prefix: str = "seg") -> str:
+        """Reserve a fresh, never-reused segment name (persisted with the next commit)."""
+        seg_id = self.manifest["next_segment"]
+        self.manifest["next_segment"] = seg_id + 1
+        return f"{prefix}_{seg_id:06d}"
+
+    def write_segment(self, name: str, vectors: np.ndarray, metadata: MetadataStore) -> Segment:
+        """Write a new immutable segment; it is not referenced until the next commit."""
+        self._acquire_writer()
+        final_path = os.path.join(self.segments_dir, name)
+        tmp_path = final_path + ".tmp"
+        # Leftovers from a crash before their manifest was committed
+        shutil.rmtree(final_path, ignore_errors=True)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, VECTORS_FILE), "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+            f.flush()
+            os.fsync(f.fileno())
+        metadata.write(os.path.join(tmp_path, METADATA_DIR))
+        os.replace(tmp_path, final_path)
+        return Segment(name, final_path)
+
+    def merge_segments(
+        self,
+        name: str,
+        segments: List[Segment],
+        keep: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> Segment:
+        """Concatenate segments into one new segment, streaming vectors through disk.
+
+        `keep` optionally holds a boolean row mask per segment; masked-out
+        (deleted) rows are left behind.
+        """
+        self._acquire_writer()
+        final_path = os.path.join(self.segments_dir, name)
+        tmp_path = final_path + ".tmp"
+        # Leftovers from a crash before their manifest was committed
+        shutil.rmtree(final_path, ignore_errors=True)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        if keep is None:
+            keep = [None] * len(segments)
+        n_rows = sum(seg.rows if mask is None else int(mask.sum()) for seg, mask in zip(segments, keep))
+        dim = segments[0].vectors.shape[1]
+        out = np.lib.format.open_memmap(
+            os.path.join(tmp_path, VECTORS_FILE), mode="w+", dtype="float32", shape=(n_rows, dim)
+        )
+        row = 0
+        for seg, mask in zip(segments, keep):
+            vectors = seg.vectors if mask is None else seg.vectors[mask]
+            out[row:row + len(vectors)] = vectors
+            row += len(vectors)
+        out.flush()
+        del out
+
+        MetadataStore.merge(
+            [seg.metadata for seg in segments], os.path.join(tmp_path, METADATA_DIR), keep
+        )
+        os.replace(tmp_path, final_path)
+        return Segment(name, final_path)
+
+    def open_segment(self, name: str) -> Segment:
+        return Segment(name, os.path.join(self.segments_dir, name))
+
+    def write_checkpoint(self, name: str, index_bytes: np.ndarray, lookups_bytes: bytes) -> Dict[str, str]:
+        """Write a serialized index and its lookups; returns the manifest entry fields."""
+        self._acquire_writer()
+        index_file = f"index_{name}.faiss"
+        lookups_file = f"lookups_{name}.pkl"
+        for file_name, data in ((index_file, index_bytes), (lookups_file, lookups_bytes)):
+            path = os.path.join(self.root, file_name)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+        return {"index": index_file, "lookups": lookups_file}
+
+    def read_checkpoint_index(self, checkpoint: Dict[str, Any], mmap: bool = False) -> faiss.Index:
+        return index_factory.read_index(os.path.join(self.root, checkpoint["index"]), mmap=mmap)
+
+    def read_checkpoint_lookups(self, checkpoint: Dict[str, Any]) -> bytes:
+        with open(os.path.join(self.root, checkpoint["lookups"]), "rb") as f:
+            return f.read()
+
+    def remove_segments(self, names: List[str]):
+        """Delete segment directories that no committed manifest references any more."""
+        for name in names:
+            shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+
+    def remove_checkpoint(self, checkpoint: Optional[Dict[str, Any]]):
+        if not checkpoint:
+            return
+        for file_name in (checkpoint["index"], checkpoint["lookups"]):
+            path = os.path.join(self.root, file_name)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,239 @@
+import os
+import json
+import heapq
+import hashlib
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from .vector_db import VectorDatabase
+
+
+SHARDS_FILE = "shards.json"
+
+
+def shard_of(document_id: str, n_shards: int) -> int:
+    """Stable shard for a document (Python's hash() is salted per process)."""
+    digest = hashlib.md5(str(document_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") % n_shards
+
+
+def document_id_of_chunk(chunk_id: str) -> Optional[str]:
+    """The document a chunk id names (TextChunker ids are "<document_id>_chunk_NNNN"), or None."""
+    document_id, separator, index = str(chunk_id).rpartition("_chunk_")
+    return document_id if separator and document_id and index.isdigit() else None
+
+
+class ShardedVectorDatabase:
+    """N independent VectorDatabase shards, split by document id hash.
+
+    All chunks of a document live in one shard, so deletes and replacements
+    stay atomic per document. Each shard has its own lock, snapshots and
+    background compaction; searches fan out over a thread pool (FAISS releases
+    the GIL) and the per-shard top-k lists are heap-merged. The public methods
+    match VectorDatabase, so RAGPipeline works with either.
+    """
+
+    def __init__(
+        self,
+        storage_path: str = "faiss_store",
+        shards: int = 4,
+        max_workers: Optional[int] = None,
+        **kwargs,
+    ):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        os.makedirs(storage_path, exist_ok=True)
+        # The shard count decides where every document lives; changing it would
+        # silently misroute deletes and lookups, so it is fixed per store
+        layout_path = os.path.join(storage_path, SHARDS_FILE)
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                stored = json.load(f)["shards"]
+            if stored != shards:
+                raise ValueError(f"{storage_path} was created with {stored} shards, not {shards}")
+        elif os.path.exists(os.path.join(storage_path, "manifest.json")):
+            raise ValueError(f"{storage_path} holds an unsharded store; open it with VectorDatabase")
+        else:
+            with open(layout_path, "w") as f:
+                json.dump({"shards": shards}, f)
+
+        self.storage_path = storage_path
+        self.shards = [
+            VectorDatabase(os.path.join(storage_path, f"shard_{i:03d}"), **kwargs)
+            for i in range(shards)
+        ]
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or shards, thread_name_prefix="vector-db-shard"
+        )
+        print(f"ShardedVectorDatabase initialized at: {storage_path} ({shards} shards)")
+
+    def _shard_for(self, document_id: str) -> VectorDatabase:
+        return self.shards[shard_of(document_id, len(self.shards))]
+
+    def _map(self, fn, shards: Optional[List[VectorDatabase]] = None) -> list:
+        """Run fn(shard) on every shard in parallel; results in shard order."""
+        shards = self.shards if shards is None else shards
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._executor.map(fn, shards))
+
+    def _split(self, document_ids: List[str]) -> Dict[int, List[int]]:
+        """Positions of `document_ids` grouped by shard index."""
+        groups = {}
+        for position, document_id in enumerate(document_ids):
+            groups.setdefault(shard_of(document_id, len(self.shards)), []).append(position)
+        return groups
+
+    def add(self, embeddings: np.ndarray, metadata: List[Dict[str, Any]]):
+        """Add vectors and their metadata, routing each row to its document's shard."""
+        self.replace_documents([], embeddings, metadata)
+
+    def delete_document(self, document_id: str) -> int:
+        return self._shard_for(document_id).delete_document(document_id)
+
+    def replace_document(self, document_id: str, embeddings: np.ndarray, metadata: List[Dict[str, Any]]) -> int:
+        return self.replace_documents([document_id], embeddings, metadata)
+
+    def replace_documents(
+        self,
+        document_ids: List[str],
+        embeddings: Optional[np.ndarray] = None,
+        metadata: Optional[List[Dict[str, Any]]] = None,
+    ) -> int:
+        """Per-shard replace_documents; a document and its replacement share a shard."""
+        document_ids = list(document_ids)
+        if embeddings is not None and embeddings.shape[0] != len(metadata):
+            raise ValueError("Number of embeddings must match metadata entries")
+
+        work = {i: ([], []) for i in range(len(self.shards))}
+        for i, positions in self._split(document_ids).items():
+            work[i][0].extend(document_ids[p] for p in positions)
+        if embeddings is not None:
+            row_documents = [meta.get("document_id", "unknown") for meta in metadata]
+            for i, positions in self._split(row_documents).items():
+                work[i][1].extend(positions)
+
+        def apply(i: int) -> int:
+            ids, rows = work[i]
+            if not ids and not rows:
+                return 0
+            if rows:
+                return self.shards[i].replace_documents(
+                    ids, embeddings[rows], [metadata[row] for row in rows]
+                )
+            return self.shards[i].replace_documents(ids)
+
+        return sum(self._executor.map(apply, range(len(self.shards))))
+
+    def _shards_for(self, filter: Optional[Dict[str, Any]]) -> List[VectorDatabase]:
+        """Shards that can match: non-empty ones, and only the owners for a document_id filter."""
+        shards = self.shards
+        if filter and "document_id" in filter:
+            wanted = filter["document_id"]
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            owners = sorted({shard_of(value, len(self.shards)) for value in values})
+            shards = [self.shards[i] for i in owners]
+        return [shard for shard in shards if shard.size] or shards[:1]
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 4,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        rerank: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        if query_embedding.ndim == 1:
+            query_embedding = query_embedding.reshape(1, -1)
+        return self.search_many(query_embedding[:1], top_k, nprobe, ef_search, filter, rerank)[0]
+
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 4,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        rerank: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Search every shard in parallel and merge the per-query top-k lists."""
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        per_shard = self._map(
+            lambda shard: shard.search_many(query_embeddings, top_k, nprobe, ef_search, filter, rerank),
+            self._shards_for(filter),
+        )
+        # Each shard's list is already sorted by distance
+        return [
+            list(itertools.islice(heapq.merge(*lists, key=lambda hit: hit["distance"]), top_k))
+            for lists in zip(*per_shard)
+        ]
+
+    def save(self):
+        self._map(lambda shard: shard.save())
+
+    def compact(self, background: bool = False):
+        self._map(lambda shard: shard.compact(background=background))
+
+    def wait_for_compaction(self):
+        for shard in self.shards:
+            shard.wait_for_compaction()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def load(self) -> bool:
+        return any(self._map(lambda shard: shard.load()))
+
+    @property
+    def deleted_count(self) -> int:
+        return sum(shard.deleted_count for shard in self.shards)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return next((shard.dim for shard in self.shards if shard.dim is not None), None)
+
+    @property
+    def size(self) -> int:
+        return sum(shard.size for shard in self.shards)
+
+    def index_info(self) -> Dict[str, Any]:
+        shard_info = [shard.index_info() for shard in self.shards]
+        return {
+            "shards": len(self.shards),
+            "size": sum(info["size"] for info in shard_info),
+            "deleted_vectors": sum(info["deleted_vectors"] for info in shard_info),
+            "shard_info": shard_info,
+        }
+
+    def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
+        return self._shard_for(document_id).get_document_chunks(document_id)
+
+    def get_chunk_by_id(self, chunk_id: str) -> Dict[str, Any]:
+        # A chunk lives in its document's shard; ids in another format ask every shard
+        document_id = document_id_of_chunk(chunk_id)
+        if document_id is not None:
+            return self._shard_for(document_id).get_chunk_by_id(chunk_id)
+        for chunk in self._map(lambda shard: shard.get_chunk_by_id(chunk_id)):
+            if chunk is not None:
+                return chunk
+        return None
+
+    def get_document_ids(self) -> List[str]:
+        return [document_id for shard in self.shards for document_id in shard.get_document_ids()]
+
+    def get_document_info(self, document_id: str) -> Dict[str, Any]:
+        return self._shard_for(document_id).get_document_info(document_id)
+
+    def get_existing_sources(self) -> set:
+        return set().union(*(shard.get_existing_sources() for shard in self.shards))
+
+    def get_document_id_for_source(self, source: str) -> Optional[str]:
+        for shard in self.shards:
+            document_id = shard.get_document_id_for_source(source)
+            if document_id is not None:
+                return document_id
+        return None
@@ -1,153 +1,885 @@
-
 import os
 import faiss
 import numpy as np
 import pickle
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Iterator, Optional
+from . import index_factory
+from .lookups import MetadataLookups
+from .metadata_store import MetadataStore, MetadataView, SegmentedMetadataStore
+from .segment_store import Segment, SegmentStore
+
+
+class Snapshot:
+    """One immutable generation of the database, as seen by searches.
+
+    Rows [0, base_rows) are searched in `base`, the checkpointed (possibly ANN)
+    index, and rows added since in `delta`, a (rows, dim) array searched by
+    brute force. The array is a prefix of a buffer the writer appends to past
+    its end, so it never changes under a search. A published
+    snapshot is never modified: writers build the next generation and swap it
+    in, so a search that pinned one sees index, metadata, tombstones and
+    lookups from the same moment without taking any lock.
+    """
+
+    def __init__(
+        self,
+        generation: int = 0,
+        base: Optional[faiss.Index] = None,
+        delta: Optional[np.ndarray] = None,
+        metadata: Optional[MetadataView] = None,
+        deleted: Optional[np.ndarray] = None,
+        lookups: Optional[MetadataLookups] = None,
+        segments: tuple = (),
+    ):
+        self.generation = generation
+        self.base = base
+        self.delta = delta
+        self.metadata = metadata if metadata is not None else MetadataView()
+        self.deleted = deleted if deleted is not None else np.zeros(0, dtype=bool)
+        self.lookups = lookups if lookups is not None else MetadataLookups()
+        # Persisted segments; they hold the float vectors of every base row
+        self.segments = tuple(segments)
+        self.deleted_count = int(self.deleted.sum())
+        self._selectors = {}
+        self._segment_offsets = np.cumsum([0] + [seg.rows for seg in self.segments])
+
+    def next(self, **changes) -> "Snapshot":
+        """The following generation, sharing everything not in `changes`."""
+        fields = {
+            "base": self.base,
+            "delta": self.delta,
+            "metadata": self.metadata,
+            "deleted": self.deleted,
+            "lookups": self.lookups,
+            "segments": self.segments,
+        }
+        fields.update(changes)
+        return Snapshot(self.generation + 1, **fields)
+
+    @property
+    def base_rows(self) -> int:
+        return self.base.ntotal if self.base is not None else 0
+
+    @property
+    def delta_rows(self) -> int:
+        return len(self.delta) if self.delta is not None else 0
+
+    @property
+    def rows(self) -> int:
+        return self.base_rows + self.delta_rows
+
+    @property
+    def dim(self) -> Optional[int]:
+        if self.base is not None:
+            return self.base.d
+        return self.delta.shape[1] if self.delta is not None else None
+
+    def parts(self) -> List[tuple]:
+        """(base index or delta array, first row) of each non-empty part, in row order."""
+        parts = []
+        if self.base is not None and self.base.ntotal:
+            parts.append((self.base, 0))
+        if self.delta_rows:
+            parts.append((self.delta, self.base_rows))
+        return parts
+
+    def search_delta(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> tuple:
+        """Exact top-k over the delta, among local `rows` if given, else its live rows."""
+        offset = self.base_rows
+        if rows is not None:
+            distances, indices = index_factory.exact_search(queries, rows, self.delta.__getitem__, k)
+            return distances, indices + offset
+        dead = self.deleted[offset:offset + len(self.delta)]
+        # Over-fetch by the tombstones in the delta, then drop them
+        distances, indices = faiss.knn(queries, self.delta, min(k + int(dead.sum()), len(self.delta)))
+        if dead.any():
+            distances = np.where(dead[indices], np.inf, distances)
+            order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, order, 1)
+            indices = np.where(np.isinf(distances), -1, np.take_along_axis(indices, order, 1))
+        return distances, np.where(indices >= 0, indices + offset, -1)
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Float vectors of sorted persisted `rows`, gathered from the segment files."""
+        return _gather_rows(self.segments, self._segment_offsets, rows)
+    
+    def tombstone_selector(self, offset: int, ntotal: int) -> Optional[faiss.IDSelector]:
+        """IDSelector skipping the deleted rows of the part starting at `offset`, or None."""
+        if offset not in self._selectors:
+            deleted_ids = np.flatnonzero(self.deleted[offset:offset + ntotal]).astype("int64")
+            selector = None
+            if len(deleted_ids):
+                batch = faiss.IDSelectorBatch(len(deleted_ids), faiss.swig_ptr(deleted_ids))
+                selector = faiss.IDSelectorNot(batch)
+                selector.referenced_objects = [batch]
+            self._selectors[offset] = selector
+        return self._selectors[offset]
 
 
 class VectorDatabase:
     
-    def __init__(self, storage_path: str = "faiss_store"):
+    def __init__(
+        self,
+        storage_path: str = "faiss_store",
+        index_type: str = "auto",
+        ann_index_type: str = "ivf_flat",
+        ann_threshold: int = 100_000,
+        nlist: Optional[int] = None,
+        pq_m: int = 64,
+        hnsw_m: int = 32,
+        nprobe: int = 16,
+        ef_search: int = 64,
+        max_segments: int = 8,
+        max_deleted_fraction: float = 0.2,
+        max_delta_rows: int = 20_000,
+        mmap_index: bool = True,
+        rerank: int = 0,
+        binary_candidates: int = index_factory.BINARY_CANDIDATES,
+        exact_filter_rows: int = 4096,
+    ):
+        # index_type: "flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8", "pq",
+        # "binary", "binary_ivf", or "auto" (flat until ann_threshold vectors, then
+        # promoted to ann_index_type)
+        if index_type != "auto" and index_type not in index_factory.INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'")
+        if ann_index_type not in index_factory.INDEX_TYPES:
+            raise ValueError(f"Unknown ANN index type '{ann_index_type}'")
+        
         self.storage_path = storage_path
-        self.index = None
-        self.metadata = []
+        self.index_type = index_type
+        self.ann_index_type = ann_index_type
+        self.ann_threshold = ann_threshold
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.max_segments = max_segments
+        self.max_deleted_fraction = max_deleted_fraction
+        # New rows go to a brute-force delta until compaction folds them into the base
+        self.max_delta_rows = max_delta_rows
+        # Map checkpointed base indexes instead of reading them onto the heap, so
+        # startup doesn't scale with index size and processes share the pages
+        self.mmap_index = mmap_index
+        # With a lossy base (sq_*, pq, ivf_pq), score rerank * top_k candidates from
+        # the codes, then re-rank them exactly against the float vectors on disk (0 = off)
+        self.rerank = rerank
+        # Binary bases ("binary", "binary_ivf") always rescore this many Hamming
+        # candidates (or rerank * top_k, if larger) exactly
+        self.binary_candidates = binary_candidates
+        # A filter matching at most this many rows of an ANN/lossy base is scored
+        # exactly from the float vectors; larger ones widen nprobe/efSearch instead
+        self.exact_filter_rows = exact_filter_rows
+        self.index_stats = {}
+        # Readers only ever use self._snapshot; writers hold self._lock, update the
+        # writer-side state below and publish the next snapshot
+        self._snapshot = Snapshot()
+        self.metadata = SegmentedMetadataStore()
         os.makedirs(storage_path, exist_ok=True)
-        print(f"VectorDatabase initialized at: {storage_path}")
+        # Append-only persistence: save() writes rows added since the last save as a
+        # new segment; compaction merges segments and checkpoints the base index
+        self._store = SegmentStore(storage_path)
+        self._segments = []
+        self._pending_vectors = []
+        # Spare capacity past the published delta, which is a prefix of this buffer
+        self._delta_buffer = None
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        print(f"VectorDatabase initialized at: {storage_path} (index_type={index_type})")
+    
+    @property
+    def target_index_type(self) -> str:
+        return self.ann_index_type if self.index_type == "auto" else self.index_type
+    
+    def _nlist_for(self, n_vectors: int) -> int:
+        return self.nlist or index_factory.default_nlist(n_vectors)
+    
+    def _promotion_threshold(self, n_vectors: int) -> Optional[int]:
+        """Vector count at which the base index is rebuilt as the target ANN index."""
+        target = self.target_index_type
+        if target == "flat":
+            return None
+        train_size = index_factory.min_train_size(target, self._nlist_for(n_vectors))
+        if self.index_type == "auto":
+            return max(self.ann_threshold, train_size)
+        return train_size
+    
+    def _promotion_due(self, base: Optional[faiss.Index], n_vectors: int) -> bool:
+        threshold = self._promotion_threshold(n_vectors)
+        if threshold is None or n_vectors < threshold:
+            return False
+        return base is None or index_factory.index_type_of(base) != self.target_index_type
+    
+    def _build_base(self, base: Optional[faiss.Index], covered: int, segments: List[Segment]) -> Optional[faiss.Index]:
+        """Base index over every row of `segments`, extending `base` (which holds the first `covered`).
+        
+        `base` may belong to a published snapshot (and be memory-mapped), so it
+        is copied, never modified.
+        """
+        rows = sum(seg.rows for seg in segments)
+        if rows == 0:
+            return base
+        if self._promotion_due(base, rows):
+            return self._promote(segments, rows)
+        if base is None:
+            index, covered = faiss.IndexFlatL2(segments[0].vectors.shape[1]), 0
+        else:
+            index = index_factory.copy_index(base)
+        for vectors in _segment_vectors(segments, covered):
+            index_factory.add_batches(index, vectors)
+        index_factory.set_default_search_params(index, self.nprobe, self.ef_search)
+        return index
+    
+    def _promote(self, segments: List[Segment], rows: int) -> faiss.Index:
+        """Train the target ANN index on a sample of the raw segment vectors, then fill it.
+        
+        Only the training sample is loaded; the rows are added one segment at a time.
+        """
+        target = self.target_index_type
+        nlist = self._nlist_for(rows)
+        print(f"Promoting index ({rows} vectors) to {target} (nlist={nlist})...")
+        dim = segments[0].vectors.shape[1]
+        ann_index = index_factory.build_index(
+            target, dim, nlist=nlist, pq_m=self.pq_m, hnsw_m=self.hnsw_m
+        )
+        offsets = np.cumsum([0] + [seg.rows for seg in segments])
+        rng = np.random.default_rng(1234)
+        if not ann_index.is_trained:
+            sample = np.sort(rng.choice(rows, min(rows, index_factory.max_train_size(ann_index)), replace=False))
+            ann_index.train(_gather_rows(segments, offsets, sample))
+        for vectors in _segment_vectors(segments, 0):
+            index_factory.add_batches(ann_index, vectors)
+        index_factory.set_default_search_params(ann_index, self.nprobe, self.ef_search)
+        
+        # Measure the recall/latency trade-off against exact search
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(rows, min(100, rows), replace=False))
+        queries = _gather_rows(segments, offsets, sample) + rng.normal(0, 0.01, (len(sample), dim)).astype("float32")
+        self.index_stats = {
+            "promoted_at": rows,
+            "tradeoff": index_factory.measure_tradeoff(ann_index, [seg.vectors for seg in segments], queries),
+        }
+        print(f"Promoted to {target}: {self.index_stats['tradeoff']}")
+        return ann_index
     
     def add(self, embeddings: np.ndarray, metadata: List[Dict[str, Any]]):
         """Add vectors and their metadata to the database."""
-        if embeddings.shape[0] != len(metadata):
-            raise ValueError("Number of embeddings must match metadata entries")
+        self.replace_documents([], embeddings, metadata)
+    
+    def delete_document(self, document_id: str) -> int:
+        """Tombstone every row of a document; returns the number of rows deleted."""
+        return self.replace_documents([document_id])
+    
+    def replace_document(self, document_id: str, embeddings: np.ndarray, metadata: List[Dict[str, Any]]) -> int:
+        """Swap a document's vectors for new ones; returns the number of rows replaced."""
+        return self.replace_documents([document_id], embeddings, metadata)
+    
+    def replace_documents(
+        self,
+        document_ids: List[str],
+        embeddings: Optional[np.ndarray] = None,
+        metadata: Optional[List[Dict[str, Any]]] = None,
+    ) -> int:
+        """Tombstone `document_ids` and add new rows in one generation; returns rows deleted.
         
-        # Initialize index if needed
-        if self.index is None:
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
-            print(f"Created new FAISS index (dimension={dim})")
+        Searches see either the old documents or their replacements, never neither.
+        """
+        if embeddings is not None and embeddings.shape[0] != len(metadata):
+            raise ValueError("Number of embeddings must match metadata entries")
         
-        self.index.add(embeddings)
-        self.metadata.extend(metadata)
-        print(f"Added {embeddings.shape[0]} vectors to database")
+        with self._lock:
+            snapshot = self._snapshot
+            if embeddings is not None and snapshot.dim is not None and embeddings.shape[1] != snapshot.dim:
+                raise ValueError(f"Embeddings have {embeddings.shape[1]} dims, the store holds {snapshot.dim}")
+            rows = sorted({
+                row for document_id in document_ids
+                for row in snapshot.lookups.document_rows.get(document_id, [])
+            })
+            adding = embeddings is not None and len(metadata) > 0
+            if not rows and not adding:
+                return 0
+            
+            lookups = snapshot.lookups.copy()
+            deleted = snapshot.deleted
+            if rows:
+                deleted = deleted.copy()
+                deleted[rows] = True
+                lookups.forget_rows(rows, snapshot.metadata)
+            
+            delta = snapshot.delta
+            if adding:
+                embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+                if snapshot.dim is None:
+                    print(f"Created new FAISS index (dimension={embeddings.shape[1]})")
+                delta = self._append_delta(delta, embeddings)
+                self.metadata.extend(metadata)
+                self._pending_vectors.append(embeddings)
+                deleted = np.concatenate([deleted, np.zeros(len(metadata), dtype=bool)])
+                lookups.add_rows(snapshot.rows, metadata, deleted)
+            
+            self._snapshot = snapshot.next(
+                delta=delta, metadata=self.metadata.view(), deleted=deleted, lookups=lookups
+            )
+            if rows:
+                print(f"Deleted {len(rows)} vectors of {len(document_ids)} document(s)")
+            if adding:
+                print(f"Added {embeddings.shape[0]} vectors to database")
+            return len(rows)
     
-    # Similarity search
-    def search(self, query_embedding: np.ndarray, top_k: int = 4) -> List[Dict[str, Any]]:
-        if self.index is None or self.index.ntotal == 0:
-            print("Database is empty")
-            return []
+    def _append_delta(self, delta: Optional[np.ndarray], vectors: np.ndarray) -> np.ndarray:
+        """The delta with `vectors` appended, as a new prefix of the writer's buffer.
         
+        Published deltas are prefixes too, so writing past their end is invisible
+        to searches; the buffer doubles when full, keeping appends amortized O(rows added).
+        """
+        rows = len(delta) if delta is not None else 0
+        buffer = self._delta_buffer
+        if delta is None or delta.base is not buffer or len(buffer) < rows + len(vectors):
+            buffer = np.empty((max(2 * (rows + len(vectors)), 1024), vectors.shape[1]), dtype="float32")
+            if rows:
+                buffer[:rows] = delta
+            self._delta_buffer = buffer
+        buffer[rows:rows + len(vectors)] = vectors
+        return buffer[:rows + len(vectors)]
+    
+    # Similarity search; nprobe/ef_search/rerank override the defaults for this call
+    # filter: e.g. {"document_id": "doc_ab12", "crop": ["wheat", "rice"]}; only matching rows are scored
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 4,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        rerank: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
         if query_embedding.ndim == 1:
             query_embedding = query_embedding.reshape(1, -1)
+        return self.search_many(query_embedding[:1], top_k, nprobe, ef_search, filter, rerank)[0]
+    
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 4,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        rerank: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Search a (n_queries, dim) matrix in one FAISS call; one result list per query."""
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
         
-        distances, indices = self.index.search(
-            query_embedding, 
-            min(top_k, self.index.ntotal)
-        )
+        # Pin one generation; writes published meanwhile don't affect this search
+        snapshot = self._snapshot
+        if snapshot.rows == 0:
+            print("Database is empty")
+            return [[] for _ in range(query_embeddings.shape[0])]
+        
+        rows = None
+        if filter:
+            # Lookups only hold live rows, so the filter also excludes tombstones
+            rows = snapshot.lookups.filter_rows(filter)
+            if len(rows) == 0:
+                return [[] for _ in range(query_embeddings.shape[0])]
+        
+        queries = np.ascontiguousarray(query_embeddings, dtype="float32")
+        rerank = self.rerank if rerank is None else rerank
+        parts = []
+        for index, offset in snapshot.parts():
+            part_rows = None
+            if rows is not None:
+                part_end = offset + (len(index) if index is snapshot.delta else index.ntotal)
+                part_rows = rows[(rows >= offset) & (rows < part_end)] - offset
+                if len(part_rows) == 0:
+                    continue
+            if index is snapshot.delta:
+                parts.append(snapshot.search_delta(queries, top_k, part_rows))
+                continue
+            if index_factory.is_binary(index):
+                parts.append(self._search_binary(snapshot, queries, top_k, rerank, part_rows))
+                continue
+            part_nprobe, part_ef_search = nprobe, ef_search
+            if part_rows is not None:
+                if index is snapshot.base and not isinstance(index, faiss.IndexFlat):
+                    if len(part_rows) <= self.exact_filter_rows:
+                        parts.append(index_factory.exact_search(queries, part_rows + offset, snapshot.vectors, top_k))
+                        continue
+                    part_nprobe, part_ef_search = index_factory.filtered_search_params(
+                        index, nprobe, ef_search, len(part_rows) / index.ntotal
+                    )
+                selector = index_factory.rows_selector(part_rows, index.ntotal)
+                candidates = len(part_rows)
+            else:
+                selector = snapshot.tombstone_selector(offset, index.ntotal)
+                candidates = index.ntotal
+            exact = rerank > 0 and index is snapshot.base and index_factory.is_lossy(index)
+            distances, indices = index.search(
+                queries,
+                min(top_k * rerank if exact else top_k, candidates),
+                params=index_factory.search_params(index, part_nprobe, part_ef_search, selector)
+            )
+            indices = np.where(indices >= 0, indices + offset, -1)
+            if exact:
+                distances, indices = index_factory.exact_rerank(queries, indices, snapshot.vectors, top_k)
+            parts.append((distances, indices))
+        distances, indices = index_factory.merge_results(parts, top_k)
         
-        results = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx < len(self.metadata):
-                results.append({
-                    "distance": float(dist),
-                    "metadata": self.metadata[idx]
-                })
-        return results
+        all_results = []
+        for row_indices, row_distances in zip(indices, distances):
+            results = []
+            for idx, dist in zip(row_indices, row_distances):
+                if idx >= 0:
+                    results.append({
+                        "distance": float(dist),
+                        "metadata": snapshot.metadata[int(idx)]
+                    })
+            all_results.append(results)
+        return all_results
+    
+    def _search_binary(
+        self,
+        snapshot: Snapshot,
+        queries: np.ndarray,
+        top_k: int,
+        rerank: int,
+        rows: Optional[np.ndarray],
+    ) -> tuple:
+        """Hamming prefilter over the binary base, then exact rescoring from the float vectors.
+        
+        Binary indexes take no IDSelector, so tombstones and filters are applied
+        to over-fetched candidates; a filter matching few rows is scored exactly.
+        """
+        base = snapshot.base
+        wanted = max(self.binary_candidates, top_k * rerank)
+        if rows is not None and len(rows) <= wanted:
+            candidates = np.tile(rows, (len(queries), 1))
+        else:
+            if rows is not None:
+                allowed = np.zeros(base.ntotal, dtype=bool)
+                allowed[rows] = True
+            else:
+                allowed = ~snapshot.deleted[:base.ntotal]
+            # Over-fetch in proportion to the rows excluded, not by their count
+            fetch = wanted * base.ntotal // max(int(allowed.sum()), 1)
+            _, candidates = base.search(queries, min(fetch, base.ntotal))
+            live = (candidates >= 0) & allowed[np.maximum(candidates, 0)]
+            # Only the `wanted` best live candidates of each query are rescored
+            live &= np.cumsum(live, axis=1) <= wanted
+            candidates = np.where(live, candidates, -1)
+        return index_factory.exact_rerank(queries, candidates, snapshot.vectors, top_k)
     
     def save(self):
-        """Persist index and metadata to disk."""
-        if self.index is None:
-            print("No index to save")
+        """Persist vectors added since the last save as a new append-only segment."""
+        with self._lock:
+            if self._snapshot.dim is None:
+                print("No index to save")
+                return
+            
+            self._flush()
+            print(f"Database saved to {self.storage_path} ({len(self._segments)} segments)")
+            if self._compaction_due():
+                self.compact(background=True)
+    
+    def _compaction_due(self) -> bool:
+        snapshot = self._snapshot
+        return (
+            len(self._segments) > self.max_segments
+            or snapshot.delta_rows > self.max_delta_rows
+            or snapshot.deleted_count > self.max_deleted_fraction * snapshot.rows
+            or self._promotion_due(snapshot.base, snapshot.rows)
+        )
+    
+    def _flush(self):
+        """Write pending rows as a segment and publish it in a new manifest (lock held)."""
+        if self._store.manifest is None:
+            self._store.manifest = self._store.new_manifest(self._snapshot.dim)
+        manifest = self._store.manifest
+        
+        if self._pending_vectors:
+            name = self._store.allocate_name()
+            segment = self._store.write_segment(
+                name, np.vstack(self._pending_vectors), self.metadata.tail
+            )
+            self._segments.append(segment)
+            self.metadata.seal(segment.metadata)
+            self._pending_vectors = []
+            # Move readers off the in-memory tail onto the mapped segment
+            self._snapshot = self._snapshot.next(
+                metadata=self.metadata.view(), segments=self._segments
+            )
+        
+        self._store.commit(dict(
+            manifest,
+            segments=self._segment_entries(),
+            index_stats=self.index_stats,
+        ))
+    
+    def _segment_entries(self) -> List[Dict[str, Any]]:
+        deleted_mask = self._snapshot.deleted
+        entries, row = [], 0
+        for seg in self._segments:
+            deleted = np.flatnonzero(deleted_mask[row:row + seg.rows]).tolist()
+            entries.append({"name": seg.name, "rows": seg.rows, "deleted": deleted})
+            row += seg.rows
+        return entries
+    
+    def compact(self, background: bool = False):
+        """Merge the newest segments, fold the delta into the base index and checkpoint it.
+        
+        Merges are size-tiered (see _merge_run), so a row is rewritten O(log n)
+        times over the life of the store rather than on every compaction.
+        Tombstones are carried into the merged segment; deleted rows are only
+        reclaimed (_purge_deleted) once they exceed max_deleted_fraction.
+        """
+        if background:
+            if self._compaction_thread is None or not self._compaction_thread.is_alive():
+                self._compaction_thread = threading.Thread(
+                    target=self.compact, name="vector-db-compaction", daemon=True
+                )
+                self._compaction_thread.start()
             return
         
-        index_path = os.path.join(self.storage_path, "faiss.index")
-        meta_path = os.path.join(self.storage_path, "metadata.pkl")
+        with self._compaction_lock:
+            with self._lock:
+                if self._snapshot.dim is None:
+                    return
+                self._flush()
+                segments = list(self._segments)
+                if not segments:
+                    return
+                snapshot = self._snapshot
+                if snapshot.deleted_count > self.max_deleted_fraction * snapshot.rows:
+                    self._purge_deleted()
+                    return
+                first = _merge_run([seg.rows for seg in segments], self.max_segments)
+                run = segments[first:]
+                name = self._store.allocate_name()
+            
+            # The snapshot is immutable, so the slow work runs without the lock
+            print(f"Compacting {len(segments)} segments ({snapshot.rows} rows), merging {len(run)}...")
+            base = self._build_base(snapshot.base, snapshot.base_rows, segments)
+            if len(run) > 1:
+                merged = self._store.merge_segments(name, run)
+            else:
+                merged = run[0]
+            checkpoint = self._store.write_checkpoint(
+                name, index_factory.serialize_index(base), self._lookups_bytes(snapshot.lookups, snapshot.rows)
+            )
+            base = self._open_checkpoint(checkpoint, base)
+            
+            with self._lock:
+                current = self._snapshot
+                # Rows added while the base was being built stay in a (new) delta
+                delta = None
+                if current.rows > snapshot.rows:
+                    delta = self._append_delta(None, current.delta[snapshot.rows - current.base_rows:])
+                old_checkpoint = self._store.manifest.get("checkpoint")
+                self._segments = segments[:first] + [merged] + self._segments[len(segments):]
+                self.metadata.set_segments([seg.metadata for seg in self._segments])
+                self._snapshot = current.next(
+                    base=base, delta=delta, metadata=self.metadata.view(), segments=self._segments
+                )
+                # Other processes may still be loading the previous manifest, so the
+                # files it references are retired rather than deleted
+                self._store.commit(dict(
+                    self._store.manifest,
+                    segments=self._segment_entries(),
+                    checkpoint=dict(checkpoint, rows=snapshot.rows),
+                    index_stats=self.index_stats,
+                ), retired_segments=[seg.name for seg in run if seg is not merged], retired_checkpoint=old_checkpoint)
+            print(f"Compaction done: {len(self._segments)} segments, checkpoint at {snapshot.rows} rows")
+    
+    def _purge_deleted(self):
+        """Compaction that drops tombstoned rows from disk and from the index.
+        
+        Rows are renumbered, so unlike a plain merge this runs entirely under the
+        write lock (searches keep using the previous snapshot meanwhile). Trained
+        quantizers are kept; only the vectors are re-added.
+        """
+        snapshot = self._snapshot
+        segments = list(self._segments)
+        keep, row = [], 0
+        for seg in segments:
+            keep.append(~snapshot.deleted[row:row + seg.rows])
+            row += seg.rows
+        name = self._store.allocate_name()
+        print(f"Compacting {len(segments)} segments, dropping {snapshot.deleted_count} deleted rows...")
+        
+        merged = self._store.merge_segments(name, segments, keep)
+        template = None
+        if snapshot.base is not None:
+            template = index_factory.copy_index(snapshot.base)
+            template.reset()
+        base = self._build_base(template, 0, [merged])
+        self._segments = [merged]
+        self.metadata = SegmentedMetadataStore([merged.metadata])
+        view = self.metadata.view()
+        deleted = np.zeros(merged.rows, dtype=bool)
+        lookups = MetadataLookups()
+        lookups.add_rows(0, view.iter_rows(include_text=False), deleted)
+        if base is None:
+            # Everything was deleted and there is no trained index to keep
+            base = faiss.IndexFlatL2(merged.vectors.shape[1])
         
-        faiss.write_index(self.index, index_path)
-        with open(meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
-        print(f"Database saved to {self.storage_path}")
+        old_checkpoint = self._store.manifest.get("checkpoint")
+        checkpoint = self._store.write_checkpoint(
+            name, index_factory.serialize_index(base), self._lookups_bytes(lookups, merged.rows)
+        )
+        self._snapshot = snapshot.next(
+            base=self._open_checkpoint(checkpoint, base),
+            delta=None,
+            metadata=view,
+            deleted=deleted,
+            lookups=lookups,
+            segments=self._segments,
+        )
+        self._store.commit(dict(
+            self._store.manifest,
+            segments=self._segment_entries(),
+            checkpoint=dict(checkpoint, rows=merged.rows),
+            index_stats=self.index_stats,
+        ), retired_segments=[seg.name for seg in segments], retired_checkpoint=old_checkpoint)
+        print(f"Compaction done: {merged.rows} rows, {snapshot.deleted_count} deleted rows reclaimed")
+    
+    def wait_for_compaction(self):
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+    
+    def close(self):
+        """Finish a running compaction and release the store's writer lock.
+        
+        Unsaved rows are not written; call save() first. Writing again afterwards
+        re-acquires the lock, if no other process has taken it meanwhile.
+        """
+        self.wait_for_compaction()
+        with self._lock:
+            self._store.close()
+    
+    def _open_checkpoint(self, checkpoint: Dict[str, str], base: faiss.Index) -> faiss.Index:
+        """The checkpointed base as it should be served: re-mapped from disk in mmap mode."""
+        if not self.mmap_index:
+            return base
+        mapped = self._store.read_checkpoint_index(checkpoint, mmap=True)
+        index_factory.set_default_search_params(mapped, self.nprobe, self.ef_search)
+        return mapped
+    
+    @staticmethod
+    def _lookups_bytes(lookups: MetadataLookups, rows: int) -> bytes:
+        return pickle.dumps(dict(lookups.to_dict(), rows=rows))
     
     def load(self) -> bool:
+        with self._lock:
+            manifest = self._store.read_manifest()
+            if manifest is None:
+                return self._load_legacy()
+            
+            self._store.manifest = manifest
+            self._segments = [self._store.open_segment(seg["name"]) for seg in manifest["segments"]]
+            self.metadata = SegmentedMetadataStore([seg.metadata for seg in self._segments])
+            self._pending_vectors = []
+            view = self.metadata.view()
+            deleted = np.zeros(len(view), dtype=bool)
+            row = 0
+            for seg, entry in zip(self._segments, manifest["segments"]):
+                deleted[[row + i for i in entry.get("deleted", [])]] = True
+                row += seg.rows
+            self.index_stats = manifest.get("index_stats", {})
+            
+            checkpoint = manifest.get("checkpoint")
+            base, covered = None, 0
+            lookups = MetadataLookups()
+            if checkpoint:
+                base = self._store.read_checkpoint_index(checkpoint, mmap=self.mmap_index)
+                index_factory.set_default_search_params(base, self.nprobe, self.ef_search)
+                lookups = MetadataLookups.from_dict(pickle.loads(self._store.read_checkpoint_lookups(checkpoint)))
+                covered = checkpoint["rows"]
+            
+            # Deletes committed after the checkpoint was taken
+            lookups.forget_rows((int(row) for row in np.flatnonzero(deleted[:covered])), view)
+            
+            # Segments written after the checkpoint are replayed into the delta
+            delta = None
+            for vectors in _segment_vectors(self._segments, covered):
+                delta = self._append_delta(delta, np.ascontiguousarray(vectors, dtype="float32"))
+            lookups.add_rows(covered, view.iter_rows(start=covered, include_text=False), deleted)
+            
+            self._snapshot = Snapshot(
+                self._snapshot.generation + 1, base, delta, view, deleted, lookups, self._segments
+            )
+            print(f"Loaded database from {self.storage_path} ({len(view)} vectors, "
+                  f"{len(self._segments)} segments, {len(view) - covered} replayed)")
+            return True
+    
+    def _load_legacy(self) -> bool:
+        """Import a store written as faiss.index + metadata(.pkl) into the segment layout."""
         index_path = os.path.join(self.storage_path, "faiss.index")
-        meta_path = os.path.join(self.storage_path, "metadata.pkl")
+        meta_dir = os.path.join(self.storage_path, "metadata")
+        legacy_meta_path = os.path.join(self.storage_path, "metadata.pkl")
         
-        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+        if not os.path.exists(index_path):
             print("No existing database found")
             return False
         
-        self.index = faiss.read_index(index_path)
-        with open(meta_path, "rb") as f:
-            self.metadata = pickle.load(f)
-        print(f"Loaded database from {self.storage_path} ({self.index.ntotal} vectors)")
+        if MetadataStore.exists(meta_dir):
+            legacy = MetadataStore()
+            legacy.open(meta_dir)
+            metadata = list(legacy.iter_rows())
+        elif os.path.exists(legacy_meta_path):
+            with open(legacy_meta_path, "rb") as f:
+                metadata = pickle.load(f)
+        else:
+            print("No existing database found")
+            return False
+        
+        print("Converting legacy faiss.index/metadata store to append-only segments...")
+        legacy_index = faiss.read_index(index_path)
+        self.metadata = SegmentedMetadataStore()
+        self._snapshot = Snapshot(self._snapshot.generation + 1)
+        self.add(index_factory.reconstruct_all(legacy_index), metadata)
+        self.save()
         return True
     
+    @property
+    def deleted_count(self) -> int:
+        return self._snapshot.deleted_count
+    
+    @property
+    def dim(self) -> Optional[int]:
+        """Dimension of the stored vectors; None while the store is empty."""
+        return self._snapshot.dim
+    
     @property
     def size(self) -> int:
-        """Return vector size in database."""
-        return self.index.ntotal if self.index else 0
+        """Return vector size in database (live vectors only)."""
+        snapshot = self._snapshot
+        return snapshot.rows - snapshot.deleted_count
+    
+    def index_info(self) -> Dict[str, Any]:
+        """Describe the active index and its measured recall/latency trade-off."""
+        snapshot = self._snapshot
+        base = snapshot.base
+        size = snapshot.rows - snapshot.deleted_count
+        if base is not None:
+            index_type = index_factory.index_type_of(base)
+        else:
+            index_type = "flat" if snapshot.delta is not None else None
+        info = {
+            "index_type": index_type,
+            "configured_index_type": self.index_type,
+            "target_index_type": self.target_index_type,
+            "promotion_threshold": self._promotion_threshold(size),
+            "size": size,
+            "dim": snapshot.dim,
+            "mmap_index": self.mmap_index,
+        }
+        if base is not None:
+            info.update(index_factory.current_search_params(base))
+        checkpoint = (self._store.manifest or {}).get("checkpoint") or {}
+        info["generation"] = snapshot.generation
+        info["delta_vectors"] = snapshot.delta_rows
+        info["segments"] = len(self._segments)
+        info["deleted_vectors"] = snapshot.deleted_count
+        info["checkpoint_rows"] = checkpoint.get("rows", 0)
+        info.update(self.index_stats)
+        return info
     
     def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
         """Get all chunks for a specific document."""
+        snapshot = self._snapshot
         chunks = []
-        seen_chunk_ids = set()
-        
-        for i, meta in enumerate(self.metadata):
-            if meta.get("document_id") == document_id:
-                chunk_id = meta.get("chunk_id")
-                
-
-                if chunk_id not in seen_chunk_ids:
-                    chunks.append({
-                        "chunk_id": chunk_id,
-                        "chunk_index": meta.get("chunk_index"),
-                        "text": meta.get("text"),
-                        "source": meta.get("source"),
-                        "vector_index": i
-                    })
-                    seen_chunk_ids.add(chunk_id)
+        for i in snapshot.lookups.distinct_chunk_rows(document_id, snapshot.metadata):
+            meta = snapshot.metadata[i]
+            chunks.append({
+                "chunk_id": meta.get("chunk_id"),
+                "chunk_index": meta.get("chunk_index"),
+                "text": meta.get("text"),
+                "source": meta.get("source"),
+                "vector_index": i
+            })
         
         return sorted(chunks, key=lambda x: x["chunk_index"])
     
     def get_chunk_by_id(self, chunk_id: str) -> Dict[str, Any]:
-        for i, meta in enumerate(self.metadata):
-            if meta.get("chunk_id") == chunk_id:
-                return {
-                    "chunk_id": meta.get("chunk_id"),
-                    "document_id": meta.get("document_id"),
-                    "text": meta.get("text"),
-                    "source": meta.get("source"),
-                    "chunk_index": meta.get("chunk_index"),
-                    "total_chunks": meta.get("total_chunks"),
-                    "vector_index": i
-                }
-        return None
+        snapshot = self._snapshot
+        i = snapshot.lookups.chunk_rows.get(chunk_id)
+        if i is None:
+            return None
+        meta = snapshot.metadata[i]
+        return {
+            "chunk_id": meta.get("chunk_id"),
+            "document_id": meta.get("document_id"),
+            "text": meta.get("text"),
+            "source": meta.get("source"),
+            "chunk_index": meta.get("chunk_index"),
+            "total_chunks": meta.get("total_chunks"),
+            "tags": meta.get("tags", {}),
+            "vector_index": i
+        }
     
     def get_document_ids(self) -> List[str]:
-        doc_ids = set()
-        for meta in self.metadata:
-            if "document_id" in meta:
-                doc_ids.add(meta["document_id"])
-        return list(doc_ids)
+        return list(self._snapshot.lookups.document_rows)
     
     def get_document_info(self, document_id: str) -> Dict[str, Any]:
-        chunks = self.get_document_chunks(document_id)
-        if not chunks:
+        snapshot = self._snapshot
+        rows = snapshot.lookups.distinct_chunk_rows(document_id, snapshot.metadata)
+        if not rows:
             return None
         
-        # Get unique chunk IDs to avoid duplicates
-        unique_chunk_ids = list(set(chunk["chunk_id"] for chunk in chunks))
+        # Only the fixed-width columns are needed here, never the text
+        metas = sorted(
+            (snapshot.metadata.get(i, include_text=False) for i in rows),
+            key=lambda m: m.get("chunk_index", 0)
+        )
+        chunk_ids = [meta.get("chunk_id") for meta in metas]
         
         return {
             "document_id": document_id,
-            "source": chunks[0].get("source", "unknown"),
-            "total_chunks": len(unique_chunk_ids),
-            "chunk_ids": unique_chunk_ids
+            "source": metas[0].get("source", "unknown"),
+            "total_chunks": len(chunk_ids),
+            "chunk_ids": chunk_ids
         }
     
     def get_existing_sources(self) -> set:
         #Get  existing source files from metadata.
-        sources = set()
-        for meta in self.metadata:
-            if "source" in meta:
-                sources.add(meta["source"])
-        return sources
+        return set(self._snapshot.lookups.source_documents)
+    
+    def get_document_id_for_source(self, source: str) -> Optional[str]:
+        return self._snapshot.lookups.source_documents.get(source)
+
+
+def _gather_rows(segments: List[Segment], offsets: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Float vectors of sorted `rows`; `offsets` holds each segment's first row."""
+    segment_ids = np.searchsorted(offsets, rows, side="right") - 1
+    parts = []
+    for seg_id in np.unique(segment_ids):
+        local = rows[segment_ids == seg_id] - offsets[seg_id]
+        parts.append(segments[seg_id].vectors[local])
+    return np.concatenate(parts).astype("float32", copy=False)
+
+
+def _merge_run(rows: List[int], max_segments: int, factor: int = 2) -> int:
+    """Index of the first of the trailing segments that compaction should merge.
+    
+    The run grows leftwards while the next older segment is at most `factor`
+    times its size, keeping segment sizes geometric (the newest are smallest),
+    and further while the store would still hold more than `max_segments`.
+    """
+    first = len(rows) - 1
+    total = rows[first]
+    while first > 0 and (rows[first - 1] <= factor * total or first + 1 > max_segments):
+        first -= 1
+        total += rows[first]
+    return first
+
+
+def _segment_vectors(segments: List[Segment], start: int) -> Iterator[np.ndarray]:
+    """Memory-mapped vector slices covering rows `start`.. of `segments`."""
+    row = 0
+    for seg in segments:
+        if row + seg.rows > start:
+            yield seg.vectors[max(start - row, 0):]
+        row += seg.rows
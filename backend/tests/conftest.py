@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the package as `backend.src...`; put the repo root on the path so
+# pytest runs from the repo root and from backend/ alike
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,54 @@
+import os
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from backend.src import data_loaders
+from backend.src.data_loaders import ParsedTextCache, iter_loaded_files, load_all_documents, scan_files
+from backend.src.ingest import file_sha256
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_scan_files_walks_once_and_keeps_supported_files(tmp_path):
+    paths = [write(tmp_path / name, "x") for name in ("b.txt", "a/c.TXT", "a/deep/d.csv")]
+    write(tmp_path / "notes.md", "x")
+    write(tmp_path / "a" / "upload.pdf.upload", "x")
+    assert scan_files(str(tmp_path)) == sorted(os.path.realpath(path) for path in paths)
+
+
+def test_files_load_in_input_order_from_the_process_pool(tmp_path):
+    paths = [write(tmp_path / f"f{i}.txt", f"page {i}") for i in range(6)]
+    paths.insert(3, write(tmp_path / "broken.json", "{not json"))
+    results = list(iter_loaded_files(paths, workers=2))
+    assert [path for path, _, _ in results] == paths
+    assert [documents[0].page_content for path, documents, _ in results if path.endswith(".txt")] == [f"page {i}" for i in range(6)]
+    assert results[3][1] == [] and results[3][2]
+
+    documents = load_all_documents(str(tmp_path), workers=2)
+    assert sorted(doc.page_content for doc in documents) == [f"page {i}" for i in range(6)]
+
+
+def test_parse_cache_serves_unchanged_content_without_parsing(tmp_path, monkeypatch):
+    parsed = []
+    parse = data_loaders._parse_file
+    monkeypatch.setattr(data_loaders, "_parse_file", lambda path: parsed.append(path) or parse(path))
+    cache = ParsedTextCache(str(tmp_path / "cache"))
+    first = write(tmp_path / "docs" / "first.txt", "धान की रोपाई")
+    copy = write(tmp_path / "docs" / "copy.txt", "धान की रोपाई")
+
+    assert cache.load(first)[0].page_content == "धान की रोपाई"
+    # Same content under another path: served from the cache, under its own source
+    documents = cache.load(copy)
+    assert parsed == [first] and documents[0].metadata["source"] == copy
+
+    stat = os.stat(first)
+    cache.load(first, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(first)})
+    write(first, "गेहूँ की बुवाई")
+    assert cache.load(first)[0].page_content == "गेहूँ की बुवाई"
+    assert parsed == [first, first]
@@ -0,0 +1,18 @@
+import sys
+import numpy as np
+import pytest
+from backend.src.embedding_backends import cosine_parity, default_onnx_path, require_onnx
+
+
+def test_missing_onnx_packages_are_named_before_any_export(monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnx", None)
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="needs onnx and onnxruntime"):
+        require_onnx()
+
+
+def test_parity_is_the_cosine_between_matching_rows():
+    reference = np.array([[1.0, 0.0], [0.0, 2.0]], dtype="float32")
+    parity = cosine_parity(reference, np.array([[1.0, 0.0], [1.0, 1.0]], dtype="float32"))
+    assert parity["min_cosine"] == pytest.approx(np.sqrt(0.5)) and parity["mean_cosine"] == pytest.approx((1 + np.sqrt(0.5)) / 2)
+    assert default_onnx_path("thenlper/gte-large") == "models/thenlper__gte-large.onnx"
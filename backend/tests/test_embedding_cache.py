@@ -0,0 +1,26 @@
+import numpy as np
+from backend.src.embedding_cache import EmbeddingCache
+
+
+def vectors(n, start=0):
+    return np.arange(start * 4, (start + n) * 4, dtype="float32").reshape(n, 4)
+
+
+def test_least_recently_used_rows_are_evicted_at_the_cap(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=4)
+    cache.put_many("m", ["a", "b", "c"], vectors(3))
+    cache.put_many("m", ["a", "b"], vectors(2))          # already cached, not counted twice
+    assert len(cache) == 3 and cache.evictions == 0
+
+    cache.get_many("m", ["a", "c"])                        # "b" is now the oldest
+    cache.put_many("m", ["d", "e"], vectors(2, start=3))
+    assert len(cache) == 4 and cache.evictions == 1
+    found = cache.get_many("m", ["a", "b", "c", "d", "e"])
+    assert [row is not None for row in found] == [True, False, True, True, True]
+    assert np.array_equal(found[4], vectors(1, start=4)[0])
+    cache.close()
+
+    # The running count starts from what is on disk
+    reopened = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=4)
+    reopened.put_many("m", ["f"], vectors(1, start=5))
+    assert len(reopened) == 4 and reopened.evictions == 1
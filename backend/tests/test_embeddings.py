@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from backend.src import embeddings
+from backend.src.embedding_cache import EmbeddingCache
+from backend.src.embeddings import DocumentEmbedder, l2_normalize, token_budget_batches
+
+
+class FakeModel:
+    """Stands in for SentenceTransformer: one token per word, vector = (words, chars, 1, 0)."""
+
+    max_seq_length = 8
+
+    def __init__(self, model_name):
+        self.batches = []
+        self.pool_calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def tokenizer(self, texts, truncation=True, max_length=None):
+        return {"input_ids": [[0] * min(len(text.split()), max_length) for text in texts]}
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        self.batches.append(list(texts))
+        return np.array([[len(text.split()), len(text), 1, 0] for text in texts], dtype="float32")
+
+    def start_multi_process_pool(self, devices):
+        return {"devices": devices}
+
+    def encode_multi_process(self, texts, pool, batch_size=32, chunk_size=None):
+        self.pool_calls.append((len(texts), chunk_size))
+        return self.encode(texts)
+
+    @staticmethod
+    def stop_multi_process_pool(pool):
+        pool.clear()
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(embeddings, "SentenceTransformer", FakeModel)
+
+
+def expected(texts):
+    return np.array([[len(text.split()), len(text), 1, 0] for text in texts], dtype="float32")
+
+
+def test_token_budget_batches_group_similar_lengths():
+    batches = token_budget_batches([1, 10, 3, 10, 2], max_batch_tokens=20)
+    assert [batch.tolist() for batch in batches] == [[1, 3], [2, 4, 0]]
+
+
+def test_l2_normalize_works_in_place_and_keeps_zero_rows():
+    vectors = np.array([[3.0, 4.0], [0.0, 0.0]], dtype="float32")
+    assert l2_normalize(vectors) is vectors
+    assert np.allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_texts_are_length_bucketed_and_returned_in_input_order(fake_model):
+    embedder = DocumentEmbedder("fake", batch_size=2)      # budget: 2 * 8 padded tokens
+    texts = ["a b c d e f g h", "a", "a b c d e f g h i j", "a b", "a b c"]
+    result = embedder.encode_texts(texts)
+    assert result.dtype == np.float32 and result.flags.c_contiguous
+    assert np.array_equal(result, expected(texts))
+    assert embedder.model.batches == [[texts[0], texts[2]], [texts[4], texts[3], texts[1]]]
+
+
+def test_cached_and_repeated_texts_skip_the_model(fake_model, tmp_path):
+    embedder = DocumentEmbedder("fake", cache=EmbeddingCache(str(tmp_path / "cache.sqlite")))
+    embedder.encode_texts(["urea", "dap", "urea"])
+    assert embedder.model.batches == [["urea", "dap"]]
+    result = embedder.encode_texts(["dap", "potash", "urea"], normalize=True)
+    assert embedder.model.batches[1:] == [["potash"]]
+    assert np.allclose(result, l2_normalize(expected(["dap", "potash", "urea"])))
+
+
+def test_bulk_batches_go_to_the_worker_pool(fake_model):
+    embedder = DocumentEmbedder("fake", workers=2, pool_min_texts=4, batch_size=2)
+    texts = ["a b c", "a", "a b c d", "a b"]
+    assert np.array_equal(embedder.encode_texts(texts), expected(texts))
+    assert embedder.model.pool_calls == [(4, 2)]
+    assert np.array_equal(embedder.encode_texts(["small batch"]), expected(["small batch"]))
+    assert len(embedder.model.pool_calls) == 1
+    embedder.close()
+    assert embedder._pool is None
+
+
+def test_onnx_backend_cannot_be_combined_with_workers(fake_model):
+    with pytest.raises(ValueError, match="workers=0"):
+        DocumentEmbedder("fake", backend="onnx", workers=2)
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        DocumentEmbedder("fake", backend="tensorrt")
@@ -0,0 +1,60 @@
+import os
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from backend.src.folder_watcher import FolderWatcher
+from backend.src.ingest import IngestManifest
+
+
+class FakePipeline:
+    """Records what the watcher asks for and keeps the manifest the way RAGPipeline does."""
+
+    def __init__(self, path):
+        self.ingest_manifest = IngestManifest(path)
+        self.indexed = []
+        self.forgotten = []
+
+    def index_files(self, paths):
+        self.indexed.append(list(paths))
+        entries = {}
+        for path in paths:
+            stat = os.stat(path)
+            entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": "",
+                             "document_ids": [path], "chunk_ids": []}
+        self.ingest_manifest.update(entries)
+        return {"indexed_files": list(paths), "failed_files": {}, "chunks": len(paths)}
+
+    def forget_files(self, paths):
+        self.forgotten.append(list(paths))
+        self.ingest_manifest.forget(paths)
+
+
+def test_settled_changes_are_indexed_in_batches_and_deletions_forgotten(tmp_path):
+    watch_dir = tmp_path / "raw"
+    watch_dir.mkdir()
+    paths = []
+    for i in range(5):
+        path = watch_dir / f"advisory{i}.txt"
+        path.write_text(f"advisory {i}")
+        paths.append(os.path.realpath(path))
+    pipeline = FakePipeline(str(tmp_path / "ingest_manifest.json"))
+
+    watcher = FolderWatcher(pipeline, str(watch_dir), debounce=3600, batch_files=2)
+    watcher.poll()
+    # Still inside the debounce window: nothing is indexed yet
+    assert watcher.stats()["state"] == "waiting" and pipeline.indexed == []
+
+    watcher.debounce = 0
+    watcher.poll()
+    assert pipeline.indexed == [paths[0:2], paths[2:4], paths[4:5]]
+    assert watcher.stats()["files_indexed"] == 5 and watcher.stats()["state"] == "idle"
+    watcher.poll()
+    assert len(pipeline.indexed) == 3
+
+    os.remove(paths[1])
+    with open(paths[3], "a") as f:
+        f.write(" (revised)")
+    watcher.poll()
+    assert pipeline.forgotten == [[paths[1]]] and pipeline.indexed[3:] == [[paths[3]]]
+    assert watcher.stats()["files_removed"] == 1
@@ -0,0 +1,78 @@
+import os
+import threading
+import pytest
+from backend.src.ingest import IngestManifest, bounded_stage, chunk_windows
+
+
+def entry(i):
+    return {"size": i, "mtime_ns": i, "sha256": f"{i:064x}", "document_ids": [f"doc{i}"], "chunk_ids": []}
+
+
+def test_manifest_changes_survive_reopen_and_a_torn_append(tmp_path):
+    path = str(tmp_path / "ingest_manifest.json")
+    manifest = IngestManifest(path)
+    for i in range(3000):
+        manifest.update({f"/data/f{i}": entry(i)})
+        if i % 3 == 0:
+            manifest.forget([f"/data/f{i}"])
+    # The journal is folded into the JSON now and then, not on every change
+    assert os.path.exists(path) and os.path.getsize(manifest.journal_path) > 0
+
+    with open(manifest.journal_path, "a") as f:
+        f.write('{"set": {"/data/torn"')
+    reopened = IngestManifest(path)
+    assert reopened.files == manifest.files
+
+    reopened.update({"/data/after": entry(1)})
+    assert "/data/after" in IngestManifest(path).files
+
+
+class Chunk:
+    def __init__(self, document_id, i):
+        self.metadata = {"document_id": document_id, "chunk_id": f"{document_id}_chunk_{i:04d}"}
+
+
+class Chunker:
+    def chunk(self, documents):
+        return [Chunk(document_id, i) for document_id, n in documents for i in range(n)]
+
+
+def test_chunk_windows_complete_a_file_only_with_its_last_chunk():
+    loaded = [
+        ("/data/a.pdf", [("doc_a", 5)], None),
+        ("/data/bad.pdf", [], "EOF marker not found"),
+        ("/data/b.pdf", [("doc_b", 2)], None),
+    ]
+    windows = list(chunk_windows(Chunker(), loaded, window_chunks=3))
+    assert [len(window.chunks) for window in windows] == [3, 3, 1]
+    assert [window.new_document_ids for window in windows] == [["doc_a"], ["doc_b"], []]
+    assert [[path for path, _, _ in window.completed_files] for window in windows] == [[], ["/data/a.pdf"], ["/data/b.pdf"]]
+    assert windows[1].failed_files == [("/data/bad.pdf", "EOF marker not found")]
+    assert windows[1].completed_files[0][2] == [f"doc_a_chunk_{i:04d}" for i in range(5)]
+
+
+def test_bounded_stage_runs_ahead_by_at_most_maxsize():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    stage = bounded_stage(items(), maxsize=2)
+    assert next(stage) == 0
+    threading.Event().wait(0.2)
+    # One handed over, two queued and one blocked in put
+    assert len(produced) <= 4
+    assert list(stage) == list(range(1, 100))
+
+
+def test_bounded_stage_reraises_errors_in_the_consumer():
+    def items():
+        yield 1
+        raise OSError("disk gone")
+
+    stage = bounded_stage(items())
+    assert next(stage) == 1
+    with pytest.raises(OSError, match="disk gone"):
+        next(stage)
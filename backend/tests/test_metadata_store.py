@@ -0,0 +1,40 @@
+import numpy as np
+from backend.src.metadata_store import MetadataStore
+
+
+def rows(start, n):
+    return [
+        {"text": f"पाठ {i} " * (i % 3 + 1), "source": f"s{i // 4}", "document_id": f"doc{i // 4}",
+         "chunk_id": f"c{i}", "chunk_index": i % 4, "total_chunks": 4, "tags": {"crop": "rice"} if i % 2 else {}}
+        for i in range(start, start + n)
+    ]
+
+
+def test_rows_read_back_the_same_after_reopen(tmp_path):
+    store = MetadataStore()
+    store.extend(rows(0, 6))
+    store.write(str(tmp_path))
+    store.extend(rows(6, 4))      # a later save appends to the text blob
+    store.write(str(tmp_path))
+
+    reopened = MetadataStore()
+    reopened.open(str(tmp_path))
+    assert list(reopened) == rows(0, 10)
+    assert reopened.get(7, include_text=False) == {k: v for k, v in rows(7, 1)[0].items() if k != "text"}
+    assert isinstance(reopened._rows, np.memmap)
+
+
+def test_merge_drops_masked_rows_and_their_text(tmp_path):
+    first, second = MetadataStore(), MetadataStore()
+    first.extend(rows(0, 4))
+    first.write(str(tmp_path / "a"))
+    first.open(str(tmp_path / "a"))
+    second.extend(rows(4, 4))
+    second.write(str(tmp_path / "b"))
+    second.open(str(tmp_path / "b"))
+
+    keep = [np.array([True, False, True, True]), None]
+    merged = MetadataStore.merge([first, second], str(tmp_path / "merged"), keep)
+    expected = [row for i, row in enumerate(rows(0, 8)) if i != 1]
+    assert list(merged) == expected
+    assert len(merged._text) == sum(len(row["text"].encode("utf-8")) for row in expected)
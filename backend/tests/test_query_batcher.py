@@ -0,0 +1,51 @@
+import threading
+import time
+import numpy as np
+import pytest
+from backend.src.query_batcher import QueryBatcher
+
+
+def test_concurrent_queries_share_forward_passes():
+    batches = []
+    release = threading.Event()
+
+    def encode(texts):
+        batches.append(list(texts))
+        release.wait(5)        # hold the first batch so the others queue up behind it
+        return np.array([[float(len(text)), 0.0] for text in texts], dtype="float32")
+
+    batcher = QueryBatcher(encode, max_batch_size=8, max_wait_ms=1.0)
+    texts = [f"query {'x' * i}" for i in range(17)]
+    results = [None] * len(texts)
+
+    def ask(i):
+        results[i] = batcher.embed(texts[i])
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while not batches or batcher.stats()["queue_depth"] < len(texts) - len(batches[0]):
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert [vector[0] for vector in results] == [float(len(text)) for text in texts]
+    assert sorted(text for batch in batches for text in batch) == sorted(texts)
+    assert max(len(batch) for batch in batches) == 8 and len(batches) <= 4
+    assert batcher.stats()["queries"] == len(texts)
+
+
+def test_encoder_errors_reach_every_caller_of_the_batch():
+    def encode(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = QueryBatcher(encode)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.embed("urea dose for wheat")
+    with pytest.raises(ValueError):
+        batcher.embed("   ")
+    batcher.close()
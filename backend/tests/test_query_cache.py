@@ -0,0 +1,40 @@
+import numpy as np
+from backend.src.query_cache import QueryEmbeddingCache, normalize_query
+
+
+def fake_embed(calls):
+    def embed(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(text)), 1.0] for text in texts], dtype="float32")
+    return embed
+
+
+def test_normalize_query_folds_case_whitespace_and_trailing_punctuation():
+    assert normalize_query("Best  fertilizer for WHEAT?") == normalize_query("best fertilizer for wheat")
+    assert normalize_query("  what is urea!! ") == "what is urea"
+    assert normalize_query("???") == "???"
+
+
+def test_normalize_query_keeps_devanagari_marks_and_decimals():
+    query = "पानी कम होने पर धान की सिंचाई कब करें"
+    assert normalize_query(query) == query
+    assert normalize_query("pH 5.5 soil") == "ph 5.5 soil"
+
+
+def test_normalize_query_uses_one_unicode_form():
+    # Precomposed and decomposed spellings of the same text share a key
+    assert normalize_query("caf\u00e9") == normalize_query("cafe\u0301")
+    assert normalize_query("\u0958") == normalize_query("\u0915\u093c")
+
+
+def test_cache_embeds_original_text_and_shares_variants():
+    calls = []
+    cache = QueryEmbeddingCache()
+    query = "पानी कम होने पर धान की सिंचाई कब करें?"
+    first = cache.get_many([query, "pH 5.5 soil", "PH 5.5  soil."], fake_embed(calls))
+    assert calls == [[query, "pH 5.5 soil"]]
+    assert np.array_equal(first[1], first[2])
+
+    cache.get(query.rstrip("?"), fake_embed(calls))
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,145 @@
+import contextlib
+import hashlib
+import io
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("groq")
+
+from backend.src.rag_pipeline import RAGPipeline
+from backend.src.reduction import open_reducer
+from backend.src.text_chunker import TextChunker
+from backend.src.vector_db import VectorDatabase
+
+
+class FakeEmbedder:
+    """Normalized bag of fixed random word vectors: texts sharing words land close together."""
+
+    model_name = "fake"
+    dimension = 32
+
+    def __init__(self):
+        self.texts = []
+        self.queries = []
+
+    def _vectors(self, texts):
+        rows = []
+        for text in texts:
+            row = np.zeros(self.dimension, dtype="float32")
+            for word in text.lower().split():
+                seed = int.from_bytes(hashlib.md5(word.strip("?.,!").encode("utf-8")).digest()[:4], "little")
+                row += np.random.default_rng(seed).standard_normal(self.dimension).astype("float32")
+            rows.append(row / max(np.linalg.norm(row), 1e-6))
+        return np.array(rows, dtype="float32")
+
+    def encode_texts(self, texts):
+        self.texts.extend(texts)
+        return self._vectors(texts)
+
+    def encode_queries(self, texts):
+        self.queries.extend(texts)
+        return self._vectors(texts)
+
+
+def make_pipeline(storage, reduction=None):
+    db = VectorDatabase(str(storage), index_type="flat")
+    db.load()
+    embedder = FakeEmbedder()
+    reducer = open_reducer(str(storage), reduction, embedder.model_name, embedder.dimension, db.dim)
+    return RAGPipeline(TextChunker(chunk_size=200, chunk_overlap=0), embedder, db, None, reducer=reducer)
+
+
+def write(path, words, repeat=1):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join([words] * repeat))
+    return os.path.realpath(path)
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def sources(results):
+    return {os.path.basename(r["metadata"]["source"]) for r in results}
+
+
+def test_directory_reindex_only_touches_changed_files(tmp_path):
+    data = tmp_path / "raw"
+    data.mkdir()
+    write(data / "rice.txt", "rice paddy transplanting flooded nursery", 20)
+    write(data / "wheat.txt", "wheat sowing irrigation crown root", 20)
+    gone = write(data / "maize.txt", "maize fall armyworm scouting", 20)
+    pipeline = make_pipeline(tmp_path / "store")
+    assert pipeline.load_and_index_documents(str(data), workers=1) > 0
+    wheat_before = pipeline.vector_db.get_document_info(pipeline.chunker.generate_document_id(str(data / "wheat.txt")))
+
+    embedded = len(pipeline.embedder.texts)
+    assert pipeline.load_and_index_documents(str(data), workers=1) == 0
+    assert len(pipeline.embedder.texts) == embedded
+
+    write(data / "wheat.txt", "wheat rust fungicide spray", 5)
+    os.remove(gone)
+    pipeline.load_and_index_documents(str(data), workers=1)
+    wheat_after = pipeline.vector_db.get_document_info(wheat_before["document_id"])
+    assert wheat_after["total_chunks"] < wheat_before["total_chunks"]
+    assert sources(pipeline.retrieve("maize armyworm", top_k=50)) == {"rice.txt", "wheat.txt"}
+    assert sources(pipeline.retrieve("wheat rust", top_k=1)) == {"wheat.txt"}
+    assert gone not in pipeline.ingest_manifest.files
+
+    # A restarted pipeline sees the same store and manifest
+    reopened = make_pipeline(tmp_path / "store")
+    assert reopened.vector_db.size == pipeline.vector_db.size
+    assert reopened.load_and_index_documents(str(data), workers=1) == 0
+
+
+def test_deleted_document_stays_deleted(tmp_path):
+    data = tmp_path / "raw"
+    data.mkdir()
+    rice = write(data / "rice.txt", "rice paddy transplanting", 30)
+    write(data / "wheat.txt", "wheat sowing irrigation", 30)
+    pipeline = make_pipeline(tmp_path / "store")
+    pipeline.load_and_index_documents(str(data), workers=1)
+    document_id = pipeline.chunker.generate_document_id(rice)
+    chunks = pipeline.vector_db.get_document_info(document_id)["total_chunks"]
+
+    assert pipeline.delete_document(document_id) == chunks
+    assert pipeline.retrieve("rice paddy", top_k=5, filter={"document_id": document_id}) == []
+    assert pipeline.ingest_manifest.files[rice]["document_ids"] == []
+    # The file is unchanged, so a re-index does not bring the document back
+    assert pipeline.load_and_index_documents(str(data), workers=1) == 0
+    assert pipeline.vector_db.get_document_info(document_id) is None
+
+
+def test_index_files_skips_unchanged_files_and_tags_chunks(tmp_path):
+    rice = write(tmp_path / "rice.txt", "rice blast tricyclazole", 30)
+    pipeline = make_pipeline(tmp_path / "store")
+    result = pipeline.index_files([rice], tags={"crop": "rice"})
+    assert result["indexed_files"] == [rice] and result["chunks"] > 0 and result["held_chunks"] == 0
+    assert pipeline.index_files([rice])["skipped_files"] == [rice]
+
+    results = pipeline.retrieve_many(["Rice blast?", "rice  blast"], top_k=3, filter={"crop": "rice"})
+    assert [len(rows) for rows in results] == [3, 3]
+    # Both spellings normalize to one query embedding
+    assert pipeline.embedder.queries == ["Rice blast?"]
+    assert pipeline.retrieve("rice blast", top_k=3, filter={"crop": "wheat"}) == []
+
+
+def test_chunks_held_for_pca_are_searchable_until_it_trains(tmp_path):
+    pipeline = make_pipeline(tmp_path / "store", reduction="pca:8")
+    first = write(tmp_path / "rice.txt", "rice paddy transplanting", 10)
+    result = pipeline.index_files([first])
+    assert result["held_chunks"] == result["chunks"] > 0 and pipeline.vector_db.size == 0
+    assert sources(pipeline.retrieve("rice paddy", top_k=1)) == {"rice.txt"}
+    document_id = pipeline.chunker.generate_document_id(first)
+    assert pipeline.get_document_info(document_id)["held"]
+
+    more = [write(tmp_path / f"crop{i}.txt", f"crop{i} advisory note", 100) for i in range(3)]
+    result = pipeline.index_files(more)
+    assert result["held_chunks"] == 0 and pipeline.reducer.is_trained
+    assert pipeline.vector_db.size == pipeline.vector_db.get_document_info(document_id)["total_chunks"] + result["chunks"]
+    assert sources(pipeline.retrieve("crop1 advisory", top_k=1)) == {"crop1.txt"}
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from backend.src.reduction import EmbeddingReducer, open_reducer
+
+
+def rows(n, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    # Decaying spectrum, like real embeddings
+    return (rng.standard_normal((n, dim)) * np.linspace(3.0, 0.1, dim)).astype("float32")
+
+
+def meta(document_id, n):
+    return [{"document_id": document_id, "chunk_id": f"{document_id}_{i}"} for i in range(n)]
+
+
+def test_small_first_ingest_is_held_until_pca_can_train(tmp_path):
+    reducer = open_reducer(str(tmp_path), "pca:16", "model", 64, None)
+    reducer.hold(str(tmp_path), ["doc0"], rows(6), meta("doc0", 6))
+    assert not reducer.is_trained
+    assert not reducer.ready(final=True)      # 6 < min_train_size, nothing raised
+
+    # Held rows survive a restart
+    reopened = open_reducer(str(tmp_path), "pca:16", "model", 64, None)
+    assert reopened.pending_rows == 6
+
+    for i in range(1, 6):
+        reopened.hold(str(tmp_path), [f"doc{i}"], rows(6, seed=i), meta(f"doc{i}", 6))
+    assert reopened.ready(final=True) and not reopened.ready()
+    reduced, metadata = reopened.take_pending(str(tmp_path))
+    assert reduced.shape == (36, 16) and len(metadata) == 36
+    assert reopened.is_trained and reopened.pending_rows == 0
+
+    reopened.release_pending(str(tmp_path))
+    loaded = open_reducer(str(tmp_path), "pca:16", "model", 64, 16)
+    assert loaded.fingerprint() == reopened.fingerprint() and loaded.pending_rows == 0
+
+
+def test_replaced_documents_are_not_held_twice(tmp_path):
+    reducer = EmbeddingReducer("pca", 64, 16, "model")
+    reducer.hold(str(tmp_path), [], rows(5), meta("doc0", 5))
+    reducer.hold(str(tmp_path), ["doc0"], rows(3), meta("doc0", 3))
+    assert reducer.pending_rows == 3
+    assert reducer.drop_pending(str(tmp_path), ["doc0"]) == 3
+
+
+def test_pca_trains_on_rows_from_many_windows(tmp_path):
+    reducer = EmbeddingReducer("pca", 64, 16, "model")
+    for i in range(reducer.train_rows // 32):
+        assert not reducer.ready()
+        reducer.hold(str(tmp_path), [], rows(32, seed=i), meta(f"doc{i}", 32))
+    assert reducer.ready()
+
+
+def test_impossible_reduction_is_rejected_up_front(tmp_path):
+    with pytest.raises(ValueError):
+        open_reducer(str(tmp_path), "pca:64", "model", 64, None)
+    with pytest.raises(ValueError):
+        open_reducer(str(tmp_path), "truncate:128", "model", 64, None)
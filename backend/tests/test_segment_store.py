@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from backend.src.metadata_store import MetadataStore
+from backend.src.segment_store import SegmentStore
+
+
+def test_second_writer_is_refused(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    store.commit(store.new_manifest(4))
+
+    other = SegmentStore(str(tmp_path))
+    with pytest.raises(RuntimeError, match="another process"):
+        other.write_segment("seg_000001", np.zeros((2, 4), dtype="float32"), MetadataStore())
+    # Readers are unaffected
+    assert other.read_manifest()["generation"] == 1
+
+
+def test_close_hands_the_store_to_another_writer(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    store.commit(store.new_manifest(4))
+    store.close()
+
+    other = SegmentStore(str(tmp_path))
+    assert other.commit(other.manifest)["generation"] == 2
+    other.close()
+    # The first writer's view is stale now
+    with pytest.raises(RuntimeError, match="changed on disk"):
+        store.commit(store.manifest)
+
+
+def test_replaced_segments_outlive_the_manifest_that_drops_them(tmp_path):
+    store = SegmentStore(str(tmp_path), retire_grace_seconds=60)
+    manifest = store.new_manifest(4)
+    store.manifest = manifest
+    old = store.write_segment(store.allocate_name(), np.ones((2, 4), dtype="float32"), MetadataStore())
+    store.commit(dict(manifest, segments=[{"name": old.name, "rows": 2, "deleted": []}]))
+    new = store.write_segment(store.allocate_name(), np.ones((2, 4), dtype="float32"), MetadataStore())
+    store.commit(dict(store.manifest, segments=[{"name": new.name, "rows": 2, "deleted": []}]), retired_segments=[old.name])
+
+    # A reader still holding the previous manifest can open what it lists
+    assert store.open_segment(old.name).rows == 2
+    store.commit(store.manifest)
+    assert store.open_segment(old.name).rows == 2
+
+    store.retire_grace_seconds = 0
+    store.commit(store.manifest)
+    assert store.manifest["retired"] == []
+    with pytest.raises(FileNotFoundError):
+        store.open_segment(old.name)
@@ -0,0 +1,39 @@
+import contextlib
+import io
+import numpy as np
+from backend.src.sharded_vector_db import ShardedVectorDatabase, document_id_of_chunk, shard_of
+
+
+def test_document_id_is_read_back_from_chunker_chunk_ids():
+    assert document_id_of_chunk("doc_0123456789ab_chunk_0007") == "doc_0123456789ab"
+    assert document_id_of_chunk("my_chunk_file_chunk_0001") == "my_chunk_file"
+    assert document_id_of_chunk("c42") is None
+    assert document_id_of_chunk("doc_x_chunk_") is None
+
+
+def test_chunk_lookup_and_deletes_go_to_the_owning_shard(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    document_ids = [f"doc_{i:012x}" for i in range(20)]
+    metadata = [
+        {"text": f"t{d}{c}", "source": f"s{d}", "document_id": document_id, "chunk_id": f"{document_id}_chunk_{c:04d}"}
+        for d, document_id in enumerate(document_ids)
+        for c in range(5)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ShardedVectorDatabase(str(tmp_path), shards=4, index_type="flat")
+        db.add(rng.standard_normal((len(metadata), 16)).astype("float32"), metadata)
+        db.save()
+
+    owner = db.shards[shard_of(document_ids[3], 4)]
+    for shard in db.shards:
+        if shard is not owner:
+            monkeypatch.setattr(shard, "get_chunk_by_id", lambda chunk_id: 1 / 0)
+    assert db.get_chunk_by_id(f"{document_ids[3]}_chunk_0002")["document_id"] == document_ids[3]
+    assert db.get_chunk_by_id(f"{document_ids[3]}_chunk_0009") is None
+    monkeypatch.undo()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert db.replace_documents(document_ids[:5]) == 25
+    assert db.size == 75 and db.get_chunk_by_id(f"{document_ids[3]}_chunk_0002") is None
+    results = db.search(rng.standard_normal((1, 16)).astype("float32"), top_k=50, filter={"document_id": document_ids[3:8]})
+    assert sorted({r["metadata"]["document_id"] for r in results}) == document_ids[5:8]
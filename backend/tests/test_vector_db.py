@@ -0,0 +1,254 @@
+import contextlib
+import io
+import faiss
+import numpy as np
+import pytest
+from backend.src import index_factory
+from backend.src.vector_db import VectorDatabase, _merge_run
+
+
+def clustered(n, dim=32, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32") * 4
+    return (centers[rng.integers(0, clusters, n)] + rng.standard_normal((n, dim))).astype("float32")
+
+
+@pytest.fixture(scope="module")
+def ivf_db(tmp_path_factory):
+    vectors = clustered(30_000)
+    metadata = [
+        {"text": f"t{i}", "source": f"s{i % 1000}", "document_id": f"doc{i % 1000}", "chunk_id": f"c{i}"}
+        for i in range(len(vectors))
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path_factory.mktemp("ivf")), index_type="ivf_flat", nlist=256, nprobe=16)
+        db.add(vectors, metadata)
+        db.save()
+        db.wait_for_compaction()
+    assert isinstance(db._snapshot.base, faiss.IndexIVF)
+    return db, vectors
+
+
+@pytest.mark.parametrize("document_ids", [["doc7"], [f"doc{i}" for i in range(200)]])
+def test_ivf_filtered_search_returns_every_match_up_to_top_k(ivf_db, document_ids):
+    db, vectors = ivf_db
+    matching = 30 * len(document_ids)
+    queries = clustered(50, seed=1)
+    for top_k in (4, 50):
+        results = db.search_many(queries, top_k=top_k, filter={"document_id": document_ids})
+        assert [len(r) for r in results] == [min(top_k, matching)] * len(queries)
+        assert all(r["metadata"]["document_id"] in document_ids for rows in results for r in rows)
+
+
+def test_small_filter_is_scored_exactly(ivf_db):
+    db, vectors = ivf_db
+    rows = np.arange(7, len(vectors), 1000)
+    query = clustered(1, seed=2)
+    expected = np.argsort(((vectors[rows] - query) ** 2).sum(axis=1))[:4]
+    results = db.search(query, top_k=4, filter={"document_id": "doc7"})
+    assert [r["metadata"]["chunk_id"] for r in results] == [f"c{rows[i]}" for i in expected]
+
+
+def test_binary_search_rescores_a_bounded_candidate_set(tmp_path, monkeypatch):
+    vectors = clustered(20_000, dim=64)
+    metadata = [
+        {"text": f"t{i}", "source": "s", "document_id": f"doc{i // 10}", "chunk_id": f"c{i}"}
+        for i in range(len(vectors))
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="binary", max_deleted_fraction=1.0)
+        db.add(vectors, metadata)
+        db.save()
+        db.wait_for_compaction()
+        deleted = {f"doc{i}" for i in range(0, 2000, 7)}   # ~15% of the rows tombstoned
+        db.replace_documents(sorted(deleted))
+    assert index_factory.is_binary(db._snapshot.base)
+
+    scored = []
+    exact_rerank = index_factory.exact_rerank
+    def counting_rerank(queries, ids, fetch_vectors, k):
+        scored.append(int((ids >= 0).sum(axis=1).max()))
+        return exact_rerank(queries, ids, fetch_vectors, k)
+    monkeypatch.setattr(index_factory, "exact_rerank", counting_rerank)
+
+    results = db.search_many(clustered(5, dim=64, seed=3), top_k=4)
+    assert scored and max(scored) <= db.binary_candidates
+    assert [len(r) for r in results] == [4] * 5
+    assert not {r["metadata"]["document_id"] for rows in results for r in rows} & deleted
+
+
+def test_delta_appends_leave_published_snapshots_unchanged(tmp_path):
+    vectors = clustered(3_000, clusters=16)
+    metadata = [
+        {"text": f"t{i}", "source": f"s{i // 10}", "document_id": f"doc{i // 10}", "chunk_id": f"c{i}"}
+        for i in range(len(vectors))
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="flat")
+        for start in range(0, 2_000, 100):
+            db.add(vectors[start:start + 100], metadata[start:start + 100])
+        pinned = db._snapshot
+        db.delete_document("doc3")
+        db.add(vectors[2_000:], metadata[2_000:])
+    assert pinned.delta_rows == 2_000 and db._snapshot.delta_rows == 3_000
+    assert "doc3" in pinned.lookups.document_rows and "doc3" not in db._snapshot.lookups.document_rows
+    assert "doc250" not in pinned.lookups.document_rows
+
+    query = clustered(1, clusters=16, seed=3)
+    live = np.flatnonzero(~db._snapshot.deleted)
+    expected = live[np.argsort(((vectors[live] - query) ** 2).sum(axis=1))[:5]]
+    assert [r["metadata"]["chunk_id"] for r in db.search(query, top_k=5)] == [f"c{i}" for i in expected]
+    results = db.search(query, top_k=5, filter={"document_id": ["doc3", "doc250"]})
+    assert {r["metadata"]["document_id"] for r in results} == {"doc250"}
+
+
+def test_compaction_merges_are_size_tiered():
+    assert _merge_run([1000, 100, 100], max_segments=8) == 1
+    assert _merge_run([1000, 300, 100], max_segments=8) == 2
+    assert _merge_run([1000, 300, 100], max_segments=2) == 1
+    assert _merge_run([500], max_segments=8) == 0
+
+
+def test_compaction_carries_tombstones_until_the_purge_threshold(tmp_path):
+    vectors = clustered(1_000, clusters=16)
+    metadata = [
+        {"text": f"t{i}", "source": f"s{i // 10}", "document_id": f"doc{i // 10}", "chunk_id": f"c{i}"}
+        for i in range(len(vectors))
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="flat", max_deleted_fraction=0.2)
+        for start in range(0, 1_000, 250):
+            db.add(vectors[start:start + 250], metadata[start:start + 250])
+            db.save()
+            db.wait_for_compaction()
+        db.replace_documents(["doc3", "doc42"])
+        db.compact()
+    # A few deletes are not worth rewriting every segment for
+    assert db.deleted_count == 20 and db._snapshot.rows == 1_000
+    with contextlib.redirect_stdout(io.StringIO()):
+        reopened = VectorDatabase(str(tmp_path), index_type="flat")
+        reopened.load()
+    assert reopened.deleted_count == 20 and reopened.size == 980
+    results = reopened.search(vectors[35:36], top_k=10, filter={"document_id": ["doc3", "doc4"]})
+    assert {r["metadata"]["document_id"] for r in results} == {"doc4"}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.replace_documents([f"doc{i}" for i in range(50, 75)])
+        db.compact()
+    assert db.deleted_count == 0 and db._snapshot.rows == 730 and len(db._segments) == 1
+
+
+def test_measuring_the_tradeoff_leaves_binary_nprobe_as_served():
+    vectors = clustered(4_000, dim=64)
+    index = index_factory.build_index("binary_ivf", 64, nlist=64)
+    index_factory.train_and_fill(index, vectors)
+    index_factory.set_default_search_params(index, nprobe=8, ef_search=64)
+    tradeoff = index_factory.measure_tradeoff(index, vectors, clustered(20, dim=64, seed=4))
+    assert [entry["nprobe"] for entry in tradeoff] == [1, 4, 16, 64]
+    assert index.binary.nprobe == 8
+
+
+def chunks_of(n, per_document=10, tags=None):
+    return [
+        {"text": f"t{i}", "source": f"s{i // per_document}", "document_id": f"doc{i // per_document}",
+         "chunk_id": f"c{i}", "chunk_index": i % per_document, "total_chunks": per_document,
+         "tags": tags(i) if tags else {}}
+        for i in range(n)
+    ]
+
+
+def test_auto_index_is_promoted_once_large_enough(tmp_path):
+    vectors = clustered(3_000, clusters=32)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="auto", ann_threshold=2_000, nlist=32, nprobe=8)
+        db.add(vectors[:1_000], chunks_of(1_000))
+        db.save()
+        db.wait_for_compaction()
+        assert db.index_info()["index_type"] == "flat"
+        db.add(vectors[1_000:], chunks_of(3_000)[1_000:])
+        db.save()
+        db.wait_for_compaction()
+    info = db.index_info()
+    assert info["index_type"] == "ivf_flat" and info["promoted_at"] == 3_000 and info["tradeoff"]
+    results = db.search_many(vectors[[5, 2_500]], top_k=1)
+    assert [r[0]["metadata"]["chunk_id"] for r in results] == ["c5", "c2500"]
+
+
+def test_lookups_follow_adds_replacements_and_deletes(tmp_path):
+    vectors = clustered(100, clusters=8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="flat")
+        db.add(vectors[:50], chunks_of(50))
+        assert db.get_document_info("doc2")["total_chunks"] == 10
+        assert [c["chunk_id"] for c in db.get_document_chunks("doc2")] == [f"c{i}" for i in range(20, 30)]
+
+        replacement = chunks_of(3)
+        for meta in replacement:
+            meta.update(document_id="doc2", source="s2", chunk_id=f"new{meta['chunk_index']}")
+        assert db.replace_document("doc2", vectors[50:53], replacement) == 10
+        assert db.delete_document("doc4") == 10
+    assert db.get_document_info("doc2")["chunk_ids"] == ["new0", "new1", "new2"]
+    assert db.get_chunk_by_id("c25") is None and db.get_chunk_by_id("new1")["document_id"] == "doc2"
+    assert db.get_document_info("doc4") is None and "doc4" not in db.get_document_ids()
+    assert db.get_existing_sources() == {"s0", "s1", "s2", "s3"} and db.size == 33
+    assert {r["metadata"]["document_id"] for r in db.search(vectors[45:46], top_k=33)} == {"doc0", "doc1", "doc2", "doc3"}
+
+
+def test_tag_filters_are_pushed_into_the_search(tmp_path):
+    vectors = clustered(2_000, clusters=16)
+    crops = ["wheat", "rice", "maize"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="flat")
+        db.add(vectors, chunks_of(2_000, tags=lambda i: {"crop": crops[i % 3], "region": "terai"}))
+    query = clustered(1, clusters=16, seed=5)
+    results = db.search(query, top_k=20, filter={"crop": "rice", "region": "terai"})
+    assert len(results) == 20 and {r["metadata"]["tags"]["crop"] for r in results} == {"rice"}
+    rice = np.arange(1, 2_000, 3)
+    expected = rice[np.argsort(((vectors[rice] - query) ** 2).sum(axis=1))[:20]]
+    assert [r["metadata"]["chunk_id"] for r in results] == [f"c{i}" for i in expected]
+    assert db.search(query, top_k=5, filter={"crop": "barley"}) == []
+
+
+def test_batched_search_matches_one_query_at_a_time(ivf_db):
+    db, vectors = ivf_db
+    queries = clustered(16, seed=6)
+    batched = db.search_many(queries, top_k=5)
+    assert batched == [db.search(query[None, :], top_k=5) for query in queries]
+
+
+def test_reloaded_store_serves_the_same_results(tmp_path):
+    vectors = clustered(5_000, clusters=64)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type="ivf_flat", nlist=32, nprobe=32)
+        db.add(vectors[:4_000], chunks_of(4_000))
+        db.save()
+        db.wait_for_compaction()
+        db.add(vectors[4_000:], chunks_of(5_000)[4_000:])     # stays in a segment past the checkpoint
+        db.replace_documents(["doc7", "doc450"])
+        db.save()
+        db.wait_for_compaction()
+        db.close()
+        reopened = VectorDatabase(str(tmp_path), index_type="ivf_flat", nlist=32, nprobe=32, mmap_index=True)
+        reopened.load()
+    queries = clustered(10, clusters=64, seed=7)
+    assert reopened.size == db.size == 4_980
+    assert sorted(reopened.get_document_ids()) == sorted(db.get_document_ids())
+    assert reopened.search_many(queries, top_k=10) == db.search_many(queries, top_k=10)
+    assert reopened.get_document_info("doc7") is None and reopened.get_chunk_by_id("c4601")["document_id"] == "doc460"
+
+
+@pytest.mark.parametrize("index_type", ["sq_fp16", "sq_int8", "pq"])
+def test_quantized_index_with_rerank_keeps_the_exact_neighbours(tmp_path, index_type):
+    # Enough rows to train 256-centroid PQ codebooks
+    vectors = clustered(10_000, clusters=64)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = VectorDatabase(str(tmp_path), index_type=index_type, pq_m=16, rerank=10)
+        db.add(vectors, chunks_of(10_000))
+        db.save()
+        db.wait_for_compaction()
+    assert index_factory.is_lossy(db._snapshot.base)
+    queries = clustered(20, clusters=64, seed=8)
+    exact = np.argsort(((vectors[None, :, :] - queries[:, None, :]) ** 2).sum(axis=2), axis=1)[:, :5]
+    found = [[int(r["metadata"]["chunk_id"][1:]) for r in rows] for rows in db.search_many(queries, top_k=5)]
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, exact.tolist()))
+    assert hits >= 0.95 * exact.size